@@ -0,0 +1,91 @@
+from abc import ABC, abstractmethod
+
+MODEL_NAME = 'gemini-1.5-flash'
+
+
+class GeminiBackend(ABC):
+    """Giao diện backend cho GeminiClient, tương thích với google.generativeai.GenerativeModel
+
+    generate_content(contents, stream=False) trả về đối tượng có .text và .usage_metadata;
+    khi stream=True trả về iterable các đoạn có .text. generate_content_async là bản bất đồng bộ.
+    Backend thiếu phương thức nào sẽ báo lỗi ngay khi khởi tạo.
+    """
+
+    model_name = ''
+
+    @abstractmethod
+    def generate_content(self, contents, stream=False):
+        """Gọi model, trả về phản hồi (hoặc các đoạn phản hồi khi stream=True)"""
+
+    @abstractmethod
+    async def generate_content_async(self, contents):
+        """Bản bất đồng bộ của generate_content (không streaming)"""
+
+
+class _GeminiResponse:
+    """Phản hồi của GenerativeService thu gọn về giao diện .text / .usage_metadata"""
+
+    def __init__(self, response):
+        self.usage_metadata = response.usage_metadata
+        self.text = ''.join(
+            part.text for candidate in response.candidates[:1] for part in candidate.content.parts
+        )
+
+
+class _GeminiStream:
+    """Các đoạn phản hồi streaming; usage_metadata lấy từ đoạn cuối cùng có số liệu token"""
+
+    def __init__(self, responses):
+        self._responses = responses
+        self.usage_metadata = None
+
+    def __iter__(self):
+        for response in self._responses:
+            chunk = _GeminiResponse(response)
+            if chunk.usage_metadata is not None:
+                self.usage_metadata = chunk.usage_metadata
+            yield chunk
+
+
+class GoogleGeminiBackend(GeminiBackend):
+    """Backend thật, gọi GenerativeService của Google AI Studio qua API công khai của google-ai-generativelanguage
+
+    Mỗi backend có client riêng mang API key của mình (không dùng genai.configure đặt key cho cả tiến trình,
+    các phiên dùng key khác nhau sẽ ghi đè lẫn nhau).
+    """
+
+    def __init__(self, api_key, model_name=MODEL_NAME):
+        # Chỉ nạp SDK khi thật sự dùng Gemini (CI và benchmark dùng backend giả)
+        from google.ai import generativelanguage_v1beta as glm
+        from google.api_core.client_options import ClientOptions
+
+        self._glm = glm
+        self._options = ClientOptions(api_key=api_key)
+        self._client = glm.GenerativeServiceClient(client_options=self._options)
+        # Client bất đồng bộ tạo ở lần gọi đầu tiên, bên trong event loop sẽ chạy nó
+        self._async_client = None
+        self.model_name = model_name
+
+    def _request(self, contents):
+        """Chuỗi prompt hoặc danh sách lượt chat {'role', 'parts'} -> GenerateContentRequest"""
+        glm = self._glm
+        if isinstance(contents, str):
+            contents = [{'role': 'user', 'parts': [contents]}]
+        return glm.GenerateContentRequest(
+            model=f"models/{self.model_name}",
+            contents=[
+                glm.Content(role=item['role'], parts=[glm.Part(text=str(part)) for part in item['parts']])
+                for item in contents
+            ]
+        )
+
+    def generate_content(self, contents, stream=False):
+        request = self._request(contents)
+        if stream:
+            return _GeminiStream(self._client.stream_generate_content(request))
+        return _GeminiResponse(self._client.generate_content(request))
+
+    async def generate_content_async(self, contents):
+        if self._async_client is None:
+            self._async_client = self._glm.GenerativeServiceAsyncClient(client_options=self._options)
+        return _GeminiResponse(await self._async_client.generate_content(self._request(contents)))
@@ -0,0 +1,377 @@
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from src.ai.gemini_client import GeminiClient
+from src.logic.case_store import DEFAULT_DB_PATH
+from src.logic.prescreen import format_findings
+
+# Trạng thái đợt thẩm định và từng hồ sơ trong đợt
+JOB_PENDING = 'cho'
+JOB_RUNNING = 'dang_chay'
+JOB_PAUSED = 'tam_dung'
+JOB_DONE = 'hoan_thanh'
+ITEM_PENDING = 'cho'
+ITEM_DONE = 'xong'
+ITEM_FAILED = 'loi'
+
+ERROR_PREFIXES = ("Lỗi khi", "API key chưa")
+DATA_SOURCE = "hồ sơ đã lưu (thẩm định hàng loạt)"
+
+
+class BatchAppraisalQueue:
+    """Hàng đợi thẩm định AI hàng loạt cho danh mục hồ sơ đã lưu
+
+    Mỗi đợt chạy trên một luồng nền, gọi Gemini bằng nhóm luồng có giới hạn số yêu cầu đồng thời
+    (giới hạn tốc độ do tầng kết nối dùng chung đảm nhận). Kết quả được ghi định kỳ vào SQLite nên
+    khi tiến trình dừng đột ngột có thể chạy tiếp từ các hồ sơ chưa xong. Nếu có bộ sàng lọc,
+    hồ sơ đã rõ kết luận theo quy tắc không cần gọi Gemini.
+    """
+
+    def __init__(self, store, response_cache=None, transport=None, calculator=None, prescreen=None,
+                 db_path=DEFAULT_DB_PATH, max_workers=4, checkpoint_every=20, checkpoint_interval=5.0):
+        self.store = store
+        self.response_cache = response_cache
+        # Đợt hàng loạt dùng chung quota với chat nhưng không được lấy phần dành riêng cho người dùng tương tác
+        self.transport = transport.background() if transport is not None else None
+        self.calculator = calculator
+        self.prescreen = prescreen
+        self.max_workers = max_workers
+        self.checkpoint_every = checkpoint_every
+        self.checkpoint_interval = checkpoint_interval
+        if db_path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS batch_jobs (
+                job_id TEXT PRIMARY KEY,
+                ten TEXT NOT NULL DEFAULT '',
+                chi_nhanh TEXT NOT NULL DEFAULT '',
+                trang_thai TEXT NOT NULL,
+                tong INTEGER NOT NULL DEFAULT 0,
+                xong INTEGER NOT NULL DEFAULT 0,
+                loi INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                finished_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS batch_items (
+                job_id TEXT NOT NULL,
+                case_id TEXT NOT NULL,
+                trang_thai TEXT NOT NULL,
+                ho_ten TEXT NOT NULL DEFAULT '',
+                ket_qua TEXT,
+                ket_luan TEXT,
+                loi TEXT,
+                tu_cache INTEGER NOT NULL DEFAULT 0,
+                thoi_gian REAL,
+                updated_at REAL,
+                PRIMARY KEY (job_id, case_id)
+            );
+            CREATE INDEX IF NOT EXISTS idx_batch_items_status ON batch_items (job_id, trang_thai);
+        """)
+        # CSDL tạo trước khi có cột kết luận sàng lọc
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(batch_items)")}
+        if 'ket_luan' not in columns:
+            self._conn.execute("ALTER TABLE batch_items ADD COLUMN ket_luan TEXT")
+        # Đợt đang chạy khi tiến trình trước dừng đột ngột: chuyển sang tạm dừng để chạy tiếp
+        self._conn.execute(
+            "UPDATE batch_jobs SET trang_thai = ? WHERE trang_thai = ?", (JOB_PAUSED, JOB_RUNNING)
+        )
+        self._conn.commit()
+        self._threads = {}
+        self._stop_events = {}
+        self._start_lock = threading.Lock()
+
+    def submit(self, case_ids=None, chi_nhanh=None, ten=''):
+        """Tạo đợt thẩm định cho danh sách hồ sơ (hoặc mọi hồ sơ của chi nhánh), trả về mã đợt"""
+        job_id = uuid.uuid4().hex[:12]
+        now = time.time()
+        ids = case_ids if case_ids is not None else self.store.iter_case_ids(chi_nhanh=chi_nhanh)
+        total = 0
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO batch_jobs (job_id, ten, chi_nhanh, trang_thai, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, ten or '', chi_nhanh or '', JOB_PENDING, now, now)
+            )
+            batch = []
+            for case_id in ids:
+                batch.append((job_id, case_id, ITEM_PENDING))
+                if len(batch) >= 1000:
+                    total += self._insert_items(batch)
+                    batch = []
+            total += self._insert_items(batch)
+            self._conn.execute("UPDATE batch_jobs SET tong = ? WHERE job_id = ?", (total, job_id))
+            self._conn.commit()
+        return job_id
+
+    def _insert_items(self, batch):
+        before = self._conn.total_changes
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO batch_items (job_id, case_id, trang_thai) VALUES (?, ?, ?)", batch
+        )
+        return self._conn.total_changes - before
+
+    def start(self, job_id, backend, use_cache=True):
+        """Chạy (hoặc chạy tiếp) một đợt trên luồng nền với backend Gemini đã cấu hình"""
+        # Kiểm tra và khởi động trong cùng một khóa: bấm hai lần liên tiếp không tạo hai luồng
+        with self._start_lock:
+            if self.is_running(job_id):
+                return False
+            stop_event = threading.Event()
+            self._set_job_status(job_id, JOB_RUNNING)
+            thread = threading.Thread(
+                target=self._run, args=(job_id, backend, use_cache, stop_event),
+                name=f"batch-{job_id}", daemon=True
+            )
+            self._stop_events[job_id] = stop_event
+            self._threads[job_id] = thread
+            thread.start()
+        return True
+
+    def pause(self, job_id):
+        """Dừng sau khi các yêu cầu đang gửi hoàn tất; có thể chạy tiếp bằng start"""
+        event = self._stop_events.get(job_id)
+        if event is not None:
+            event.set()
+
+    def is_running(self, job_id):
+        thread = self._threads.get(job_id)
+        return thread is not None and thread.is_alive()
+
+    def is_busy(self):
+        """Có đợt đang chạy trên luồng nền"""
+        return any(thread.is_alive() for thread in list(self._threads.values()))
+
+    def close(self, timeout=5.0):
+        """Dừng các đợt đang chạy (chạy tiếp được sau này) rồi đóng kết nối SQLite"""
+        for event in self._stop_events.values():
+            event.set()
+        for thread in self._threads.values():
+            thread.join(timeout)
+        with self._lock:
+            self._conn.close()
+
+    def retry_failed(self, job_id):
+        """Đưa các hồ sơ bị lỗi về hàng đợi để chạy lại"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE batch_items SET trang_thai = ?, loi = NULL WHERE job_id = ? AND trang_thai = ?",
+                (ITEM_PENDING, job_id, ITEM_FAILED)
+            )
+            self._refresh_counts(job_id)
+            self._conn.commit()
+
+    def delete_job(self, job_id):
+        """Xóa một đợt và kết quả của nó"""
+        self.pause(job_id)
+        with self._lock:
+            self._conn.execute("DELETE FROM batch_items WHERE job_id = ?", (job_id,))
+            self._conn.execute("DELETE FROM batch_jobs WHERE job_id = ?", (job_id,))
+            self._conn.commit()
+
+    def _run(self, job_id, backend, use_cache, stop_event):
+        local = threading.local()
+
+        def analyze(case):
+            start = time.perf_counter()
+            data = self._analysis_data(case)
+            screening = None
+            if self.prescreen is not None:
+                screening = self.prescreen.evaluate(
+                    data.get('metrics'), data['financial'], data['collateral'], data['customer']
+                )
+                if not self.prescreen.needs_ai(screening):
+                    return format_findings(screening), False, time.perf_counter() - start, screening['ket_luan']
+            # Mỗi luồng một client (số liệu token/độ trễ riêng), dùng chung cache và tầng kết nối
+            if not hasattr(local, 'client'):
+                local.client = GeminiClient(response_cache=self.response_cache, transport=self.transport)
+                local.client.set_backend(backend)
+            self._wait_for_circuit(stop_event)
+            text = local.client.analyze_financial_data(
+                data, DATA_SOURCE, use_cache, extra=format_findings(screening) if screening else None
+            )
+            verdict = screening['ket_luan'] if screening else None
+            return text, local.client.last_from_cache, time.perf_counter() - start, verdict
+
+        pending_results = []
+        last_checkpoint = time.monotonic()
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                in_flight = {}
+                cases = self._iter_pending_cases(job_id)
+                exhausted = False
+                while True:
+                    # Giữ tối đa 2 x số luồng yêu cầu trong hàng đợi để không nạp cả danh mục vào bộ nhớ
+                    while not exhausted and not stop_event.is_set() and len(in_flight) < self.max_workers * 2:
+                        case = next(cases, None)
+                        if case is None:
+                            exhausted = True
+                            break
+                        in_flight[executor.submit(analyze, case)] = case
+                    if not in_flight:
+                        break
+                    done, _ = wait(in_flight, timeout=1.0, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        case = in_flight.pop(future)
+                        pending_results.append(self._item_result(case, future))
+                    if len(pending_results) >= self.checkpoint_every or (
+                        pending_results and time.monotonic() - last_checkpoint >= self.checkpoint_interval
+                    ):
+                        self._checkpoint(job_id, pending_results)
+                        pending_results = []
+                        last_checkpoint = time.monotonic()
+        except Exception as e:
+            print(f"Lỗi khi chạy đợt thẩm định {job_id}: {e}")
+        finally:
+            self._checkpoint(job_id, pending_results)
+            finished = not stop_event.is_set() and self.count_results(job_id, ITEM_PENDING) == 0
+            self._set_job_status(job_id, JOB_DONE if finished else JOB_PAUSED, finished)
+
+    def _wait_for_circuit(self, stop_event):
+        """Chờ khi bộ ngắt mạch đang mở thay vì đánh dấu lỗi hàng loạt hồ sơ"""
+        breaker = getattr(self.transport, 'breaker', None)
+        while breaker is not None and breaker.state == breaker.OPEN and not stop_event.is_set():
+            stop_event.wait(min(5.0, max(0.5, breaker.retry_after())))
+
+    def _iter_pending_cases(self, job_id, batch_size=200):
+        """Duyệt các hồ sơ chưa xong của đợt (theo lô, đọc nội dung từ kho hồ sơ)"""
+        last_case_id = ''
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT case_id FROM batch_items WHERE job_id = ? AND trang_thai = ? AND case_id > ? "
+                    "ORDER BY case_id LIMIT ?",
+                    (job_id, ITEM_PENDING, last_case_id, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            case_ids = [row[0] for row in rows]
+            found = set()
+            for case in self.store.iter_cases(case_ids=case_ids):
+                found.add(case['case_id'])
+                yield case
+            missing = [(ITEM_FAILED, "Không tìm thấy hồ sơ", time.time(), job_id, case_id)
+                       for case_id in case_ids if case_id not in found]
+            if missing:
+                with self._lock:
+                    self._conn.executemany(
+                        "UPDATE batch_items SET trang_thai = ?, loi = ?, updated_at = ? "
+                        "WHERE job_id = ? AND case_id = ?", missing
+                    )
+                    self._refresh_counts(job_id)
+                    self._conn.commit()
+            last_case_id = case_ids[-1]
+
+    def _analysis_data(self, case):
+        data = {
+            'customer': case.get('customer', {}),
+            'financial': case.get('financial', {}),
+            'collateral': case.get('collateral', {})
+        }
+        if self.calculator is not None:
+            try:
+                data['metrics'] = self.calculator.calculate_financial_metrics(
+                    data['financial'], data['customer'], data['collateral']
+                )
+            except Exception as e:
+                print(f"Lỗi khi tính chỉ số hồ sơ {case.get('case_id')}: {e}")
+        return data
+
+    def _item_result(self, case, future):
+        ho_ten = case.get('customer', {}).get('ho_ten', '')
+        try:
+            text, from_cache, elapsed, verdict = future.result()
+        except Exception as e:
+            return (ITEM_FAILED, ho_ten, None, None, str(e), 0, None, case['case_id'])
+        if text.startswith(ERROR_PREFIXES):
+            return (ITEM_FAILED, ho_ten, None, verdict, text, 0, elapsed, case['case_id'])
+        return (ITEM_DONE, ho_ten, text, verdict, None, int(from_cache), elapsed, case['case_id'])
+
+    def _checkpoint(self, job_id, results):
+        """Ghi kết quả đã có vào SQLite trong một giao dịch"""
+        if not results:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE batch_items SET trang_thai = ?, ho_ten = ?, ket_qua = ?, ket_luan = ?, loi = ?, "
+                "tu_cache = ?, thoi_gian = ?, updated_at = ? WHERE job_id = ? AND case_id = ?",
+                [result[:7] + (now, job_id, result[7]) for result in results]
+            )
+            self._refresh_counts(job_id)
+            self._conn.commit()
+
+    def _refresh_counts(self, job_id):
+        counts = dict(self._conn.execute(
+            "SELECT trang_thai, COUNT(*) FROM batch_items WHERE job_id = ? GROUP BY trang_thai", (job_id,)
+        ).fetchall())
+        self._conn.execute(
+            "UPDATE batch_jobs SET xong = ?, loi = ?, updated_at = ? WHERE job_id = ?",
+            (counts.get(ITEM_DONE, 0), counts.get(ITEM_FAILED, 0), time.time(), job_id)
+        )
+
+    def _set_job_status(self, job_id, status, finished=False):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE batch_jobs SET trang_thai = ?, updated_at = ?, finished_at = ? WHERE job_id = ?",
+                (status, time.time(), time.time() if finished else None, job_id)
+            )
+            self._conn.commit()
+
+    def get_job(self, job_id):
+        """Thông tin và tiến độ một đợt"""
+        jobs = self._select_jobs("WHERE job_id = ?", (job_id,))
+        return jobs[0] if jobs else None
+
+    def list_jobs(self, limit=20):
+        """Các đợt gần đây nhất"""
+        return self._select_jobs("ORDER BY created_at DESC LIMIT ?", (limit,))
+
+    def _select_jobs(self, clause, params):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT job_id, ten, chi_nhanh, trang_thai, tong, xong, loi, created_at, updated_at, finished_at "
+                f"FROM batch_jobs {clause}", params
+            ).fetchall()
+        jobs = []
+        for row in rows:
+            job = dict(zip(
+                ('job_id', 'ten', 'chi_nhanh', 'trang_thai', 'tong', 'xong', 'loi',
+                 'created_at', 'updated_at', 'finished_at'), row
+            ))
+            job['tien_do'] = (job['xong'] + job['loi']) / job['tong'] if job['tong'] else 1.0
+            job['dang_chay'] = self.is_running(job['job_id'])
+            jobs.append(job)
+        return jobs
+
+    def count_results(self, job_id, trang_thai=None):
+        sql, params = "SELECT COUNT(*) FROM batch_items WHERE job_id = ?", [job_id]
+        if trang_thai:
+            sql, params = sql + " AND trang_thai = ?", params + [trang_thai]
+        with self._lock:
+            return self._conn.execute(sql, params).fetchone()[0]
+
+    def get_results(self, job_id, offset=0, limit=50, trang_thai=None):
+        """Kết quả của đợt (phân trang) cho giao diện"""
+        sql = ("SELECT case_id, ho_ten, trang_thai, ket_qua, ket_luan, loi, tu_cache, thoi_gian, updated_at "
+               "FROM batch_items WHERE job_id = ?")
+        params = [job_id]
+        if trang_thai:
+            sql += " AND trang_thai = ?"
+            params.append(trang_thai)
+        sql += " ORDER BY case_id LIMIT ? OFFSET ?"
+        params += [limit, offset]
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [
+            dict(zip(('case_id', 'ho_ten', 'trang_thai', 'ket_qua', 'ket_luan', 'loi', 'tu_cache', 'thoi_gian',
+                      'updated_at'), row))
+            for row in rows
+        ]
@@ -0,0 +1,249 @@
+"""Benchmark độ trễ và thông lượng của tab Phân tích AI với backend Gemini giả
+
+Mỗi phiên giả lập thao tác của một cán bộ tín dụng trên tab AI: phân tích dữ liệu gốc,
+phân tích dữ liệu đã hiệu chỉnh (streaming), phân tích song song rồi hỏi đáp trong chatbox.
+Các phiên chạy đồng thời trên nhiều luồng, dùng chung tầng kết nối và cache như ứng dụng thật.
+
+Ví dụ:
+    python -m src.ai.benchmark --sessions 20 --latency lognormal:-0.7:0.5 --error-rate 0.05
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.ai.chat_session import ChatSession
+from src.ai.fake_backend import FakeGeminiBackend
+from src.ai.gemini_client import GeminiClient
+from src.ai.response_cache import ResponseCache
+from src.ai.transport import GeminiTransport
+
+CHAT_QUESTIONS = [
+    "Khách hàng có đủ khả năng trả nợ không?",
+    "LTV hiện tại có vượt ngưỡng chính sách không?",
+    "Cần bổ sung chứng từ gì trước khi trình phê duyệt?",
+    "Nếu lãi suất tăng 2% thì DSR thay đổi thế nào?"
+]
+
+
+def parse_latency(text):
+    """Đọc cấu hình độ trễ dạng 'fixed:0.3', 'uniform:0.2:0.8', 'lognormal:-0.7:0.5'"""
+    kind, *params = text.split(':')
+    return (kind, *(float(value) for value in params))
+
+
+def percentile(samples, q):
+    """Phân vị q (0-100) theo thứ hạng gần nhất"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def sample_case(index):
+    """Hồ sơ mẫu (cấu trúc giống dữ liệu trích xuất từ PASDV)"""
+    rng = random.Random(index)
+    loan = rng.randrange(300, 3000) * 1_000_000
+    income = rng.randrange(15, 120) * 1_000_000
+    customer = {
+        'ho_ten': f"Nguyễn Văn Mẫu {index}",
+        'cccd': f"0010{index:08d}",
+        'dia_chi': f"Số {index} đường Láng, Hà Nội",
+        'dien_thoai': f"09{index:08d}"
+    }
+    financial = {
+        'muc_dich_vay': "Mua nhà ở",
+        'tong_nhu_cau_von': loan * 1.4,
+        'von_doi_ung': loan * 0.4,
+        'so_tien_vay': loan,
+        'lai_suat': rng.choice([8.5, 9.0, 10.5]),
+        'thoi_gian_vay': rng.choice([60, 120, 180, 240]),
+        'tong_thu_nhap': income,
+        'chi_phi_sinh_hoat': income * 0.3
+    }
+    collateral = {
+        'loai_tai_san': "Quyền sử dụng đất và nhà ở",
+        'gia_tri_thi_truong': loan * rng.uniform(1.2, 2.0),
+        'dia_chi_tai_san': customer['dia_chi']
+    }
+    metrics = {
+        'ltv': round(loan / collateral['gia_tri_thi_truong'] * 100, 1),
+        'dsr_ratio': rng.uniform(20, 80)
+    }
+    original = dict(customer, **financial)
+    return original, {'customer': customer, 'financial': financial, 'collateral': collateral, 'metrics': metrics}
+
+
+class BenchmarkRecorder:
+    """Gom số đo của các phiên (an toàn đa luồng)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {}
+        self.ttft = {}
+        self.errors = {}
+
+    def record(self, operation, elapsed, ttft=None, error=False):
+        with self._lock:
+            self.latencies.setdefault(operation, []).append(elapsed)
+            if ttft is not None:
+                self.ttft.setdefault(operation, []).append(ttft)
+            if error:
+                self.errors[operation] = self.errors.get(operation, 0) + 1
+
+    def summary(self, wall_time):
+        operations = {}
+        for operation, samples in self.latencies.items():
+            ttft = self.ttft.get(operation, [])
+            operations[operation] = {
+                'so_lan': len(samples),
+                'loi': self.errors.get(operation, 0),
+                'trung_binh': sum(samples) / len(samples),
+                'p50': percentile(samples, 50),
+                'p95': percentile(samples, 95),
+                'p99': percentile(samples, 99),
+                'ttft_p50': percentile(ttft, 50) if ttft else None,
+                'ttft_p95': percentile(ttft, 95) if ttft else None
+            }
+        total = sum(item['so_lan'] for item in operations.values())
+        return {
+            'thoi_gian': wall_time,
+            'tong_thao_tac': total,
+            'thong_luong': total / wall_time if wall_time else 0.0,
+            'thao_tac': operations
+        }
+
+
+def _is_error(text):
+    return text.startswith("Lỗi") or text.startswith("API key")
+
+
+def _timed_stream(recorder, operation, chunks):
+    """Tiêu thụ một luồng phản hồi như render_stream, đo TTFT và tổng thời gian"""
+    start = time.perf_counter()
+    first = None
+    parts = []
+    for chunk in chunks:
+        if first is None:
+            first = time.perf_counter() - start
+        parts.append(chunk)
+    text = ''.join(parts)
+    recorder.record(operation, time.perf_counter() - start, first, _is_error(text))
+    return text
+
+
+def run_session(index, backend, transport, cache, recorder, chat_turns=2, think_time=0.0, use_cache=True):
+    """Một phiên làm việc trên tab AI"""
+    client = GeminiClient(response_cache=cache, transport=transport)
+    client.set_backend(backend)
+    original, current = sample_case(index)
+
+    _timed_stream(recorder, 'phan_tich_goc', client.analyze_financial_data_stream(
+        original, "dữ liệu gốc từ file upload", use_cache))
+    time.sleep(think_time)
+    _timed_stream(recorder, 'phan_tich_hien_tai', client.analyze_financial_data_stream(
+        current, "dữ liệu sau khi hiệu chỉnh tại giao diện", use_cache))
+    time.sleep(think_time)
+
+    start = time.perf_counter()
+    comparison = client.analyze_many({
+        'goc': (original, "dữ liệu gốc từ file upload"),
+        'hien_tai': (current, "dữ liệu sau khi hiệu chỉnh tại giao diện"),
+        'tra_no': ({'financial': current['financial'], 'metrics': current['metrics']},
+                   "chuyên đề khả năng trả nợ: DSR, biên an toàn, dòng tiền")
+    }, max_concurrency=4, use_cache=use_cache)
+    failed = any(_is_error(item['ket_qua']) for item in comparison['ket_qua'].values())
+    recorder.record('phan_tich_song_song', time.perf_counter() - start, error=failed)
+
+    session = ChatSession()
+    session.set_case_context(json.dumps(current, ensure_ascii=False), key=index)
+    for turn in range(chat_turns):
+        time.sleep(think_time)
+        _timed_stream(recorder, 'chat', client.chat_stream(CHAT_QUESTIONS[turn % len(CHAT_QUESTIONS)], session))
+
+
+def run_benchmark(sessions=10, concurrency=None, latency=('lognormal', -0.7, 0.5), error_rate=0.0,
+                  chunk_size=48, chunk_delay=0.02, rate=2.0, burst=5, chat_turns=2, think_time=0.0,
+                  use_cache=True, seed=None):
+    """Chạy benchmark với N phiên đồng thời, trả về bảng tổng hợp"""
+    backend = FakeGeminiBackend(latency=latency, error_rate=error_rate, chunk_size=chunk_size,
+                                chunk_delay=chunk_delay, seed=seed)
+    transport = GeminiTransport(rate=rate, burst=burst)
+    cache = ResponseCache(use_disk=False) if use_cache else None
+    recorder = BenchmarkRecorder()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency or sessions) as executor:
+        futures = [
+            executor.submit(run_session, index, backend, transport, cache, recorder,
+                            chat_turns, think_time, use_cache)
+            for index in range(sessions)
+        ]
+        for future in futures:
+            future.result()
+    result = recorder.summary(time.perf_counter() - start)
+    result['so_phien'] = sessions
+    result['goi_backend'] = backend.calls
+    result['ket_noi'] = transport.get_stats()
+    if cache is not None:
+        result['cache'] = cache.stats()
+    return result
+
+
+def format_report(result):
+    """Định dạng kết quả thành bảng văn bản"""
+    lines = [
+        f"Số phiên: {result['so_phien']} | Thời gian: {result['thoi_gian']:.2f}s | "
+        f"Thao tác: {result['tong_thao_tac']} | Thông lượng: {result['thong_luong']:.2f} thao tác/s | "
+        f"Lời gọi backend: {result['goi_backend']}",
+        f"{'Thao tác':<22}{'Số lần':>8}{'Lỗi':>6}{'TB':>8}{'p50':>8}{'p95':>8}{'p99':>8}{'TTFT p50':>10}{'TTFT p95':>10}"
+    ]
+    for operation, item in result['thao_tac'].items():
+        ttft50 = f"{item['ttft_p50']:.3f}" if item['ttft_p50'] is not None else '-'
+        ttft95 = f"{item['ttft_p95']:.3f}" if item['ttft_p95'] is not None else '-'
+        lines.append(
+            f"{operation:<22}{item['so_lan']:>8}{item['loi']:>6}{item['trung_binh']:>8.3f}"
+            f"{item['p50']:>8.3f}{item['p95']:>8.3f}{item['p99']:>8.3f}{ttft50:>10}{ttft95:>10}"
+        )
+    transport = result['ket_noi']
+    lines.append(
+        f"Kết nối: {transport['calls']} lời gọi, {transport['retries']} thử lại, {transport['errors']} lỗi, "
+        f"chờ giới hạn tốc độ {transport['rate_limit_wait']:.2f}s, ngắt mạch: {transport['circuit_state']}"
+    )
+    if 'cache' in result:
+        lines.append(f"Cache: tỷ lệ trúng {result['cache']['hit_rate']:.0%}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark tab Phân tích AI với backend Gemini giả")
+    parser.add_argument('--sessions', type=int, default=10, help="Số phiên đồng thời")
+    parser.add_argument('--concurrency', type=int, default=None, help="Số luồng tối đa (mặc định bằng số phiên)")
+    parser.add_argument('--latency', type=parse_latency, default=('lognormal', -0.7, 0.5),
+                        help="Phân phối độ trễ tới đoạn đầu tiên, ví dụ fixed:0.3, uniform:0.2:0.8, lognormal:-0.7:0.5")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Tỷ lệ lỗi 429/503 giả lập")
+    parser.add_argument('--chunk-size', type=int, default=48, help="Số ký tự mỗi đoạn streaming")
+    parser.add_argument('--chunk-delay', type=float, default=0.02, help="Độ trễ giữa các đoạn (giây)")
+    parser.add_argument('--rate', type=float, default=2.0, help="Giới hạn lời gọi/giây của tầng kết nối")
+    parser.add_argument('--burst', type=int, default=5, help="Số lời gọi tức thời tối đa")
+    parser.add_argument('--chat-turns', type=int, default=2, help="Số câu hỏi chat mỗi phiên")
+    parser.add_argument('--think-time', type=float, default=0.0, help="Thời gian nghỉ giữa các thao tác (giây)")
+    parser.add_argument('--no-cache', action='store_true', help="Không dùng cache phản hồi")
+    parser.add_argument('--seed', type=int, default=None, help="Hạt giống ngẫu nhiên để lặp lại kết quả")
+    parser.add_argument('--json', action='store_true', help="In kết quả dạng JSON")
+    args = parser.parse_args(argv)
+
+    result = run_benchmark(
+        sessions=args.sessions, concurrency=args.concurrency, latency=args.latency,
+        error_rate=args.error_rate, chunk_size=args.chunk_size, chunk_delay=args.chunk_delay,
+        rate=args.rate, burst=args.burst, chat_turns=args.chat_turns, think_time=args.think_time,
+        use_cache=not args.no_cache, seed=args.seed
+    )
+    print(json.dumps(result, ensure_ascii=False, indent=2) if args.json else format_report(result))
+
+
+if __name__ == '__main__':
+    main()
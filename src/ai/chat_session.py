@@ -0,0 +1,148 @@
+from src.ai.prompt_builder import estimate_tokens
+from src.logic.document_index import format_sources
+
+
+def _shorten(text, limit):
+    text = ' '.join(str(text).split())
+    return text if len(text) <= limit else text[:limit].rstrip() + '…'
+
+
+class ChatSession:
+    """Phiên chat giữ ngữ cảnh hồ sơ và lịch sử hội thoại trong một ngân sách token cố định"""
+
+    SYSTEM_PROMPT = (
+        "Bạn là trợ lý thẩm định tín dụng ngân hàng. Trả lời ngắn gọn, chính xác, "
+        "dựa trên thông tin hồ sơ dưới đây khi câu hỏi liên quan tới khách hàng."
+    )
+
+    SOURCES_INSTRUCTION = (
+        "Khi dùng thông tin từ các đoạn trích tài liệu, ghi rõ nguồn dạng [Nguồn n]. "
+        "Nếu đoạn trích không chứa thông tin cần thiết, nói rõ là tài liệu không đề cập."
+    )
+
+    def __init__(self, token_budget=6000, keep_recent_turns=6, max_turns=40, summary_budget=800,
+                 retrieval_k=4, sources_budget=2400):
+        self.token_budget = token_budget
+        self.keep_recent_turns = keep_recent_turns
+        self.max_turns = max_turns
+        self.summary_budget = summary_budget
+        self.retrieval_k = retrieval_k
+        self.sources_budget = sources_budget
+        self.case_context = ''
+        self.context_key = None
+        self.document_index = None
+        self.document_key = None
+        self.last_sources = []
+        self.summary = ''
+        self.turns = []
+
+    def set_case_context(self, context, key=None):
+        """Cập nhật ngữ cảnh hồ sơ; chỉ thay khi khóa (ví dụ phiên bản dữ liệu) thay đổi"""
+        if key is not None and key == self.context_key:
+            return
+        self.case_context = context or ''
+        self.context_key = key
+
+    def set_document_index(self, index, key=None):
+        """Gắn chỉ mục tra cứu của file upload (None nếu hồ sơ không có file gốc)"""
+        if key is not None and key == self.document_key:
+            return
+        self.document_index = index
+        self.document_key = key
+        self.last_sources = []
+
+    def retrieve(self, message):
+        """Tìm các đoạn trích liên quan tới câu hỏi trong file upload"""
+        if not self.document_index:
+            return []
+        return self.document_index.search(message, k=self.retrieval_k)
+
+    def clear(self):
+        """Xóa lịch sử hội thoại, giữ ngữ cảnh hồ sơ"""
+        self.summary = ''
+        self.turns = []
+
+    def build_contents(self, message):
+        """Tạo danh sách nội dung gửi Gemini: ngữ cảnh (một lần) + tóm tắt + các lượt gần đây
+
+        Các đoạn trích tài liệu chỉ gắn vào câu hỏi hiện tại, lịch sử chỉ lưu câu hỏi gốc.
+        """
+        preamble = [self.SYSTEM_PROMPT]
+        if self.document_index:
+            preamble.append(self.SOURCES_INSTRUCTION)
+        if self.case_context:
+            preamble.append(f"THÔNG TIN HỒ SƠ:\n{self.case_context}")
+        if self.summary:
+            preamble.append(f"TÓM TẮT HỘI THOẠI TRƯỚC:\n{self.summary}")
+
+        contents = [
+            {'role': 'user', 'parts': ["\n\n".join(preamble)]},
+            {'role': 'model', 'parts': ["Tôi đã nắm thông tin hồ sơ."]}
+        ]
+        contents.extend({'role': turn['role'], 'parts': [turn['text']]} for turn in self.turns)
+        self.last_sources = self.retrieve(message)
+        if self.last_sources:
+            message = (
+                f"ĐOẠN TRÍCH TÀI LIỆU LIÊN QUAN:\n{format_sources(self.last_sources, self.sources_budget)}"
+                f"\n\nCÂU HỎI: {message}"
+            )
+        contents.append({'role': 'user', 'parts': [message]})
+        return contents
+
+    def token_count(self):
+        """Ước lượng số token của phần ngữ cảnh và lịch sử sẽ gửi đi"""
+        return (
+            estimate_tokens(self.SYSTEM_PROMPT)
+            + estimate_tokens(self.case_context)
+            + estimate_tokens(self.summary)
+            + sum(estimate_tokens(turn['text']) for turn in self.turns)
+        )
+
+    def add_exchange(self, message, reply, summarizer=None):
+        """Ghi nhận một lượt hỏi-đáp rồi thu gọn lịch sử nếu vượt ngân sách"""
+        self.turns.append({'role': 'user', 'text': message})
+        self.turns.append({'role': 'model', 'text': reply})
+        self._compact(summarizer)
+
+    def _compact(self, summarizer=None):
+        """Gộp các lượt cũ nhất vào bản tóm tắt cho tới khi nằm trong ngân sách token"""
+        keep = self.keep_recent_turns * 2
+        folded = []
+        while len(self.turns) > keep and (
+            self.token_count() > self.token_budget or len(self.turns) > self.max_turns * 2
+        ):
+            folded.extend(self.turns[:2])
+            del self.turns[:2]
+
+        if not folded:
+            return
+
+        summary = None
+        if summarizer is not None:
+            try:
+                summary = summarizer(self.summary, folded)
+            except Exception as e:
+                print(f"Lỗi khi tóm tắt hội thoại: {e}")
+        if not summary:
+            summary = self._extractive_summary(folded)
+        self.summary = self._trim_summary(summary)
+
+    def _extractive_summary(self, folded):
+        """Tóm tắt dự phòng: giữ câu hỏi và phần đầu câu trả lời của các lượt bị gộp"""
+        lines = [self.summary] if self.summary else []
+        for index in range(0, len(folded) - 1, 2):
+            lines.append(
+                f"- Hỏi: {_shorten(folded[index]['text'], 150)} | "
+                f"Đáp: {_shorten(folded[index + 1]['text'], 250)}"
+            )
+        return "\n".join(lines)
+
+    def _trim_summary(self, summary):
+        """Giới hạn độ dài bản tóm tắt, bỏ các dòng cũ nhất trước"""
+        lines = summary.splitlines()
+        while len(lines) > 1 and estimate_tokens("\n".join(lines)) > self.summary_budget:
+            lines.pop(0)
+        summary = "\n".join(lines)
+        if estimate_tokens(summary) > self.summary_budget:
+            summary = _shorten(summary, self.summary_budget * 3)
+        return summary
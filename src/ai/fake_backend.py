@@ -0,0 +1,164 @@
+import asyncio
+import math
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+from src.ai.backends import GeminiBackend
+from src.ai.prompt_builder import estimate_tokens
+
+DEFAULT_RESPONSE = """1. Đánh giá rủi ro tín dụng: Mức rủi ro trung bình, LTV và DSR nằm trong ngưỡng chính sách.
+2. Khả năng trả nợ: Thu nhập ổn định đủ trang trải nghĩa vụ trả nợ hàng tháng với biên an toàn hợp lý.
+3. Đề xuất: Có thể xem xét cho vay, bổ sung chứng từ chứng minh thu nhập và thẩm định lại giá trị tài sản.
+4. Lưu ý: Theo dõi biến động lãi suất thả nổi và tình trạng pháp lý của tài sản bảo đảm."""
+
+
+class FakeBackendError(Exception):
+    """Lỗi giả lập từ backend (mang mã HTTP để tầng kết nối phân loại)"""
+
+    def __init__(self, code, message=None):
+        super().__init__(message or f"Lỗi giả lập {code}")
+        self.code = code
+
+
+def _contents_text(contents):
+    """Ghép nội dung (chuỗi hoặc danh sách lượt chat) thành văn bản"""
+    if isinstance(contents, str):
+        return contents
+    parts = []
+    for item in contents:
+        if isinstance(item, dict):
+            parts.extend(str(part) for part in item.get('parts', []))
+        else:
+            parts.append(str(item))
+    return "\n".join(parts)
+
+
+def make_latency(spec):
+    """Tạo hàm lấy mẫu độ trễ (giây) từ cấu hình
+
+    Hỗ trợ số cố định, callable(rng), hoặc tuple ('fixed', s), ('uniform', a, b),
+    ('normal', mu, sigma), ('lognormal', mu, sigma) với mu/sigma của log độ trễ.
+    """
+    if spec is None:
+        return lambda rng: 0.0
+    if callable(spec):
+        return spec
+    if isinstance(spec, (int, float)):
+        return lambda rng: float(spec)
+    kind, *params = spec
+    if kind == 'fixed':
+        return lambda rng: float(params[0])
+    if kind == 'uniform':
+        return lambda rng: rng.uniform(params[0], params[1])
+    if kind == 'normal':
+        return lambda rng: max(0.0, rng.gauss(params[0], params[1]))
+    if kind == 'lognormal':
+        return lambda rng: rng.lognormvariate(params[0], params[1])
+    raise ValueError(f"Không hỗ trợ phân phối độ trễ: {kind}")
+
+
+class FakeResponse:
+    def __init__(self, text, prompt_tokens):
+        self.text = text
+        self.usage_metadata = SimpleNamespace(
+            prompt_token_count=prompt_tokens,
+            candidates_token_count=estimate_tokens(text)
+        )
+
+
+class FakeStreamResponse:
+    """Phản hồi streaming giả: trả từng đoạn với độ trễ giữa các đoạn"""
+
+    def __init__(self, chunks, first_delay, chunk_delay, prompt_tokens, sleep):
+        self._chunks = chunks
+        self._first_delay = first_delay
+        self._chunk_delay = chunk_delay
+        self._sleep = sleep
+        self.text = ''.join(chunks)
+        self.usage_metadata = None
+        self._prompt_tokens = prompt_tokens
+
+    def __iter__(self):
+        self._sleep(self._first_delay)
+        for index, chunk in enumerate(self._chunks):
+            if index:
+                self._sleep(self._chunk_delay)
+            yield SimpleNamespace(text=chunk)
+        self.usage_metadata = SimpleNamespace(
+            prompt_token_count=self._prompt_tokens,
+            candidates_token_count=estimate_tokens(self.text)
+        )
+
+
+class FakeGeminiBackend(GeminiBackend):
+    """Backend giả chạy cục bộ: phát lại câu trả lời mẫu với độ trễ, tỷ lệ lỗi và cách chia đoạn cấu hình được"""
+
+    def __init__(self, responses=None, latency=('lognormal', -0.7, 0.5), error_rate=0.0,
+                 error_codes=(429, 503), chunk_size=48, chunk_delay=0.02, seed=None,
+                 model_name='fake-gemini', sleep=time.sleep):
+        self.responses = responses
+        self.latency = make_latency(latency)
+        self.error_rate = error_rate
+        self.error_codes = tuple(error_codes)
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+        self.model_name = model_name
+        self.sleep = sleep
+        self.calls = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._cycle = 0
+
+    def _respond(self, prompt):
+        """Chọn câu trả lời mẫu: callable, dict theo từ khóa, danh sách xoay vòng hoặc mặc định"""
+        if callable(self.responses):
+            return self.responses(prompt)
+        if isinstance(self.responses, dict):
+            for keyword, text in self.responses.items():
+                if keyword in prompt:
+                    return text
+            return self.responses.get('*', DEFAULT_RESPONSE)
+        if self.responses:
+            with self._lock:
+                text = self.responses[self._cycle % len(self.responses)]
+                self._cycle += 1
+            return text
+        return DEFAULT_RESPONSE
+
+    def _sample(self):
+        """Lấy mẫu (độ trễ, lỗi) cho một lời gọi"""
+        with self._lock:
+            self.calls += 1
+            delay = self.latency(self._rng)
+            failed = self._rng.random() < self.error_rate
+            code = self._rng.choice(self.error_codes) if failed else None
+        return delay, code
+
+    def _chunks(self, text):
+        if self.chunk_size <= 0:
+            return [text]
+        return [text[i:i + self.chunk_size] for i in range(0, len(text), self.chunk_size)] or ['']
+
+    def generate_content(self, contents, stream=False):
+        prompt = _contents_text(contents)
+        delay, code = self._sample()
+        if code is not None:
+            self.sleep(delay / 2)
+            raise FakeBackendError(code)
+        text = self._respond(prompt)
+        if stream:
+            return FakeStreamResponse(self._chunks(text), delay, self.chunk_delay, estimate_tokens(prompt), self.sleep)
+        self.sleep(delay + self.chunk_delay * max(0, math.ceil(len(text) / max(1, self.chunk_size)) - 1))
+        return FakeResponse(text, estimate_tokens(prompt))
+
+    async def generate_content_async(self, contents):
+        prompt = _contents_text(contents)
+        delay, code = self._sample()
+        if code is not None:
+            await asyncio.sleep(delay / 2)
+            raise FakeBackendError(code)
+        text = self._respond(prompt)
+        await asyncio.sleep(delay + self.chunk_delay * max(0, math.ceil(len(text) / max(1, self.chunk_size)) - 1))
+        return FakeResponse(text, estimate_tokens(prompt))
@@ -1,60 +1,347 @@
-import google.generativeai as genai
-import json
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+from collections import deque
+from src.ai.backends import GoogleGeminiBackend, MODEL_NAME
+from src.ai.prompt_builder import PromptBuilder, estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Event loop dùng chung của tiến trình, chạy trên luồng nền suốt vòng đời ứng dụng.
+# Client bất đồng bộ của Gemini (kênh grpc.aio) gắn với loop chạy nó lần đầu; asyncio.run tạo rồi
+# đóng một loop mới mỗi lần gọi nên lần phân tích song song thứ hai sẽ lỗi "Event loop is closed".
+_background_loop = None
+_background_loop_lock = threading.Lock()
+
+def run_in_background_loop(coro):
+    """Chạy coroutine trên event loop dùng chung và chờ kết quả (gọi được từ luồng script Streamlit)"""
+    global _background_loop
+    with _background_loop_lock:
+        if _background_loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="gemini-async-loop", daemon=True).start()
+            _background_loop = loop
+    return asyncio.run_coroutine_threadsafe(coro, _background_loop).result()
+
+def create_model(api_key, model_name=MODEL_NAME):
+    """Cấu hình Gemini và tạo backend thật"""
+    return GoogleGeminiBackend(api_key, model_name)
 
 class GeminiClient:
-    def __init__(self):
+    def __init__(self, response_cache=None, transport=None, semantic_cache=None):
         self.api_key = None
         self.model = None
+        self.model_name = MODEL_NAME
+        self.response_cache = response_cache
+        self.transport = transport
+        self.semantic_cache = semantic_cache
+        self.last_from_cache = False
+        # Mục cache câu trả lời đã dùng cho câu chat gần nhất (None nếu gọi Gemini)
+        self.last_chat_cache_hit = None
+        # Thời gian tới token đầu tiên và tổng thời gian của các lần gọi streaming gần đây (giây)
+        self.ttft_samples = deque(maxlen=200)
+        self.stream_durations = deque(maxlen=200)
+        self.prompt_builder = PromptBuilder()
+        # Số token prompt/phản hồi của các lần gọi gần đây
+        self.token_log = deque(maxlen=200)
     
-    def set_api_key(self, api_key):
-        """Thiết lập API key"""
+    def set_api_key(self, api_key, model=None):
+        """Thiết lập API key (có thể truyền sẵn model đã cấu hình dùng chung)"""
+        if api_key == self.api_key and self.model is not None:
+            return
         self.api_key = api_key
+        if model is not None:
+            self.model = model
+            self.model_name = getattr(model, 'model_name', MODEL_NAME)
+            return
         try:
-            genai.configure(api_key=api_key)
-            self.model = genai.GenerativeModel('gemini-1.5-flash')
+            self.model = create_model(api_key)
+            self.model_name = MODEL_NAME
         except Exception as e:
             print(f"Lỗi khi thiết lập Gemini: {e}")
     
+    def set_backend(self, backend, api_key='local'):
+        """Dùng một backend tùy chọn (ví dụ FakeGeminiBackend cho kiểm thử/benchmark)"""
+        self.api_key = api_key
+        self.model = backend
+        self.model_name = getattr(backend, 'model_name', MODEL_NAME)
+    
     def is_configured(self):
         """Kiểm tra xem client đã được cấu hình chưa"""
         return self.api_key is not None and self.model is not None
     
-    def analyze_financial_data(self, data, data_source):
-        """Phân tích dữ liệu tài chính"""
+    def build_analysis_prompt(self, data, data_source, extra=None):
+        """Tạo prompt phân tích dữ liệu tài chính (rút gọn, trong ngân sách token; extra: kết quả sàng lọc)"""
+        prompt, _ = self.prompt_builder.build_analysis_prompt(data, data_source, extra)
+        return prompt
+    
+    def _record_usage(self, kind, prompt, response, response_text=None):
+        """Ghi nhận số token prompt/phản hồi của mỗi lần gọi"""
+        usage = getattr(response, 'usage_metadata', None)
+        prompt_tokens = getattr(usage, 'prompt_token_count', None)
+        response_tokens = getattr(usage, 'candidates_token_count', None)
+        record = {
+            'loai': kind,
+            'thoi_diem': time.time(),
+            'prompt_tokens': prompt_tokens if prompt_tokens is not None else estimate_tokens(str(prompt)),
+            'response_tokens': response_tokens if response_tokens is not None else estimate_tokens(response_text or ''),
+            'uoc_tinh': prompt_tokens is None
+        }
+        self.token_log.append(record)
+        logger.info(
+            "Gemini %s: prompt=%s token, phản hồi=%s token%s",
+            kind, record['prompt_tokens'], record['response_tokens'], " (ước tính)" if record['uoc_tinh'] else ""
+        )
+    
+    def _generate(self, contents):
+        """Gọi model qua tầng kết nối (thử lại, giới hạn tốc độ, ngắt mạch) nếu có"""
+        if self.transport is None:
+            return self.model.generate_content(contents)
+        return self.transport.call(self.model.generate_content, contents)
+    
+    async def _generate_async(self, contents):
+        if self.transport is None:
+            return await self.model.generate_content_async(contents)
+        return await self.transport.call_async(self.model.generate_content_async, contents)
+    
+    def _lookup_cache(self, prompt, use_cache):
+        """Tra cache phản hồi, trả về (khóa cache, nội dung đã cache hoặc None)"""
+        if self.response_cache is None:
+            return None, None
+        cache_key = self.response_cache.make_key(self.model_name, prompt)
+        cached = self.response_cache.get(cache_key) if use_cache else None
+        return cache_key, cached
+    
+    def analyze_financial_data(self, data, data_source, use_cache=True, extra=None):
+        """Phân tích dữ liệu tài chính (use_cache=False để bỏ qua cache phản hồi)"""
+        self.last_from_cache = False
         if not self.is_configured():
             return "API key chưa được thiết lập"
         
         try:
-            prompt = f"""
-            Bạn là chuyên gia phân tích tín dụng ngân hàng. Hãy phân tích dữ liệu sau đây và đưa ra đánh giá:
+            prompt = self.build_analysis_prompt(data, data_source, extra)
             
-            NGUỒN DỮ LIỆU: {data_source}
+            cache_key, cached = self._lookup_cache(prompt, use_cache)
+            if cached is not None:
+                self.last_from_cache = True
+                return cached
             
-            DỮ LIỆU PHÂN TÍCH:
-            {json.dumps(data, indent=2, ensure_ascii=False)}
+            response = self._generate(prompt)
+            self._record_usage('phan_tich', prompt, response, response.text)
+            if cache_key is not None:
+                self.response_cache.set(cache_key, response.text)
+            return response.text
             
-            Hãy cung cấp phân tích với các nội dung:
-            1. Đánh giá rủi ro tín dụng
-            2. Khả năng trả nợ của khách hàng
-            3. Đề xuất cho cán bộ tín dụng
-            4. Các điểm cần lưu ý
+        except Exception as e:
+            return f"Lỗi khi phân tích: {str(e)}"
+    
+    async def analyze_financial_data_async(self, data, data_source, use_cache=True, extra=None):
+        """Phân tích dữ liệu tài chính bất đồng bộ, trả về (kết quả, lấy từ cache hay không)"""
+        if not self.is_configured():
+            return "API key chưa được thiết lập", False
+        
+        try:
+            prompt = self.build_analysis_prompt(data, data_source, extra)
             
-            Phân tích ngắn gọn nhưng đầy đủ, chuyên sâu.
-            """
+            cache_key, cached = self._lookup_cache(prompt, use_cache)
+            if cached is not None:
+                return cached, True
             
-            response = self.model.generate_content(prompt)
-            return response.text
+            response = await self._generate_async(prompt)
+            self._record_usage('phan_tich', prompt, response, response.text)
+            if cache_key is not None:
+                self.response_cache.set(cache_key, response.text)
+            return response.text, False
             
         except Exception as e:
-            return f"Lỗi khi phân tích: {str(e)}"
+            return f"Lỗi khi phân tích: {str(e)}", False
+    
+    async def analyze_many_async(self, jobs, max_concurrency=3, use_cache=True):
+        """Chạy đồng thời nhiều phân tích {tên: (dữ liệu, nguồn)}, giới hạn bằng semaphore"""
+        semaphore = asyncio.Semaphore(max_concurrency)
+        
+        async def run(name, data, data_source):
+            async with semaphore:
+                start = time.perf_counter()
+                text, from_cache = await self.analyze_financial_data_async(data, data_source, use_cache)
+                return name, {
+                    'ket_qua': text,
+                    'tu_cache': from_cache,
+                    'thoi_gian': time.perf_counter() - start
+                }
+        
+        start = time.perf_counter()
+        results = await asyncio.gather(*(
+            run(name, data, data_source) for name, (data, data_source) in jobs.items()
+        ))
+        return {'ket_qua': dict(results), 'tong_thoi_gian': time.perf_counter() - start}
+    
+    def analyze_many(self, jobs, max_concurrency=3, use_cache=True):
+        """Phiên bản đồng bộ của analyze_many_async (dùng trong script Streamlit)"""
+        return run_in_background_loop(self.analyze_many_async(jobs, max_concurrency, use_cache))
     
-    def chat(self, message):
-        """Chat với Gemini"""
+    def _stream_content(self, contents, kind='stream'):
+        """Gọi Gemini ở chế độ streaming, trả về từng đoạn văn bản và ghi nhận TTFT"""
+        start = time.perf_counter()
+        first_chunk = True
+        parts = []
+        opened = {}
+        
+        def open_stream():
+            opened['response'] = self.model.generate_content(contents, stream=True)
+            return opened['response']
+        
+        chunks = open_stream() if self.transport is None else self.transport.stream(open_stream)
+        for chunk in chunks:
+            text = getattr(chunk, 'text', '')
+            if not text:
+                continue
+            if first_chunk:
+                self.ttft_samples.append(time.perf_counter() - start)
+                first_chunk = False
+            parts.append(text)
+            yield text
+        self.stream_durations.append(time.perf_counter() - start)
+        self._record_usage(kind, contents, opened.get('response'), ''.join(parts))
+    
+    def analyze_financial_data_stream(self, data, data_source, use_cache=True, extra=None):
+        """Phân tích dữ liệu tài chính, trả kết quả dần theo từng đoạn"""
+        self.last_from_cache = False
+        if not self.is_configured():
+            yield "API key chưa được thiết lập"
+            return
+        
+        try:
+            prompt = self.build_analysis_prompt(data, data_source, extra)
+            
+            cache_key, cached = self._lookup_cache(prompt, use_cache)
+            if cached is not None:
+                self.last_from_cache = True
+                yield cached
+                return
+            
+            parts = []
+            for text in self._stream_content(prompt, 'phan_tich'):
+                parts.append(text)
+                yield text
+            if cache_key is not None and parts:
+                self.response_cache.set(cache_key, ''.join(parts))
+                
+        except Exception as e:
+            yield f"Lỗi khi phân tích: {str(e)}"
+    
+    def _chat_cache_scope(self, message, session):
+        """Phạm vi cache câu trả lời, trả về (scope, có phụ thuộc hồ sơ không)
+
+        Chỉ dùng chung giữa các hồ sơ khi prompt gửi Gemini không có ngữ cảnh nào (không hồ sơ,
+        không lịch sử, không trích dẫn); ngược lại scope gồm dấu vân tay hồ sơ, lịch sử và trích dẫn.
+        Không dựa vào từ khóa trong câu hỏi: "DSR hiện tại là bao nhiêu?" vẫn được trả lời theo hồ sơ.
+        """
+        if session is None or not (session.case_context or session.summary or session.turns or session.last_sources):
+            return self.semantic_cache.make_scope(self.model_name), False
+        case_fingerprint = hashlib.sha256(session.case_context.encode('utf-8')).hexdigest()
+        history = hashlib.sha256("\x1f".join(
+            [session.summary] + [f"{turn['role']}:{turn['text']}" for turn in session.turns]
+        ).encode('utf-8')).hexdigest()
+        return self.semantic_cache.make_scope(
+            self.model_name, case_fingerprint, history, *(source['noi_dung'] for source in session.last_sources)
+        ), True
+    
+    def _lookup_answer(self, message, session, use_cache):
+        """Tra cache câu trả lời theo độ tương đồng, trả về ((scope, theo hồ sơ), mục cache hoặc None)"""
+        self.last_chat_cache_hit = None
+        if self.semantic_cache is None:
+            return None, None
+        scope = self._chat_cache_scope(message, session)
+        hit = self.semantic_cache.lookup(message, scope[0]) if use_cache else None
+        self.last_chat_cache_hit = hit
+        return scope, hit
+    
+    def chat_stream(self, message, session=None, use_cache=True):
+        """Chat với Gemini, trả lời dần theo từng đoạn (kèm ngữ cảnh phiên chat nếu có)"""
+        if not self.is_configured():
+            yield "API key chưa được thiết lập"
+            return
+        
+        try:
+            contents = session.build_contents(message) if session is not None else message
+            scope, hit = self._lookup_answer(message, session, use_cache)
+            if hit is not None:
+                if session is not None:
+                    session.add_exchange(message, hit['answer'], summarizer=self.summarize_history)
+                yield hit['answer']
+                return
+            
+            parts = []
+            for text in self._stream_content(contents, 'chat'):
+                parts.append(text)
+                yield text
+            if parts:
+                answer = ''.join(parts)
+                if session is not None:
+                    session.add_exchange(message, answer, summarizer=self.summarize_history)
+                if self.semantic_cache is not None:
+                    self.semantic_cache.add(message, answer, *scope)
+        except Exception as e:
+            yield f"Lỗi khi chat: {str(e)}"
+    
+    def summarize_history(self, summary, turns):
+        """Tóm tắt các lượt hội thoại cũ (gộp với bản tóm tắt trước đó)"""
+        transcript = "\n".join(
+            f"{'Người dùng' if turn['role'] == 'user' else 'Trợ lý'}: {turn['text']}" for turn in turns
+        )
+        prompt = (
+            "Tóm tắt ngắn gọn (tối đa 10 gạch đầu dòng) các ý chính, số liệu và kết luận "
+            "của đoạn hội thoại thẩm định tín dụng sau, gộp với bản tóm tắt trước đó nếu có.\n\n"
+            f"TÓM TẮT TRƯỚC ĐÓ:\n{summary or '(chưa có)'}\n\nHỘI THOẠI:\n{transcript}"
+        )
+        response = self._generate(prompt)
+        self._record_usage('tom_tat', prompt, response, response.text)
+        return response.text
+    
+    def get_token_stats(self):
+        """Tổng hợp số token theo loại lời gọi"""
+        stats = {}
+        for record in self.token_log:
+            item = stats.setdefault(record['loai'], {'so_lan': 0, 'prompt_tokens': 0, 'response_tokens': 0})
+            item['so_lan'] += 1
+            item['prompt_tokens'] += record['prompt_tokens']
+            item['response_tokens'] += record['response_tokens']
+        return stats
+    
+    def get_latency_stats(self):
+        """Thống kê thời gian tới token đầu tiên (TTFT) và tổng thời gian streaming"""
+        def summarize(samples):
+            if not samples:
+                return {'so_lan': 0, 'trung_binh': 0.0, 'p50': 0.0, 'p95': 0.0}
+            ordered = sorted(samples)
+            return {
+                'so_lan': len(ordered),
+                'trung_binh': sum(ordered) / len(ordered),
+                'p50': ordered[len(ordered) // 2],
+                'p95': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+            }
+        return {'ttft': summarize(self.ttft_samples), 'tong': summarize(self.stream_durations)}
+    
+    def chat(self, message, session=None, use_cache=True):
+        """Chat với Gemini (kèm ngữ cảnh phiên chat nếu có)"""
         if not self.is_configured():
             return "API key chưa được thiết lập"
         
         try:
-            response = self.model.generate_content(message)
-            return response.text
+            contents = session.build_contents(message) if session is not None else message
+            scope, hit = self._lookup_answer(message, session, use_cache)
+            answer = hit['answer'] if hit is not None else None
+            if answer is None:
+                response = self._generate(contents)
+                self._record_usage('chat', contents, response, response.text)
+                answer = response.text
+                if self.semantic_cache is not None:
+                    self.semantic_cache.add(message, answer, *scope)
+            if session is not None:
+                session.add_exchange(message, answer, summarizer=self.summarize_history)
+            return answer
         except Exception as e:
-            return f"Lỗi khi chat: {str(e)}"
\ No newline at end of file
+            return f"Lỗi khi chat: {str(e)}"
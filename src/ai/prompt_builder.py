@@ -0,0 +1,113 @@
+import json
+from collections.abc import Mapping
+
+# Trường tiền tệ (VNĐ) được quy đổi sang triệu đồng và làm tròn
+MONEY_FIELDS = {
+    'tong_nhu_cau_von', 'von_doi_ung', 'so_tien_vay', 'gia_tri_thi_truong',
+    'gia_tri_tai_san', 'monthly_payment', 'tra_goc', 'tra_lai', 'tong_tra', 'goc_con_lai'
+}
+# Trường tỷ lệ (%) chỉ giữ một chữ số thập phân
+RATIO_FIELDS = {'lai_suat', 'ty_le_von_doi_ung', 'ltv', 'dsr_ratio', 'safety_margin'}
+
+ANALYSIS_TEMPLATE = """Bạn là chuyên gia phân tích tín dụng ngân hàng. Hãy phân tích dữ liệu sau đây và đưa ra đánh giá.
+NGUỒN DỮ LIỆU: {data_source}
+DỮ LIỆU PHÂN TÍCH (JSON rút gọn, số tiền tính bằng triệu đồng, bỏ các trường trống):
+{data}
+{extra}Hãy cung cấp phân tích với các nội dung:
+1. Đánh giá rủi ro tín dụng
+2. Khả năng trả nợ của khách hàng
+3. Đề xuất cho cán bộ tín dụng
+4. Các điểm cần lưu ý
+Phân tích ngắn gọn nhưng đầy đủ, chuyên sâu."""
+
+
+class PromptBudgetError(ValueError):
+    """Prompt vượt ngân sách token cho phép"""
+
+
+def estimate_tokens(text):
+    """Ước lượng số token (tiếng Việt trung bình khoảng 3 ký tự/token)"""
+    return max(1, len(text) // 3) if text else 0
+
+
+def _is_empty(value):
+    return value is None or value == '' or value == 0 or (
+        isinstance(value, (Mapping, list, tuple)) and len(value) == 0
+    )
+
+
+def compact_value(value, field=None, max_text=None):
+    """Rút gọn đệ quy: bỏ trường trống/bằng 0, làm tròn số tiền và tỷ lệ"""
+    if isinstance(value, Mapping):
+        result = {}
+        for key, item in value.items():
+            item = compact_value(item, key, max_text)
+            if not _is_empty(item):
+                result[key] = item
+        return result
+    if isinstance(value, (list, tuple)):
+        items = [compact_value(item, field, max_text) for item in value]
+        return [item for item in items if not _is_empty(item)]
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)):
+        if field in MONEY_FIELDS:
+            millions = round(value / 1_000_000, 1)
+            return int(millions) if millions == int(millions) else millions
+        if field in RATIO_FIELDS or isinstance(value, float):
+            rounded = round(value, 1)
+            return int(rounded) if rounded == int(rounded) else rounded
+        return value
+    if isinstance(value, str):
+        text = ' '.join(value.split())
+        if max_text and len(text) > max_text:
+            text = text[:max_text].rstrip() + '…'
+        return text
+    return value
+
+
+def compact_data(data, max_text=None, drop_co_borrowers=False):
+    """Rút gọn dữ liệu hồ sơ trước khi đưa vào prompt"""
+    compact = compact_value(data, max_text=max_text)
+    borrowers = compact.get('khach_hang')
+    if borrowers:
+        # Khách hàng đầu tiên trùng với các trường ho_ten/cccd/... ở cấp ngoài
+        first = borrowers[0]
+        if first.get('ho_ten') == compact.get('ho_ten') and first.get('cccd') == compact.get('cccd'):
+            borrowers = borrowers[1:]
+        if drop_co_borrowers:
+            borrowers = [{'ho_ten': item.get('ho_ten', '')} for item in borrowers]
+        if borrowers:
+            compact['khach_hang'] = borrowers
+        else:
+            compact.pop('khach_hang')
+    return compact
+
+
+def serialize(data):
+    """JSON gọn nhất có thể (không thụt lề, không khoảng trắng thừa)"""
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'), default=dict)
+
+
+class PromptBuilder:
+    """Dựng prompt phân tích gọn nhẹ và kiểm soát số token trước khi gửi"""
+
+    def __init__(self, max_prompt_tokens=3000):
+        self.max_prompt_tokens = max_prompt_tokens
+
+    def build_analysis_prompt(self, data, data_source, extra=None):
+        """Trả về (prompt, số token ước lượng); thu gọn thêm nếu vượt ngân sách"""
+        extra_text = f"{extra}\n" if extra else ""
+        # Các mức rút gọn tăng dần: bình thường -> cắt văn bản dài -> chỉ giữ tên người đồng vay
+        for max_text, drop_co_borrowers in ((None, False), (300, False), (120, True)):
+            prompt = ANALYSIS_TEMPLATE.format(
+                data_source=data_source,
+                data=serialize(compact_data(data, max_text, drop_co_borrowers)),
+                extra=extra_text
+            )
+            tokens = estimate_tokens(prompt)
+            if tokens <= self.max_prompt_tokens:
+                return prompt, tokens
+        raise PromptBudgetError(
+            f"Prompt khoảng {tokens} token, vượt ngân sách {self.max_prompt_tokens} token"
+        )
@@ -0,0 +1,191 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_CACHE_DIR = os.path.join(os.environ.get('CADAP_DATA_DIR', 'data'), 'gemini_cache')
+
+
+def normalize_prompt(prompt):
+    """Chuẩn hóa prompt (gộp khoảng trắng) để các prompt tương đương có cùng khóa"""
+    return ' '.join(str(prompt).split())
+
+
+class ResponseCache:
+    """Cache phản hồi Gemini theo (tên model, hash prompt): tầng bộ nhớ LRU + tầng đĩa, có TTL
+
+    Tầng đĩa cũng giới hạn theo dung lượng và số file: định kỳ (khi ghi) xóa file hết hạn rồi xóa
+    các file lâu chưa dùng nhất (thời điểm sửa file được cập nhật mỗi lần đọc trúng).
+    """
+
+    def __init__(self, max_entries=256, ttl=6 * 3600, cache_dir=DEFAULT_CACHE_DIR, use_disk=True,
+                 max_disk_bytes=256 * 1024 * 1024, max_disk_entries=20000, prune_interval=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.cache_dir = cache_dir
+        self.use_disk = use_disk
+        self.max_disk_bytes = max_disk_bytes
+        self.max_disk_entries = max_disk_entries
+        self.prune_interval = prune_interval
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._prune_lock = threading.Lock()
+        self._last_prune = 0.0
+        self._stats = {
+            'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'writes': 0, 'expired': 0, 'disk_evictions': 0
+        }
+
+    @staticmethod
+    def make_key(model_name, prompt):
+        payload = f"{model_name}\n{normalize_prompt(prompt)}".encode('utf-8')
+        return hashlib.sha256(payload).hexdigest()
+
+    def get(self, key):
+        """Lấy phản hồi đã cache, trả về None nếu không có hoặc đã hết hạn"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self._stats['memory_hits'] += 1
+                    return value
+                del self._memory[key]
+                self._stats['expired'] += 1
+
+        entry = self._read_disk(key) if self.use_disk else None
+        if entry is not None and entry['expires_at'] > now:
+            self._touch_disk(key)
+        elif entry is not None:
+            self._remove_disk(self._path(key))
+        with self._lock:
+            if entry is not None and entry['expires_at'] > now:
+                self._store_memory(key, entry['expires_at'], entry['value'])
+                self._stats['disk_hits'] += 1
+                return entry['value']
+            if entry is not None:
+                self._stats['expired'] += 1
+            self._stats['misses'] += 1
+        return None
+
+    def set(self, key, value):
+        """Lưu phản hồi vào cả hai tầng"""
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._store_memory(key, expires_at, value)
+            self._stats['writes'] += 1
+        if self.use_disk:
+            self._write_disk(key, {'expires_at': expires_at, 'value': value})
+            if time.time() - self._last_prune >= self.prune_interval:
+                self.prune_disk()
+
+    def prune_disk(self):
+        """Xóa file hết hạn, rồi xóa file lâu chưa dùng nhất cho tới khi trong giới hạn; trả về số file đã xóa"""
+        if not self.use_disk or not os.path.isdir(self.cache_dir):
+            return 0
+        # Chỉ một luồng dọn tại một thời điểm, các luồng khác bỏ qua
+        if not self._prune_lock.acquire(blocking=False):
+            return 0
+        try:
+            now = time.time()
+            self._last_prune = now
+            removed = 0
+            files = []
+            for root, _, names in os.walk(self.cache_dir):
+                for name in names:
+                    path = os.path.join(root, name)
+                    try:
+                        info = os.stat(path)
+                    except OSError:
+                        continue
+                    if name.endswith('.tmp'):
+                        # File tạm của lần ghi bị gián đoạn
+                        if info.st_mtime < now - 3600:
+                            removed += self._remove_disk(path)
+                    elif name.endswith('.json'):
+                        # File được ghi (và cập nhật thời điểm sửa) không sớm hơn lần ghi cuối,
+                        # nên sửa lần cuối trước now - ttl thì chắc chắn đã hết hạn
+                        if info.st_mtime < now - self.ttl:
+                            removed += self._remove_disk(path)
+                        else:
+                            files.append((info.st_mtime, info.st_size, path))
+
+            files.sort()
+            total = sum(size for _, size, _ in files)
+            count = len(files)
+            for _, size, path in files:
+                if total <= self.max_disk_bytes and count <= self.max_disk_entries:
+                    break
+                removed += self._remove_disk(path)
+                total -= size
+                count -= 1
+            with self._lock:
+                self._stats['disk_evictions'] += removed
+            return removed
+        finally:
+            self._prune_lock.release()
+
+    def clear(self):
+        """Xóa toàn bộ cache (bộ nhớ và đĩa)"""
+        with self._lock:
+            self._memory.clear()
+        if self.use_disk and os.path.isdir(self.cache_dir):
+            for root, _, files in os.walk(self.cache_dir):
+                for name in files:
+                    if name.endswith('.json'):
+                        os.remove(os.path.join(root, name))
+
+    def stats(self):
+        """Thống kê hit/miss"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._memory)
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['memory_hits'] + stats['disk_hits']) / lookups if lookups else 0.0
+        return stats
+
+    def _store_memory(self, key, expires_at, value):
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _read_disk(self, key):
+        try:
+            with open(self._path(key), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _touch_disk(self, key):
+        """Đánh dấu file vừa được dùng (thứ tự LRU của tầng đĩa)"""
+        try:
+            os.utime(self._path(key))
+        except OSError:
+            pass
+
+    def _remove_disk(self, path):
+        try:
+            os.remove(path)
+            return 1
+        except OSError:
+            return 0
+
+    def _write_disk(self, key, entry):
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Ghi ra file tạm rồi đổi tên để không có tiến trình nào đọc phải file dở dang
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Lỗi khi ghi cache Gemini: {e}")
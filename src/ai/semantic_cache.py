@@ -0,0 +1,161 @@
+import hashlib
+import math
+import re
+import threading
+import time
+import uuid
+import zlib
+from collections import Counter, OrderedDict
+
+from src.logic.applicant_index import normalize_text
+from src.logic.document_index import STOPWORDS
+
+# Số trong câu hỏi (lãi suất, số tiền, thời hạn...): phải trùng khớp hoàn toàn mới dùng lại câu trả lời
+NUMBER = re.compile(r'\d+(?:[.,]\d+)*')
+
+# Từ đệm trong câu hỏi, bỏ đi để vector tập trung vào nội dung chính
+FILLER_WORDS = STOPWORDS | {'doi', 'toi', 've', 'o', 'biet', 'hoi', 'xin', 'vui', 'long', 'giup', 'em', 'minh'}
+
+
+def numeric_tokens(text):
+    """Các số trong câu hỏi theo thứ tự xuất hiện (dấu phẩy thập phân quy về dấu chấm)"""
+    return tuple(number.replace(',', '.') for number in NUMBER.findall(str(text or '')))
+
+
+def embed(text, dim=1024):
+    """Vector thưa (chỉ số -> trọng số) từ n-gram ký tự (3, 4) và từ, băm về dim chiều, chuẩn hóa L2"""
+    normalized = ' '.join(word for word in normalize_text(text).split() if word not in FILLER_WORDS)
+    padded = f" {normalized} "
+    features = [padded[i:i + n] for n in (3, 4) for i in range(len(padded) - n + 1)]
+    features += [f"w:{word}" for word in normalized.split()]
+    vector = Counter()
+    for feature in features:
+        digest = zlib.crc32(feature.encode('utf-8'))
+        # Bit cao quyết định dấu để giảm sai lệch do va chạm khi băm
+        vector[digest % dim] += 1.0 if digest & 0x80000000 else -1.0
+    norm = math.sqrt(sum(value * value for value in vector.values()))
+    return {index: value / norm for index, value in vector.items() if value} if norm else {}
+
+
+def cosine(a, b):
+    """Độ tương đồng cosine của hai vector thưa đã chuẩn hóa"""
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(value * b.get(index, 0.0) for index, value in a.items())
+
+
+class SemanticAnswerCache:
+    """Cache câu trả lời chatbox theo độ tương đồng câu hỏi (vector tính cục bộ), có LRU và TTL
+
+    Chỉ khớp với câu hỏi có cùng scope (hash tên model, và khi prompt có ngữ cảnh thì thêm dấu vân tay
+    hồ sơ, lịch sử hội thoại và đoạn trích tài liệu) và có đúng các số giống nhau: n-gram ký tự coi
+    "lãi suất 8%" và "lãi suất 9%" là gần như trùng nhau nhưng câu trả lời thì khác.
+    """
+
+    def __init__(self, threshold=0.85, max_entries=500, ttl=7 * 24 * 3600, dim=1024):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.dim = dim
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'writes': 0, 'evictions': 0, 'expired': 0}
+
+    @staticmethod
+    def make_scope(*parts):
+        """Khóa phạm vi cho câu trả lời phụ thuộc ngữ cảnh hồ sơ"""
+        return hashlib.sha1("\x1f".join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+    def lookup(self, question, scope=None):
+        """Tìm câu trả lời đã cache cho câu hỏi tương tự; trả về bản sao mục cache kèm 'do_tuong_dong' hoặc None"""
+        vector = embed(question, self.dim)
+        if not vector:
+            return None
+        numbers = numeric_tokens(question)
+        now = time.time()
+        best, best_score = None, self.threshold
+        with self._lock:
+            for entry_id in list(self._entries):
+                entry = self._entries[entry_id]
+                if entry['expires_at'] <= now:
+                    del self._entries[entry_id]
+                    self._stats['expired'] += 1
+                    continue
+                if entry['scope'] != scope or entry['so'] != numbers:
+                    continue
+                score = cosine(vector, entry['vector'])
+                if score >= best_score:
+                    best, best_score = entry, score
+            if best is None:
+                self._stats['misses'] += 1
+                return None
+            best['hits'] += 1
+            best['last_hit'] = now
+            self._entries.move_to_end(best['id'])
+            self._stats['hits'] += 1
+            hit = {key: value for key, value in best.items() if key != 'vector'}
+        hit['do_tuong_dong'] = best_score
+        return hit
+
+    def add(self, question, answer, scope=None, case_specific=False):
+        """Lưu cặp câu hỏi/câu trả lời, bỏ mục ít dùng nhất khi đầy"""
+        vector = embed(question, self.dim)
+        if not vector or not answer:
+            return None
+        now = time.time()
+        entry = {
+            'id': uuid.uuid4().hex[:12],
+            'question': question,
+            'answer': answer,
+            'scope': scope,
+            'theo_ho_so': case_specific,
+            'so': numeric_tokens(question),
+            'vector': vector,
+            'created_at': now,
+            'expires_at': now + self.ttl,
+            'last_hit': None,
+            'hits': 0
+        }
+        with self._lock:
+            self._entries[entry['id']] = entry
+            self._stats['writes'] += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+        return entry['id']
+
+    def purge(self, entry_ids):
+        """Xóa các mục theo mã"""
+        with self._lock:
+            removed = sum(1 for entry_id in entry_ids if self._entries.pop(entry_id, None) is not None)
+        return removed
+
+    def purge_older_than(self, seconds):
+        """Xóa các mục tạo trước thời điểm hiện tại - seconds"""
+        cutoff = time.time() - seconds
+        with self._lock:
+            stale = [entry_id for entry_id, entry in self._entries.items() if entry['created_at'] < cutoff]
+            for entry_id in stale:
+                del self._entries[entry_id]
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def list_entries(self):
+        """Danh sách mục cache (mới dùng gần nhất trước) cho trang quản trị"""
+        with self._lock:
+            entries = [
+                {key: value for key, value in entry.items() if key != 'vector'}
+                for entry in reversed(self._entries.values())
+            ]
+        return entries
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
@@ -0,0 +1,337 @@
+import asyncio
+import copy
+import random
+import threading
+import time
+from collections import deque
+
+# Lỗi tạm thời của Google API (google.api_core.exceptions) hoặc mạng, có thể thử lại
+RETRYABLE_ERRORS = {
+    'ResourceExhausted', 'TooManyRequests', 'ServiceUnavailable', 'DeadlineExceeded',
+    'InternalServerError', 'GatewayTimeout', 'BadGateway', 'ConnectionError', 'TimeoutError'
+}
+RETRYABLE_CODES = {429, 500, 502, 503, 504}
+
+
+class TransportError(Exception):
+    """Lỗi tầng kết nối Gemini"""
+
+
+class CircuitOpenError(TransportError):
+    """Bộ ngắt mạch đang mở, từ chối yêu cầu ngay lập tức"""
+
+
+class RateLimitTimeout(TransportError):
+    """Chờ quá lâu để được cấp lượt gọi"""
+
+
+def is_retryable(error):
+    """Xác định lỗi tạm thời (quota, quá tải, timeout) có thể thử lại"""
+    if type(error).__name__ in RETRYABLE_ERRORS:
+        return True
+    code = getattr(error, 'code', None)
+    code = getattr(code, 'value', code)
+    return code in RETRYABLE_CODES
+
+
+class TokenBucket:
+    """Bộ giới hạn tốc độ token bucket, an toàn đa luồng"""
+
+    def __init__(self, rate, capacity, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self._tokens = float(capacity)
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _reserve(self, tokens, keep=0):
+        """Lấy token nếu đủ (và còn lại ít nhất keep token), nếu không trả về thời gian cần chờ (giây)"""
+        needed = tokens + min(keep, self.capacity - tokens)
+        with self._lock:
+            now = self.clock()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= needed:
+                self._tokens -= tokens
+                return 0.0
+            return (needed - self._tokens) / self.rate
+
+    def acquire(self, tokens=1, timeout=None, sleep=time.sleep, keep=0):
+        """Chờ tới khi có token; trả về tổng thời gian đã chờ
+
+        keep: số token phải để lại cho yêu cầu ưu tiên hơn (yêu cầu nền không được lấy phần này).
+        """
+        waited = 0.0
+        while True:
+            wait = self._reserve(tokens, keep)
+            if wait == 0:
+                return waited
+            if timeout is not None and waited + wait > timeout:
+                raise RateLimitTimeout(f"Chờ lượt gọi Gemini quá {timeout:.0f}s")
+            sleep(wait)
+            waited += wait
+
+    async def acquire_async(self, tokens=1, timeout=None, sleep=asyncio.sleep, keep=0):
+        waited = 0.0
+        while True:
+            wait = self._reserve(tokens, keep)
+            if wait == 0:
+                return waited
+            if timeout is not None and waited + wait > timeout:
+                raise RateLimitTimeout(f"Chờ lượt gọi Gemini quá {timeout:.0f}s")
+            await sleep(wait)
+            waited += wait
+
+
+class CircuitBreaker:
+    """Bộ ngắt mạch: mở sau nhiều lỗi liên tiếp, thử lại một yêu cầu sau thời gian hồi phục"""
+
+    CLOSED = 'dong'
+    OPEN = 'mo'
+    HALF_OPEN = 'nua_mo'
+
+    def __init__(self, failure_threshold=5, recovery_timeout=30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.clock = clock
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Kiểm tra yêu cầu có được phép gửi đi không"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and self.clock() - self._opened_at >= self.recovery_timeout:
+                self.state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self.state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def retry_after(self):
+        with self._lock:
+            return max(0.0, self.recovery_timeout - (self.clock() - self._opened_at))
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def release_trial(self):
+        """Yêu cầu thử bị hủy giữa chừng (chưa biết kết quả): cho phép một yêu cầu thử khác"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened_at = self.clock()
+                self._trial_in_flight = False
+
+
+class TransportMetrics:
+    """Bộ đếm độ trễ, số lần thử lại và lỗi"""
+
+    def __init__(self, window=500):
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=window)
+        self.counters = {
+            'calls': 0, 'successes': 0, 'errors': 0, 'retries': 0,
+            'circuit_rejections': 0, 'rate_limit_wait': 0.0
+        }
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def observe(self, latency):
+        with self._lock:
+            self._latencies.append(latency)
+
+    def snapshot(self):
+        with self._lock:
+            data = dict(self.counters)
+            latencies = sorted(self._latencies)
+        if latencies:
+            data['latency_p50'] = latencies[len(latencies) // 2]
+            data['latency_p95'] = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        else:
+            data['latency_p50'] = data['latency_p95'] = 0.0
+        return data
+
+
+class GeminiTransport:
+    """Tầng gọi Gemini có thử lại (backoff mũ + jitter), giới hạn tốc độ và ngắt mạch"""
+
+    def __init__(self, max_retries=3, base_delay=0.5, max_delay=8.0, rate=2.0, burst=5,
+                 failure_threshold=5, recovery_timeout=30.0, acquire_timeout=60.0,
+                 sleep=time.sleep, clock=time.monotonic, async_sleep=None):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.acquire_timeout = acquire_timeout
+        self.sleep = sleep
+        if async_sleep is None:
+            async_sleep = asyncio.sleep if sleep is time.sleep else self._wrap_sleep(sleep)
+        self.async_sleep = async_sleep
+        self.clock = clock
+        self.bucket = TokenBucket(rate, burst, clock=clock)
+        self.breaker = CircuitBreaker(failure_threshold, recovery_timeout, clock=clock)
+        self.metrics = TransportMetrics()
+        # Số token để lại cho yêu cầu tương tác (chỉ khác 0 ở bản dùng cho tác vụ nền)
+        self.reserved = 0
+
+    def background(self, reserved=None):
+        """Bản dùng cho tác vụ nền (thẩm định hàng loạt): chung quota, ngắt mạch và thống kê,
+        nhưng luôn để lại reserved token (mặc định nửa burst) cho chat/phân tích tương tác"""
+        view = copy.copy(self)
+        view.reserved = max(1, self.bucket.capacity // 2) if reserved is None else reserved
+        return view
+
+    @staticmethod
+    def _wrap_sleep(sleep):
+        """Dùng hàm sleep được truyền vào (ví dụ đồng hồ giả khi kiểm thử) cho cả nhánh bất đồng bộ"""
+        async def async_sleep(delay):
+            sleep(delay)
+        return async_sleep
+
+    def backoff(self, attempt):
+        """Thời gian chờ trước lần thử lại thứ attempt (full jitter)"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def _before_attempt(self):
+        if not self.breaker.allow():
+            self.metrics.incr('circuit_rejections')
+            raise CircuitOpenError(
+                f"Dịch vụ Gemini đang gián đoạn, vui lòng thử lại sau {self.breaker.retry_after():.0f}s"
+            )
+
+    def _after_error(self, error, attempt):
+        """Ghi nhận lỗi; trả về True nếu nên thử lại"""
+        self.metrics.incr('errors')
+        if not is_retryable(error):
+            # Lỗi nghiệp vụ (sai tham số, sai key...) nghĩa là dịch vụ vẫn phản hồi bình thường
+            self.breaker.record_success()
+            return False
+        self.breaker.record_failure()
+        if attempt >= self.max_retries:
+            return False
+        self.metrics.incr('retries')
+        return True
+
+    def _acquire(self):
+        """Chờ lượt gọi; nếu không được cấp thì trả lại lượt thử của bộ ngắt mạch"""
+        try:
+            waited = self.bucket.acquire(timeout=self.acquire_timeout, sleep=self.sleep, keep=self.reserved)
+            self.metrics.incr('rate_limit_wait', waited)
+        except BaseException:
+            self.breaker.release_trial()
+            raise
+
+    def _on_success(self, start):
+        self.breaker.record_success()
+        self.metrics.incr('successes')
+        self.metrics.observe(self.clock() - start)
+
+    def call(self, fn, *args, **kwargs):
+        """Gọi đồng bộ qua tầng kết nối"""
+        self.metrics.incr('calls')
+        attempt = 0
+        while True:
+            self._before_attempt()
+            self._acquire()
+            start = self.clock()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                if not self._after_error(e, attempt):
+                    raise
+                self.sleep(self.backoff(attempt))
+                attempt += 1
+                continue
+            except BaseException:
+                # KeyboardInterrupt...: không có kết quả, trả lại lượt thử của bộ ngắt mạch
+                self.breaker.release_trial()
+                raise
+            self._on_success(start)
+            return result
+
+    async def call_async(self, fn, *args, **kwargs):
+        """Gọi bất đồng bộ qua tầng kết nối"""
+        self.metrics.incr('calls')
+        attempt = 0
+        while True:
+            self._before_attempt()
+            try:
+                waited = await self.bucket.acquire_async(
+                    timeout=self.acquire_timeout, sleep=self.async_sleep, keep=self.reserved
+                )
+            except BaseException:
+                self.breaker.release_trial()
+                raise
+            self.metrics.incr('rate_limit_wait', waited)
+            start = self.clock()
+            try:
+                result = await fn(*args, **kwargs)
+            except Exception as e:
+                if not self._after_error(e, attempt):
+                    raise
+                await self.async_sleep(self.backoff(attempt))
+                attempt += 1
+                continue
+            except BaseException:
+                # CancelledError: không có kết quả, trả lại lượt thử của bộ ngắt mạch
+                self.breaker.release_trial()
+                raise
+            self._on_success(start)
+            return result
+
+    def stream(self, open_stream):
+        """Streaming: chỉ thử lại trước khi nhận được đoạn đầu tiên"""
+        self.metrics.incr('calls')
+        attempt = 0
+        while True:
+            self._before_attempt()
+            self._acquire()
+            start = self.clock()
+            try:
+                iterator = iter(open_stream())
+                first = next(iterator, None)
+            except Exception as e:
+                if not self._after_error(e, attempt):
+                    raise
+                self.sleep(self.backoff(attempt))
+                attempt += 1
+                continue
+            except BaseException:
+                self.breaker.release_trial()
+                raise
+            break
+
+        try:
+            if first is not None:
+                yield first
+            yield from iterator
+        except Exception as e:
+            self._after_error(e, self.max_retries)
+            raise
+        except BaseException:
+            # Người dùng ngừng đọc (GeneratorExit) hoặc bị hủy: không có kết quả, trả lại lượt thử
+            self.breaker.release_trial()
+            raise
+        self._on_success(start)
+
+    def get_stats(self):
+        """Thống kê cho trang theo dõi"""
+        stats = self.metrics.snapshot()
+        stats['circuit_state'] = self.breaker.state
+        return stats
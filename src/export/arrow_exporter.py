@@ -0,0 +1,225 @@
+import json
+import os
+from datetime import datetime, timezone
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from src.logic.financial_calculator import FinancialCalculator
+
+# Tăng khi thay đổi schema không tương thích ngược
+SCHEMA_VERSION = '1'
+PARTITION_COLUMN = 'thang_tao'
+
+CUSTOMER_FIELDS = ['ho_ten', 'cccd', 'dia_chi', 'dien_thoai']
+FINANCIAL_FIELDS = [
+    ('tong_nhu_cau_von', pa.float64()), ('von_doi_ung', pa.float64()), ('so_tien_vay', pa.float64()),
+    ('ty_le_von_doi_ung', pa.float64()), ('lai_suat', pa.float64()), ('thoi_gian_vay', pa.int32()),
+    ('muc_dich_vay', pa.string())
+]
+COLLATERAL_FIELDS = [
+    ('loai_tai_san', pa.string()), ('gia_tri_thi_truong', pa.float64()), ('dia_chi_tai_san', pa.string()),
+    ('ltv', pa.float64()), ('giay_to_phap_ly', pa.string())
+]
+METRIC_FIELDS = ['monthly_payment', 'dsr_ratio', 'ltv', 'safety_margin']
+SCHEDULE_FIELDS = ['tra_goc', 'tra_lai', 'tong_tra', 'goc_con_lai']
+
+_METADATA = {b'cadap_schema_version': SCHEMA_VERSION.encode()}
+
+CASES_SCHEMA = pa.schema(
+    [
+        ('case_id', pa.string()),
+        ('chi_nhanh', pa.string()),
+        ('created_at', pa.timestamp('ms', tz='UTC')),
+        ('updated_at', pa.timestamp('ms', tz='UTC')),
+    ]
+    + [(field, pa.string()) for field in CUSTOMER_FIELDS]
+    + FINANCIAL_FIELDS
+    + [('collateral_' + field, dtype) for field, dtype in COLLATERAL_FIELDS]
+    + [('original_json', pa.string())],
+    metadata=_METADATA
+)
+
+METRICS_SCHEMA = pa.schema(
+    [('case_id', pa.string())] + [(field, pa.float64()) for field in METRIC_FIELDS],
+    metadata=_METADATA
+)
+
+SCHEDULES_SCHEMA = pa.schema(
+    [('case_id', pa.string()), ('thang', pa.int32())] + [(field, pa.int64()) for field in SCHEDULE_FIELDS],
+    metadata=_METADATA
+)
+
+TABLES = {
+    'cases': CASES_SCHEMA,
+    'metrics': METRICS_SCHEMA,
+    'schedules': SCHEDULES_SCHEMA
+}
+
+
+def _to_float(value):
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _to_int(value):
+    try:
+        return int(value or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _timestamp(value):
+    return datetime.fromtimestamp(value or 0, tz=timezone.utc)
+
+
+class _PartitionedWriter:
+    """Ghi một bảng Parquet phân vùng theo tháng, đẩy dữ liệu ra đĩa theo từng lô
+
+    Tổng số dòng đệm của mọi phân vùng không vượt quá batch_size (bộ nhớ không tăng theo số tháng):
+    khi đầy, phân vùng đang đệm nhiều nhất được ghi ra trước.
+    """
+
+    def __init__(self, root, schema, batch_size):
+        self.root = root
+        self.schema = schema
+        self.batch_size = batch_size
+        self.rows_written = 0
+        self._buffers = {}
+        self._buffered = 0
+        self._writers = {}
+
+    def append(self, partition, row):
+        buffer = self._buffers.setdefault(partition, {name: [] for name in self.schema.names})
+        for name in self.schema.names:
+            buffer[name].append(row.get(name))
+        self._buffered += 1
+        if self._buffered >= self.batch_size:
+            self._flush(max(self._buffers, key=lambda key: len(self._buffers[key]['case_id'])))
+
+    def _flush(self, partition):
+        buffer = self._buffers.pop(partition, None)
+        if not buffer or not buffer['case_id']:
+            return
+        self._buffered -= len(buffer['case_id'])
+        batch = pa.RecordBatch.from_pydict(buffer, schema=self.schema)
+        writer = self._writers.get(partition)
+        if writer is None:
+            directory = os.path.join(self.root, f"{PARTITION_COLUMN}={partition}")
+            os.makedirs(directory, exist_ok=True)
+            writer = pq.ParquetWriter(os.path.join(directory, 'part-0.parquet'), self.schema, compression='zstd')
+            self._writers[partition] = writer
+        writer.write_batch(batch)
+        self.rows_written += batch.num_rows
+
+    def close(self):
+        for partition in list(self._buffers):
+            self._flush(partition)
+        for writer in self._writers.values():
+            writer.close()
+        self._writers = {}
+
+
+class ArrowExporter:
+    def __init__(self, batch_size=50000):
+        self.batch_size = batch_size
+        self.calculator = FinancialCalculator()
+
+    def export_cases(self, store, output_dir, chi_nhanh=None, include_schedules=True):
+        """Xuất hàng loạt hồ sơ, chỉ số và lịch trả nợ ra dataset Parquet phân vùng theo tháng"""
+        writers = {
+            table: _PartitionedWriter(os.path.join(output_dir, table), schema, self.batch_size)
+            for table, schema in TABLES.items()
+            if include_schedules or table != 'schedules'
+        }
+        try:
+            for case in store.iter_cases(chi_nhanh=chi_nhanh):
+                # created_at lưu theo UTC, phân vùng cũng theo tháng UTC
+                partition = _timestamp(case['created_at']).strftime('%Y-%m')
+                writers['cases'].append(partition, self._case_row(case))
+
+                financial = case.get('financial', {})
+                metrics = self.calculator.calculate_financial_metrics(
+                    financial, case.get('customer', {}), case.get('collateral', {})
+                )
+                metrics_row = {'case_id': case['case_id']}
+                metrics_row.update({field: metrics.get(field) for field in METRIC_FIELDS})
+                writers['metrics'].append(partition, metrics_row)
+
+                if include_schedules:
+                    for row in self.calculator.iter_payment_schedule(financial):
+                        row = dict(row, case_id=case['case_id'])
+                        writers['schedules'].append(partition, row)
+        finally:
+            for writer in writers.values():
+                writer.close()
+
+        return {table: writer.rows_written for table, writer in writers.items()}
+
+    def import_cases(self, store, input_dir):
+        """Nhập hồ sơ từ dataset Parquet vào kho hồ sơ; chỉ số và lịch trả nợ được tính lại từ dữ liệu tài chính"""
+        imported = 0
+        for batch in self.iter_batches(input_dir, 'cases'):
+            for row in batch.to_pylist():
+                store.save_case(
+                    row['case_id'],
+                    self._row_to_sections(row),
+                    chi_nhanh=row.get('chi_nhanh') or '',
+                    created_at=row['created_at'].timestamp() if row.get('created_at') else None
+                )
+                imported += 1
+        return imported
+
+    def iter_batches(self, input_dir, table):
+        """Đọc lần lượt từng lô của một bảng theo schema chuẩn"""
+        schema = TABLES[table]
+        path = os.path.join(input_dir, table)
+        if not os.path.isdir(path):
+            return
+        dataset = ds.dataset(path, format='parquet', partitioning='hive')
+        version = (dataset.schema.metadata or {}).get(b'cadap_schema_version')
+        if version and version.decode() != SCHEMA_VERSION:
+            raise ValueError(f"Phiên bản schema không tương thích: {version.decode()}")
+        for batch in dataset.to_batches(columns=schema.names, batch_size=self.batch_size):
+            if batch.schema == schema:
+                yield batch
+                continue
+            # RecordBatch.cast chỉ có từ pyarrow 16, ép kiểu qua Table để chạy được với pyarrow>=12
+            yield from pa.Table.from_batches([batch]).cast(schema).to_batches()
+
+    def _case_row(self, case):
+        customer = case.get('customer', {})
+        financial = case.get('financial', {})
+        collateral = case.get('collateral', {})
+        row = {
+            'case_id': case['case_id'],
+            'chi_nhanh': case.get('chi_nhanh', ''),
+            'created_at': _timestamp(case.get('created_at')),
+            'updated_at': _timestamp(case.get('updated_at')),
+            'original_json': json.dumps(case.get('original', {}), ensure_ascii=False)
+        }
+        for field in CUSTOMER_FIELDS:
+            row[field] = str(customer.get(field, '') or '')
+        for field, dtype in FINANCIAL_FIELDS:
+            row[field] = self._convert(financial.get(field), dtype)
+        for field, dtype in COLLATERAL_FIELDS:
+            row['collateral_' + field] = self._convert(collateral.get(field), dtype)
+        return row
+
+    def _row_to_sections(self, row):
+        return {
+            'customer': {field: row.get(field) or '' for field in CUSTOMER_FIELDS},
+            'financial': {field: row.get(field) for field, _ in FINANCIAL_FIELDS},
+            'collateral': {field: row.get('collateral_' + field) for field, _ in COLLATERAL_FIELDS},
+            'original': json.loads(row.get('original_json') or '{}')
+        }
+
+    def _convert(self, value, dtype):
+        if pa.types.is_floating(dtype):
+            return _to_float(value)
+        if pa.types.is_integer(dtype):
+            return _to_int(value)
+        return str(value or '')
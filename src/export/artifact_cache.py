@@ -0,0 +1,75 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+
+def content_hash(value):
+    """Hash nội dung dữ liệu (dict/list) để làm một phần khóa cache"""
+    raw = json.dumps(value, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class ExportArtifactCache:
+    """Cache file xuất (Excel/Word/PDF) theo hash dữ liệu đầu vào và phiên bản mẫu, LRU giới hạn dung lượng
+
+    Cùng dữ liệu và cùng mẫu thì tải về ngay bytes đã tạo; dữ liệu hoặc mẫu đổi thì khóa đổi theo.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, max_entry_bytes=16 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    @staticmethod
+    def make_key(kind, *parts):
+        """Khóa từ loại file và các thành phần (hash dữ liệu, phiên bản mẫu, tùy chọn xuất)"""
+        return hashlib.sha256("|".join([kind] + [str(part) for part in parts]).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is None:
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return data
+
+    def put(self, key, data):
+        # File quá lớn không giữ lại để không đẩy hết các mục khác ra khỏi cache
+        if data is None or len(data) > self.max_entry_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous)
+            self._entries[key] = data
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self._stats['evictions'] += 1
+
+    def get_or_create(self, key, factory):
+        """Bytes đã cache, hoặc tạo bằng factory() rồi lưu lại"""
+        data = self.get(key)
+        if data is None:
+            data = factory()
+            self.put(key, data)
+        return data
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = self._bytes
+        return stats
@@ -0,0 +1,133 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+# Kích thước (inch) của từng loại biểu đồ, dùng chung cho giao diện và báo cáo
+SCHEDULE_CHART_SIZE = (15, 5)
+PIE_CHART_SIZE = (6, 6)
+
+
+class ChartRenderer:
+    """Vẽ biểu đồ thành ảnh PNG/SVG một lần và dùng lại theo hash dữ liệu (LRU giới hạn số mục và dung lượng)
+
+    Dùng Figure trực tiếp (không qua pyplot) nên figure không bị giữ lại trong bộ quản lý của pyplot
+    và được giải phóng ngay sau khi lưu ảnh.
+    """
+
+    def __init__(self, max_entries=64, max_bytes=32 * 1024 * 1024, dpi=100):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.dpi = dpi
+        self._cache = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'renders': 0, 'evictions': 0}
+
+    def _key(self, kind, fmt, payload):
+        raw = json.dumps([kind, fmt, self.dpi, payload], ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _render(self, kind, fmt, payload, size, draw):
+        key = self._key(kind, fmt, payload)
+        with self._lock:
+            image = self._cache.get(key)
+            if image is not None:
+                self._cache.move_to_end(key)
+                self._stats['hits'] += 1
+                return image
+
+        # Nạp matplotlib ở lần vẽ đầu tiên (không làm chậm khởi động ứng dụng)
+        from matplotlib.figure import Figure
+
+        fig = Figure(figsize=size, dpi=self.dpi)
+        try:
+            draw(fig, payload)
+            fig.tight_layout()
+            buffer = BytesIO()
+            fig.savefig(buffer, format=fmt)
+            image = buffer.getvalue()
+        finally:
+            fig.clear()
+            del fig
+
+        with self._lock:
+            self._stats['renders'] += 1
+            if key not in self._cache:
+                self._cache[key] = image
+                self._bytes += len(image)
+            while self._cache and (len(self._cache) > self.max_entries or self._bytes > self.max_bytes):
+                _, evicted = self._cache.popitem(last=False)
+                self._bytes -= len(evicted)
+                self._stats['evictions'] += 1
+        return image
+
+    def payment_schedule_chart(self, payment_schedule, fmt='png'):
+        """Dư nợ gốc theo thời gian và phân bổ gốc/lãi; None nếu không có dữ liệu"""
+        if not payment_schedule:
+            return None
+        payload = [
+            [row['thang'], row['tra_goc'], row['tra_lai'], row['goc_con_lai']] for row in payment_schedule
+        ]
+        return self._render('lich_tra_no', fmt, payload, SCHEDULE_CHART_SIZE, self._draw_payment_schedule)
+
+    def financial_pie_chart(self, financial_data, fmt='png'):
+        """Phân bổ nguồn vốn (vốn vay / vốn đối ứng); None nếu không có dữ liệu"""
+        if not financial_data:
+            return None
+        payload = [financial_data.get('so_tien_vay', 0) or 0, financial_data.get('von_doi_ung', 0) or 0]
+        if sum(payload) == 0:
+            return None
+        return self._render('nguon_von', fmt, payload, PIE_CHART_SIZE, self._draw_financial_pie)
+
+    @staticmethod
+    def _draw_payment_schedule(fig, rows):
+        ax1, ax2 = fig.subplots(1, 2)
+        months = [row[0] for row in rows]
+
+        # Biểu đồ dòng tiền
+        ax1.plot(months, [row[3] for row in rows], marker='o', linewidth=2)
+        ax1.set_title('Dư nợ gốc theo thời gian')
+        ax1.set_xlabel('Tháng')
+        ax1.set_ylabel('Dư nợ gốc (VNĐ)')
+        ax1.grid(True, alpha=0.3)
+        ax1.tick_params(axis='x', rotation=45)
+
+        # Biểu đồ phân bổ trả nợ (khoảng 10 mốc)
+        sampled = rows[::max(1, len(rows) // 10)]
+        x = range(len(sampled))
+        width = 0.35
+        ax2.bar(x, [row[1] for row in sampled], width, label='Trả gốc', alpha=0.7)
+        ax2.bar([i + width for i in x], [row[2] for row in sampled], width, label='Trả lãi', alpha=0.7)
+        ax2.set_title('Phân bổ trả nợ theo tháng')
+        ax2.set_xlabel('Tháng')
+        ax2.set_ylabel('Số tiền (VNĐ)')
+        ax2.legend()
+        ax2.grid(True, alpha=0.3)
+        ax2.set_xticks([i + width / 2 for i in x])
+        ax2.set_xticklabels([row[0] for row in sampled], rotation=45)
+
+    @staticmethod
+    def _draw_financial_pie(fig, sizes):
+        ax = fig.subplots()
+        wedges, texts, autotexts = ax.pie(
+            sizes, labels=['Vốn vay', 'Vốn đối ứng'], colors=['#ff9999', '#66b3ff'],
+            autopct='%1.1f%%', startangle=90
+        )
+        for autotext in autotexts:
+            autotext.set_color('white')
+            autotext.set_fontweight('bold')
+        ax.set_title('Phân bổ nguồn vốn')
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._cache)
+            stats['bytes'] = self._bytes
+        return stats
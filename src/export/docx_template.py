@@ -0,0 +1,310 @@
+import hashlib
+import os
+import re
+import struct
+import zipfile
+from io import BytesIO
+
+DEFAULT_TEMPLATE_PATH = os.environ.get('CADAP_REPORT_TEMPLATE', os.path.join('config', 'report_template.docx'))
+
+DOCUMENT_PART = 'word/document.xml'
+RELS_PART = 'word/_rels/document.xml.rels'
+CONTENT_TYPES_PART = '[Content_Types].xml'
+
+# Loại placeholder: {{ten}} là văn bản, {{bang:ten}} là bảng, {{anh:ten}} là ảnh PNG
+SLOT_TEXT = 'doan'
+SLOT_TABLE = 'bang'
+SLOT_IMAGE = 'anh'
+
+EMU_PER_INCH = 914400
+TWIPS_PER_INCH = 1440
+
+NS_WP = 'http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing'
+NS_A = 'http://schemas.openxmlformats.org/drawingml/2006/main'
+NS_PIC = 'http://schemas.openxmlformats.org/drawingml/2006/picture'
+NS_R = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+IMAGE_REL_TYPE = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/image'
+
+_PARAGRAPH = re.compile(r'<w:p(?:\s[^>]*)?(?<!/)>.*?</w:p>', re.S)
+_TEXT = re.compile(r'(<w:t(?:\s[^>]*)?>)(.*?)(</w:t>)', re.S)
+_PARAGRAPH_PROPS = re.compile(r'<w:pPr>.*?</w:pPr>|<w:pPr/>', re.S)
+_PLACEHOLDER = re.compile(r'\{\{\s*(?:(bang|anh):)?(\w+)\s*\}\}')
+
+_BORDERS = ''.join(
+    f'<w:{side} w:val="single" w:sz="4" w:space="0" w:color="808080"/>'
+    for side in ('top', 'left', 'bottom', 'right', 'insideH', 'insideV')
+)
+_LINE_BREAK = '</w:t><w:br/><w:t xml:space="preserve">'
+
+
+def escape(text):
+    """Escape ký tự đặc biệt XML trong văn bản (không dùng xml.sax.saxutils vì module này kéo theo urllib)"""
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+def unescape(text):
+    return (text.replace('&lt;', '<').replace('&gt;', '>').replace('&quot;', '"').replace('&apos;', "'")
+            .replace('&amp;', '&'))
+
+
+def build_default_template():
+    """Mẫu báo cáo thẩm định mặc định (dựng bằng python-docx), dùng khi chi nhánh chưa có mẫu riêng"""
+    from docx import Document
+
+    doc = Document()
+    title = doc.add_heading('BÁO CÁO THẨM ĐỊNH TÍN DỤNG', 0)
+    title.alignment = 1
+    doc.add_paragraph("Ngày lập: {{ngay_lap}}")
+
+    sections = [
+        ('I. THÔNG TIN KHÁCH HÀNG', [
+            ("Họ và tên", 'ho_ten'), ("CCCD/CMND", 'cccd'), ("Địa chỉ", 'dia_chi'), ("Số điện thoại", 'dien_thoai')
+        ]),
+        ('II. THÔNG TIN TÀI CHÍNH', [
+            ("Tổng nhu cầu vốn", 'tong_nhu_cau_von'), ("Vốn đối ứng", 'von_doi_ung'),
+            ("Số tiền vay", 'so_tien_vay'), ("Lãi suất", 'lai_suat'), ("Thời gian vay", 'thoi_gian_vay'),
+            ("Mục đích vay", 'muc_dich_vay')
+        ]),
+        ('III. CHỈ SỐ TÀI CHÍNH', [
+            ("Nghĩa vụ trả nợ hàng tháng", 'monthly_payment'), ("Tỷ lệ trả nợ (DSR)", 'dsr_ratio'),
+            ("LTV", 'ltv'), ("Biên an toàn trả nợ", 'safety_margin')
+        ])
+    ]
+    for heading, fields in sections:
+        doc.add_heading(heading, level=1)
+        for label, key in fields:
+            doc.add_paragraph(f"{label}: {{{{{key}}}}}")
+
+    doc.add_heading('IV. KẾ HOẠCH TRẢ NỢ', level=1)
+    doc.add_paragraph("{{bang:lich_tra_no}}")
+
+    # Đoạn chỉ gồm một placeholder sẽ bị bỏ khi giá trị là None (báo cáo không kèm biểu đồ)
+    doc.add_heading("{{tieu_de_bieu_do}}", level=1)
+    doc.add_paragraph("{{anh:bieu_do_nguon_von}}").alignment = 1
+    doc.add_paragraph("{{anh:bieu_do_lich_tra_no}}").alignment = 1
+
+    output = BytesIO()
+    doc.save(output)
+    return output.getvalue()
+
+
+def _merge_split_placeholders(paragraph):
+    """Gộp placeholder bị Word tách qua nhiều run vào run chứa ký tự đầu tiên của nó
+
+    Trả về (XML đoạn đã gộp, toàn bộ văn bản của đoạn).
+    """
+    matches = list(_TEXT.finditer(paragraph))
+    texts = [unescape(match.group(2)) for match in matches]
+    full = ''.join(texts)
+    owners = [index for index, text in enumerate(texts) for _ in text]
+    for placeholder in _PLACEHOLDER.finditer(full):
+        first = owners[placeholder.start()]
+        for position in range(placeholder.start(), placeholder.end()):
+            owners[position] = first
+
+    merged = [[] for _ in texts]
+    for char, owner in zip(full, owners):
+        merged[owner].append(char)
+
+    pieces = []
+    last = 0
+    for match, chars, original in zip(matches, merged, texts):
+        text = ''.join(chars)
+        pieces.append(paragraph[last:match.start()])
+        if text == original:
+            pieces.append(match.group(0))
+        else:
+            pieces.append(f'<w:t xml:space="preserve">{escape(text)}</w:t>')
+        last = match.end()
+    pieces.append(paragraph[last:])
+    return ''.join(pieces), full
+
+
+def _text_xml(value):
+    if value is None:
+        return ''
+    return escape(str(value)).replace('\n', _LINE_BREAK)
+
+
+def _table_xml(value):
+    """Bảng Word từ (cột, dòng): cột là [(tiêu đề, độ rộng inch, căn lề)], dòng là iterable các giá trị"""
+    columns, rows = value
+    widths = [int(width * TWIPS_PER_INCH) for _, width, _ in columns]
+    grid = ''.join(f'<w:gridCol w:w="{width}"/>' for width in widths)
+    prefixes = [
+        f'<w:tc><w:tcPr><w:tcW w:w="{width}" w:type="dxa"/></w:tcPr>'
+        f'<w:p><w:pPr><w:spacing w:before="0" w:after="0"/><w:jc w:val="{align}"/></w:pPr>'
+        for width, (_, _, align) in zip(widths, columns)
+    ]
+    header = ''.join(
+        f'{prefix}<w:r><w:rPr><w:b/></w:rPr><w:t xml:space="preserve">{escape(label)}</w:t></w:r></w:p></w:tc>'
+        for prefix, (label, _, _) in zip(prefixes, columns)
+    )
+    body = ''.join(
+        '<w:tr>' + ''.join(
+            f'{prefix}<w:r><w:t xml:space="preserve">{_text_xml(cell)}</w:t></w:r></w:p></w:tc>'
+            for prefix, cell in zip(prefixes, row)
+        ) + '</w:tr>'
+        for row in rows
+    )
+    # Dòng tiêu đề lặp lại ở đầu mỗi trang; thêm một đoạn trống sau bảng (bắt buộc nếu bảng nằm trong ô)
+    return (
+        f'<w:tbl><w:tblPr><w:tblW w:w="0" w:type="auto"/><w:tblBorders>{_BORDERS}</w:tblBorders>'
+        f'<w:tblLayout w:type="fixed"/></w:tblPr><w:tblGrid>{grid}</w:tblGrid>'
+        f'<w:tr><w:trPr><w:tblHeader/></w:trPr>{header}</w:tr>{body}</w:tbl><w:p/>'
+    )
+
+
+def _image_xml(rel_id, index, png, width, paragraph_props):
+    """Đoạn chứa ảnh inline; chiều cao tính theo tỷ lệ ảnh (đọc từ header PNG)"""
+    pixel_width, pixel_height = struct.unpack('>II', png[16:24])
+    cx = int(width * EMU_PER_INCH)
+    cy = int(cx * pixel_height / pixel_width)
+    return (
+        f'<w:p>{paragraph_props}<w:r><w:drawing>'
+        f'<wp:inline xmlns:wp="{NS_WP}" distT="0" distB="0" distL="0" distR="0">'
+        f'<wp:extent cx="{cx}" cy="{cy}"/><wp:docPr id="{index}" name="Hình {index}"/>'
+        f'<a:graphic xmlns:a="{NS_A}"><a:graphicData uri="{NS_PIC}"><pic:pic xmlns:pic="{NS_PIC}">'
+        f'<pic:nvPicPr><pic:cNvPr id="{index}" name="{rel_id}.png"/><pic:cNvPicPr/></pic:nvPicPr>'
+        f'<pic:blipFill><a:blip xmlns:r="{NS_R}" r:embed="{rel_id}"/><a:stretch><a:fillRect/></a:stretch></pic:blipFill>'
+        f'<pic:spPr><a:xfrm><a:off x="0" y="0"/><a:ext cx="{cx}" cy="{cy}"/></a:xfrm>'
+        f'<a:prstGeom prst="rect"><a:avLst/></a:prstGeom></pic:spPr>'
+        f'</pic:pic></a:graphicData></a:graphic></wp:inline></w:drawing></w:r></w:p>'
+    )
+
+
+class DocxTemplate:
+    """Mẫu Word biên dịch sẵn: document.xml được tách một lần thành các đoạn XML tĩnh và các ô dữ liệu
+
+    Khi xuất báo cáo chỉ ghép chuỗi (văn bản, bảng, ảnh ghi thẳng dạng XML) rồi nối vào gói zip
+    các phần tĩnh đã nén sẵn, không dựng lại cây đối tượng của python-docx.
+    Giới hạn: placeholder phải nằm trong một đoạn văn (không hỗ trợ đoạn lồng trong textbox).
+    """
+
+    def __init__(self, template_bytes):
+        with zipfile.ZipFile(BytesIO(template_bytes)) as archive:
+            document = archive.read(DOCUMENT_PART).decode('utf-8')
+            self._rels = archive.read(RELS_PART).decode('utf-8')
+            content_types = archive.read(CONTENT_TYPES_PART).decode('utf-8')
+            static_parts = [
+                (info.filename, archive.read(info)) for info in archive.infolist()
+                if info.filename not in (DOCUMENT_PART, RELS_PART, CONTENT_TYPES_PART)
+            ]
+
+        # Phiên bản mẫu theo nội dung các phần (bỏ docProps: ngày tạo/sửa không đổi bố cục báo cáo)
+        digest = hashlib.sha256(document.encode('utf-8'))
+        for name, data in sorted(static_parts):
+            if not name.startswith('docProps/'):
+                digest.update(name.encode('utf-8'))
+                digest.update(data)
+        self.version = digest.hexdigest()[:12]
+
+        if 'Extension="png"' not in content_types:
+            content_types = content_types.replace(
+                '</Types>', '<Default Extension="png" ContentType="image/png"/></Types>'
+            )
+        # Phần tĩnh của gói được nén một lần; mỗi lần xuất chỉ nối thêm các phần thay đổi
+        buffer = BytesIO()
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr(CONTENT_TYPES_PART, content_types)
+            for name, data in static_parts:
+                archive.writestr(name, data)
+        self._static_zip = buffer.getvalue()
+
+        self.parts = self._compile(document)
+        self.placeholders = {part[1] for part in self.parts if isinstance(part, tuple) and part[1]}
+        for part in self.parts:
+            if isinstance(part, tuple) and part[0] == SLOT_TEXT:
+                self.placeholders.update(key for key in part[2][1::2])
+
+    @classmethod
+    def load(cls, path=DEFAULT_TEMPLATE_PATH):
+        """Mẫu của chi nhánh nếu có file, ngược lại dùng mẫu mặc định"""
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'rb') as f:
+                    return cls(f.read())
+            except (OSError, KeyError, zipfile.BadZipFile) as e:
+                print(f"Lỗi khi đọc mẫu báo cáo Word: {e}")
+        return cls(build_default_template())
+
+    def _compile(self, document):
+        """Tách document.xml thành danh sách chuỗi tĩnh và ô dữ liệu (loại, khóa, dữ liệu biên dịch)"""
+        parts = []
+        last = 0
+        for match in _PARAGRAPH.finditer(document):
+            paragraph = match.group(0)
+            if '{' not in paragraph:
+                continue
+            paragraph, text = _merge_split_placeholders(paragraph)
+            if not _PLACEHOLDER.search(text):
+                continue
+
+            parts.append(document[last:match.start()])
+            last = match.end()
+            whole = _PLACEHOLDER.fullmatch(text.strip())
+            if whole and whole.group(1):
+                props = _PARAGRAPH_PROPS.search(paragraph)
+                parts.append((whole.group(1), whole.group(2), props.group(0) if props else ''))
+            else:
+                # [xml, khóa, xml, khóa, ..., xml]; đoạn chỉ gồm một placeholder được bỏ khi giá trị là None
+                pieces = _PLACEHOLDER.split(paragraph)
+                segments = [pieces[0]]
+                for index in range(1, len(pieces), 3):
+                    segments.extend([pieces[index + 1], pieces[index + 2]])
+                parts.append((SLOT_TEXT, whole.group(2) if whole else None, segments))
+        parts.append(document[last:])
+
+        # Gộp các chuỗi tĩnh liền nhau
+        compiled = []
+        for part in parts:
+            if isinstance(part, str) and compiled and isinstance(compiled[-1], str):
+                compiled[-1] += part
+            else:
+                compiled.append(part)
+        return compiled
+
+    def render(self, context):
+        """Xuất file .docx (bytes) từ context
+
+        Giá trị văn bản là chuỗi/số (None = để trống), bảng là (cột, dòng) như _table_xml,
+        ảnh là (PNG bytes, độ rộng inch); ảnh hoặc bảng thiếu thì ô đó bị bỏ.
+        """
+        body = []
+        images = []
+        for part in self.parts:
+            if isinstance(part, str):
+                body.append(part)
+                continue
+            kind, key, compiled = part
+            value = context.get(key) if key else None
+            if kind == SLOT_TEXT:
+                if key and value is None:
+                    continue
+                body.append(compiled[0])
+                for index in range(1, len(compiled), 2):
+                    body.append(_text_xml(context.get(compiled[index])))
+                    body.append(compiled[index + 1])
+            elif kind == SLOT_TABLE and value is not None:
+                body.append(_table_xml(value))
+            elif kind == SLOT_IMAGE and value is not None:
+                png, width = value
+                rel_id = f"rIdCadapAnh{len(images) + 1}"
+                images.append((rel_id, png))
+                body.append(_image_xml(rel_id, 1000 + len(images), png, width, compiled))
+
+        rels = self._rels
+        if images:
+            rels = rels.replace('</Relationships>', ''.join(
+                f'<Relationship Id="{rel_id}" Type="{IMAGE_REL_TYPE}" Target="media/{rel_id}.png"/>'
+                for rel_id, _ in images
+            ) + '</Relationships>')
+
+        output = BytesIO(self._static_zip)
+        with zipfile.ZipFile(output, 'a', zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr(DOCUMENT_PART, ''.join(body))
+            archive.writestr(RELS_PART, rels)
+            for rel_id, png in images:
+                # PNG đã nén sẵn, lưu nguyên
+                archive.writestr(f"word/media/{rel_id}.png", png, compress_type=zipfile.ZIP_STORED)
+        return output.getvalue()
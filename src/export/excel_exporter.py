@@ -1,34 +1,108 @@
-import pandas as pd
+import re
 from io import BytesIO
+from itertools import islice
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Font
+from openpyxl.utils import get_column_letter
+
+# Số nguyên có phân cách hàng nghìn. Ký tự phân cách do thiết lập vùng của máy mở file quyết định
+# (1.000.000 với thiết lập Tiếng Việt, 1,000,000 với thiết lập Anh); ô vẫn là số để tính toán được
+MONEY_FORMAT = '#,##0'
+PERCENT_FORMAT = '0.0'
+DATE_FORMAT = 'dd/mm/yyyy'
+# Số dòng tối đa của một sheet Excel
+MAX_SHEET_ROWS = 1_048_576
+# Tăng khi đổi bố cục file xuất (làm mới cache file đã xuất)
+LAYOUT_VERSION = '2'
+
+SCHEDULE_COLUMNS = [
+    ('thang', "Tháng", 8, None),
+    ('tra_goc', "Trả gốc", 18, MONEY_FORMAT),
+    ('tra_lai', "Trả lãi", 18, MONEY_FORMAT),
+    ('tong_tra', "Tổng trả", 18, MONEY_FORMAT),
+    ('goc_con_lai', "Gốc còn lại", 20, MONEY_FORMAT)
+]
+
+_INVALID_TITLE_CHARS = re.compile(r'[\[\]:*?/\\]')
+
+
+def sheet_title(name, used):
+    """Tên sheet hợp lệ (tối đa 31 ký tự, không ký tự đặc biệt) và không trùng"""
+    base = _INVALID_TITLE_CHARS.sub('_', str(name) or 'Sheet')[:31]
+    title, index = base, 1
+    while title.lower() in used:
+        index += 1
+        suffix = f"_{index}"
+        title = base[:31 - len(suffix)] + suffix
+    used.add(title.lower())
+    return title
+
 
 class ExcelExporter:
     def __init__(self):
-        pass
-    
+        self.header_font = Font(bold=True)
+        self.header_alignment = Alignment(horizontal='center', vertical='center')
+
+    def _header_row(self, worksheet, columns):
+        row = []
+        for _, label, _, _ in columns:
+            cell = WriteOnlyCell(worksheet, value=label)
+            cell.font = self.header_font
+            cell.alignment = self.header_alignment
+            row.append(cell)
+        return row
+
+    def write_rows(self, worksheet, rows, columns=SCHEDULE_COLUMNS, extra_columns=(), limit=None):
+        """Ghi tiêu đề và các dòng (iterable dict) vào worksheet chế độ write-only, trả về số dòng đã ghi
+
+        Ô tiền tệ được ghi dạng số (không phải chuỗi) kèm định dạng hiển thị; limit giới hạn số dòng
+        lấy từ rows (phần còn lại của iterator để ghi tiếp sang sheet khác).
+        """
+        columns = list(extra_columns) + list(columns)
+        for index, (_, _, width, _) in enumerate(columns):
+            worksheet.column_dimensions[get_column_letter(index + 1)].width = width
+        worksheet.freeze_panes = 'A2'
+        worksheet.append(self._header_row(worksheet, columns))
+        if limit is not None:
+            rows = islice(rows, limit)
+
+        formatted = [(key, number_format) for key, _, _, number_format in columns]
+        count = 0
+        for row in rows:
+            values = []
+            for key, number_format in formatted:
+                value = row.get(key)
+                if number_format is None:
+                    values.append(value)
+                else:
+                    cell = WriteOnlyCell(worksheet, value=value)
+                    cell.number_format = number_format
+                    values.append(cell)
+            worksheet.append(values)
+            count += 1
+        return count
+
+    def export_schedules(self, loans, output):
+        """Xuất nhiều lịch trả nợ (iterable (tên khoản vay, iterable các kỳ)), mỗi khoản vay một sheet
+
+        Chế độ write-only ghi từng dòng ra file tạm nên bộ nhớ không tăng theo số dòng;
+        output là đường dẫn hoặc file nhị phân. Trả về tổng số dòng đã ghi.
+        """
+        workbook = Workbook(write_only=True)
+        used_titles = set()
+        total = 0
+        for name, schedule in loans:
+            worksheet = workbook.create_sheet(sheet_title(name, used_titles))
+            total += self.write_rows(worksheet, schedule)
+        if not used_titles:
+            workbook.create_sheet('KeHoachTraNo')
+        workbook.save(output)
+        return total
+
     def export_payment_schedule(self, payment_schedule):
         """Xuất lịch trả nợ ra file Excel"""
-        df = pd.DataFrame(payment_schedule)
-        
-        # Định dạng số tiền
-        currency_columns = ['tra_goc', 'tra_lai', 'tong_tra', 'goc_con_lai']
-        for col in currency_columns:
-            df[col] = df[col].apply(lambda x: f"{x:,.0f}".replace(",", "."))
-        
-        # Tạo file Excel trong memory
         output = BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df.to_excel(writer, sheet_name='KeHoachTraNo', index=False)
-            
-            # Định dạng worksheet
-            workbook = writer.book
-            worksheet = writer.sheets['KeHoachTraNo']
-            
-            # Đặt độ rộng cột
-            worksheet.column_dimensions['A'].width = 8
-            worksheet.column_dimensions['B'].width = 15
-            worksheet.column_dimensions['C'].width = 15
-            worksheet.column_dimensions['D'].width = 15
-            worksheet.column_dimensions['E'].width = 15
-        
-        output.seek(0)
-        return output.getvalue()
\ No newline at end of file
+        self.export_schedules([('KeHoachTraNo', payment_schedule)], output)
+        return output.getvalue()
@@ -0,0 +1,395 @@
+import csv
+import io
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ALL_COMPLETED, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from src.export.paths import safe_file_stem
+
+# Trạng thái công việc xuất báo cáo
+JOB_PENDING = 'cho'
+JOB_RUNNING = 'dang_chay'
+JOB_DONE = 'hoan_thanh'
+JOB_FAILED = 'loi'
+JOB_CANCELLED = 'da_huy'
+FINISHED_STATES = (JOB_DONE, JOB_FAILED, JOB_CANCELLED)
+
+REPORT_FORMATS = {
+    'docx': ("bao_cao_tham_dinh.docx", "application/vnd.openxmlformats-officedocument.wordprocessingml.document"),
+    'pdf': ("bao_cao_tham_dinh.pdf", "application/pdf")
+}
+ZIP_MIME = "application/zip"
+
+DEFAULT_EXPORT_DIR = os.path.join(os.environ.get('CADAP_DATA_DIR', 'data'), 'exports')
+MANIFEST_NAME = "manifest.csv"
+MANIFEST_COLUMNS = ['case_id', 'ho_ten', 'tep', 'trang_thai', 'loi', 'kich_thuoc', 'thoi_gian']
+# docx đã là file nén, nén lại chỉ tốn CPU
+ARCHIVE_COMPRESSION = {'docx': zipfile.ZIP_STORED, 'pdf': zipfile.ZIP_DEFLATED}
+
+# Exporter và bộ tính toán của từng tiến trình con: font, style và mẫu Word chỉ nạp một lần cho mỗi tiến trình
+_worker_exporter = None
+_worker_calculator = None
+
+
+def _get_worker_exporter():
+    global _worker_exporter
+    if _worker_exporter is None:
+        from src.export.report_exporter import ReportExporter
+        _worker_exporter = ReportExporter()
+    return _worker_exporter
+
+
+def render_report(fmt, data, include_charts=True):
+    """Tạo báo cáo trong tiến trình con (data phải là dict/list thông thường để pickle được)"""
+    exporter = _get_worker_exporter()
+    if fmt == 'docx':
+        return exporter.export_word_report(data, include_charts)
+    return exporter.export_pdf_report(data, include_charts)
+
+
+def render_case_report(fmt, case, include_charts=True):
+    """Tính chỉ số, lịch trả nợ và tạo báo cáo cho một hồ sơ đã lưu, trả về (nội dung, thời gian)"""
+    global _worker_calculator
+    start = time.perf_counter()
+    if _worker_calculator is None:
+        from src.logic.financial_calculator import FinancialCalculator
+        _worker_calculator = FinancialCalculator()
+    financial = case.get('financial', {})
+    data = {
+        'customer': case.get('customer', {}),
+        'financial': financial,
+        'collateral': case.get('collateral', {}),
+        'metrics': _worker_calculator.calculate_financial_metrics(
+            financial, case.get('customer', {}), case.get('collateral', {})
+        ),
+        'payment_schedule': _worker_calculator.calculate_payment_schedule(financial)
+    }
+    report = render_report(fmt, data, include_charts)
+    return report, time.perf_counter() - start
+
+
+def report_file_name(case_id, ho_ten, fmt, used):
+    """Tên file báo cáo trong ZIP: mã hồ sơ + tên khách hàng, không trùng"""
+    base = safe_file_stem(f"{case_id}_{ho_ten}")
+    name, index = f"{base}.{fmt}", 1
+    while name.lower() in used:
+        index += 1
+        name = f"{base}_{index}.{fmt}"
+    used.add(name.lower())
+    return name
+
+
+class ExportJobQueue:
+    """Hàng đợi xuất báo cáo chạy trên nhóm tiến trình, không chặn luồng script của phiên Streamlit
+
+    Mỗi công việc có mã riêng, trạng thái, tiến độ ước lượng (theo thời gian trung bình các lần trước)
+    và kết quả được giữ lại trong retention giây để phiên làm việc tải về. Hủy công việc đang chờ thì
+    bỏ hẳn; công việc đã chạy thì tiến trình con vẫn chạy hết nhưng kết quả bị bỏ.
+    Công việc hàng loạt ghi thẳng từng báo cáo vào file ZIP trong output_dir.
+    """
+
+    def __init__(self, max_workers=2, retention=1800, max_jobs=200, output_dir=DEFAULT_EXPORT_DIR, cache=None):
+        self.max_workers = max_workers
+        self.cache = cache
+        self.retention = retention
+        self.max_jobs = max_jobs
+        self.output_dir = output_dir
+        self._executor = None
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        # Thời gian chạy trung bình theo định dạng, dùng để ước lượng tiến độ
+        self._durations = {}
+
+    def _get_executor(self):
+        if self._executor is None:
+            # spawn: không fork tiến trình máy chủ đang có nhiều luồng (và chạy được trên Windows)
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers, mp_context=multiprocessing.get_context('spawn')
+            )
+        return self._executor
+
+    def _new_job(self, fmt, owner, file_name=None, mime=None):
+        if fmt not in REPORT_FORMATS:
+            raise ValueError(f"Định dạng báo cáo không hỗ trợ: {fmt}")
+        if file_name is None:
+            file_name, mime = REPORT_FORMATS[fmt]
+        return {
+            'job_id': uuid.uuid4().hex[:12],
+            'owner': owner,
+            'loai': fmt,
+            'file_name': file_name,
+            'mime': mime,
+            'trang_thai': JOB_PENDING,
+            'created_at': time.time(),
+            'started_at': None,
+            'finished_at': None,
+            'loi': None,
+            'ket_qua': None,
+            'duong_dan': None,
+            'tong': None,
+            'xong': 0,
+            'so_loi': 0,
+            'cache_key': None,
+            'future': None
+        }
+
+    def _submit_task(self, fn, *args):
+        """Gửi một tác vụ vào nhóm tiến trình (gọi khi đang giữ khóa)"""
+        try:
+            return self._get_executor().submit(fn, *args)
+        except BrokenProcessPool:
+            # Tiến trình con chết bất thường: tạo lại nhóm tiến trình rồi gửi lại
+            self._executor = None
+            return self._get_executor().submit(fn, *args)
+
+    def submit(self, fmt, data, include_charts=True, owner=None, cache_key=None):
+        """Đưa yêu cầu tạo báo cáo vào hàng đợi, trả về mã công việc
+
+        cache_key: khi tạo xong, lưu kết quả vào cache file xuất với khóa này.
+        """
+        job = self._new_job(fmt, owner)
+        job['cache_key'] = cache_key
+        job_id = job['job_id']
+        with self._lock:
+            self._purge()
+            self._jobs[job_id] = job
+            job['future'] = self._submit_task(render_report, fmt, data, include_charts)
+        job['future'].add_done_callback(lambda future: self._finish(job_id, future))
+        return job_id
+
+    def submit_bulk(self, store, case_ids, fmt, include_charts=True, owner=None, window=None):
+        """Tạo báo cáo cho danh sách hồ sơ vào một file ZIP (chạy nền), trả về mã công việc
+
+        Chỉ tối đa window hồ sơ (mặc định 2 lần số tiến trình) được đọc và tạo báo cáo cùng lúc;
+        báo cáo xong được ghi ngay vào ZIP trên đĩa rồi giải phóng. manifest.csv liệt kê kết quả
+        từng hồ sơ, kể cả hồ sơ lỗi hoặc không tìm thấy.
+        """
+        case_ids = list(dict.fromkeys(case_ids))
+        job = self._new_job(fmt, owner, f"bao_cao_{time.strftime('%Y%m%d_%H%M%S')}.zip", ZIP_MIME)
+        job['tong'] = len(case_ids)
+        os.makedirs(self.output_dir, exist_ok=True)
+        job['duong_dan'] = os.path.join(self.output_dir, f"bao_cao_{job['job_id']}.zip")
+        with self._lock:
+            self._purge()
+            self._jobs[job['job_id']] = job
+        threading.Thread(
+            target=self._run_bulk, args=(job, store, case_ids, fmt, include_charts, window or 2 * self.max_workers),
+            daemon=True
+        ).start()
+        return job['job_id']
+
+    def _run_bulk(self, job, store, case_ids, fmt, include_charts, window):
+        manifest = []
+        pending = {}
+        used_names = {MANIFEST_NAME}
+        compression = ARCHIVE_COMPRESSION[fmt]
+
+        def collect(return_when):
+            done, _ = wait(list(pending), return_when=return_when)
+            for future in done:
+                case_id, ho_ten = pending.pop(future)
+                entry = {'case_id': case_id, 'ho_ten': ho_ten, 'tep': '', 'trang_thai': JOB_DONE,
+                         'loi': '', 'kich_thuoc': 0, 'thoi_gian': ''}
+                try:
+                    report, elapsed = future.result()
+                    entry['tep'] = report_file_name(case_id, ho_ten, fmt, used_names)
+                    archive.writestr(entry['tep'], report, compress_type=compression)
+                    entry['kich_thuoc'] = len(report)
+                    entry['thoi_gian'] = round(elapsed, 3)
+                except Exception as e:
+                    entry['trang_thai'] = JOB_FAILED
+                    entry['loi'] = f"Lỗi khi tạo báo cáo: {e}"
+                manifest.append(entry)
+                with self._lock:
+                    job['xong' if entry['trang_thai'] == JOB_DONE else 'so_loi'] += 1
+
+        try:
+            with zipfile.ZipFile(job['duong_dan'], 'w', zipfile.ZIP_DEFLATED) as archive:
+                with self._lock:
+                    if job['trang_thai'] == JOB_PENDING:
+                        job['trang_thai'] = JOB_RUNNING
+                        job['started_at'] = time.time()
+                found = set()
+                for case in store.iter_cases(batch_size=window, case_ids=case_ids):
+                    if job['trang_thai'] == JOB_CANCELLED:
+                        break
+                    while len(pending) >= window:
+                        collect(FIRST_COMPLETED)
+                    found.add(case['case_id'])
+                    with self._lock:
+                        future = self._submit_task(render_case_report, fmt, case, include_charts)
+                    pending[future] = (case['case_id'], case.get('customer', {}).get('ho_ten', ''))
+
+                if job['trang_thai'] == JOB_CANCELLED:
+                    for future in pending:
+                        future.cancel()
+                    pending.clear()
+                elif pending:
+                    collect(ALL_COMPLETED)
+
+                for case_id in case_ids:
+                    if case_id not in found:
+                        manifest.append({'case_id': case_id, 'ho_ten': '', 'tep': '', 'trang_thai': JOB_FAILED,
+                                         'loi': "Không tìm thấy hồ sơ", 'kich_thuoc': 0, 'thoi_gian': ''})
+                        with self._lock:
+                            job['so_loi'] += 1
+
+                # utf-8-sig để Excel mở đúng tiếng Việt
+                buffer = io.StringIO()
+                writer = csv.DictWriter(buffer, fieldnames=MANIFEST_COLUMNS)
+                writer.writeheader()
+                writer.writerows(manifest)
+                archive.writestr(MANIFEST_NAME, buffer.getvalue().encode('utf-8-sig'))
+        except Exception as e:
+            with self._lock:
+                job['trang_thai'] = JOB_FAILED
+                job['loi'] = f"Lỗi khi tạo file ZIP: {e}"
+
+        with self._lock:
+            job['finished_at'] = time.time()
+            if job['trang_thai'] == JOB_CANCELLED:
+                self._remove_file(job)
+            elif job['trang_thai'] != JOB_FAILED:
+                job['trang_thai'] = JOB_DONE
+                if job['so_loi']:
+                    job['loi'] = f"{job['so_loi']}/{job['tong']} hồ sơ lỗi, xem {MANIFEST_NAME}"
+
+    def _finish(self, job_id, future):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job['finished_at'] = time.time()
+            if job['trang_thai'] == JOB_CANCELLED or future.cancelled():
+                job['trang_thai'] = JOB_CANCELLED
+                return
+            try:
+                job['ket_qua'] = future.result()
+                job['trang_thai'] = JOB_DONE
+                if self.cache is not None and job['cache_key']:
+                    self.cache.put(job['cache_key'], job['ket_qua'])
+                duration = job['finished_at'] - (job['started_at'] or job['created_at'])
+                previous = self._durations.get(job['loai'])
+                self._durations[job['loai']] = duration if previous is None else 0.7 * previous + 0.3 * duration
+            except BrokenProcessPool as e:
+                self._executor = None
+                job['trang_thai'] = JOB_FAILED
+                job['loi'] = f"Lỗi khi tạo báo cáo (tiến trình xuất dừng bất thường): {e}"
+            except Exception as e:
+                job['trang_thai'] = JOB_FAILED
+                job['loi'] = f"Lỗi khi tạo báo cáo: {e}"
+
+    def _refresh(self, job, now):
+        """Cập nhật trạng thái đang chạy và tiến độ ước lượng (gọi khi đang giữ khóa)"""
+        if job['tong'] is not None and job['trang_thai'] == JOB_RUNNING:
+            return (job['xong'] + job['so_loi']) / max(job['tong'], 1)
+        future = job['future']
+        if job['trang_thai'] == JOB_PENDING and future is not None and future.running():
+            job['trang_thai'] = JOB_RUNNING
+            job['started_at'] = now
+        if job['trang_thai'] in (JOB_DONE, JOB_FAILED, JOB_CANCELLED):
+            return 1.0
+        if job['trang_thai'] == JOB_PENDING:
+            return 0.0
+        expected = self._durations.get(job['loai'], 2.0)
+        return min(0.95, (now - job['started_at']) / max(expected, 0.1))
+
+    def _purge(self):
+        """Bỏ công việc đã xong quá thời gian giữ lại, và công việc cũ nhất khi vượt max_jobs"""
+        now = time.time()
+        for job_id in list(self._jobs):
+            job = self._jobs[job_id]
+            if job['trang_thai'] in FINISHED_STATES and job['finished_at'] \
+                    and now - job['finished_at'] > self.retention:
+                self._remove_file(self._jobs.pop(job_id))
+        finished = [job_id for job_id, job in self._jobs.items() if job['trang_thai'] in FINISHED_STATES]
+        while len(self._jobs) > self.max_jobs and finished:
+            self._remove_file(self._jobs.pop(finished.pop(0)))
+
+    @staticmethod
+    def _remove_file(job):
+        if job['duong_dan'] and os.path.exists(job['duong_dan']):
+            try:
+                os.remove(job['duong_dan'])
+            except OSError as e:
+                print(f"Lỗi khi xóa file xuất: {e}")
+
+    def _summary(self, job, now):
+        progress = self._refresh(job, now)
+        summary = {key: value for key, value in job.items() if key not in ('ket_qua', 'future')}
+        summary['tien_do'] = progress
+        summary['kich_thuoc'] = len(job['ket_qua']) if job['ket_qua'] is not None else 0
+        return summary
+
+    def get_job(self, job_id):
+        """Thông tin công việc (không kèm nội dung file), None nếu không có hoặc đã hết hạn"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return self._summary(job, time.time()) if job else None
+
+    def list_jobs(self, owner=None):
+        """Các công việc (mới nhất trước), lọc theo phiên làm việc nếu có owner"""
+        with self._lock:
+            self._purge()
+            now = time.time()
+            return [
+                self._summary(job, now) for job in reversed(self._jobs.values())
+                if owner is None or job['owner'] == owner
+            ]
+
+    def get_result(self, job_id):
+        """Nội dung file của công việc đã hoàn thành, None nếu chưa xong"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job['trang_thai'] != JOB_DONE:
+                return None
+            if job['duong_dan'] is None:
+                return job['ket_qua']
+            path = job['duong_dan']
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def cancel(self, job_id):
+        """Hủy công việc chưa xong, trả về True nếu đã hủy"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job['trang_thai'] in FINISHED_STATES:
+                return False
+            job['trang_thai'] = JOB_CANCELLED
+            job['finished_at'] = time.time()
+            future = job['future']
+        if future is not None:
+            future.cancel()
+        return True
+
+    def remove(self, job_id):
+        """Xóa công việc đã kết thúc khỏi danh sách"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job['trang_thai'] not in FINISHED_STATES:
+                return False
+            self._remove_file(self._jobs.pop(job_id))
+            return True
+
+    def stats(self):
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job['trang_thai']] = counts.get(job['trang_thai'], 0) + 1
+            return {'cong_viec': counts, 'tien_trinh': self.max_workers, 'thoi_gian_tb': dict(self._durations)}
+
+    def is_busy(self):
+        """Còn công việc đang chờ hoặc đang chạy (không được giải phóng nhóm tiến trình)"""
+        with self._lock:
+            return any(job['trang_thai'] in (JOB_PENDING, JOB_RUNNING) for job in self._jobs.values())
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
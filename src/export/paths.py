@@ -0,0 +1,23 @@
+import os
+import re
+
+_INVALID_FILE_CHARS = re.compile(r'[\\/:*?"<>|\s]+')
+
+
+def safe_file_stem(text, default="bao_cao"):
+    """Phần tên file an toàn từ dữ liệu người dùng: bỏ ký tự phân cách thư mục, khoảng trắng và '..'"""
+    stem = _INVALID_FILE_CHARS.sub('_', str(text or '').strip('_ ')).strip('_.')[:80]
+    return stem or default
+
+
+def safe_subdir(base, relative):
+    """Thư mục con do người dùng nhập, luôn nằm trong base (không cho đường dẫn tuyệt đối hay '..')"""
+    relative = str(relative or '').strip()
+    parts = re.split(r'[\\/]+', relative)
+    if not relative or os.path.isabs(relative) or os.path.splitdrive(relative)[0] or '..' in parts:
+        raise ValueError("Thư mục phải là đường dẫn tương đối bên trong thư mục dữ liệu, không chứa '..'")
+    path = os.path.normpath(os.path.join(base, relative))
+    root = os.path.realpath(base)
+    if os.path.commonpath([root, os.path.realpath(path)]) != root:
+        raise ValueError("Thư mục nằm ngoài thư mục dữ liệu")
+    return path
@@ -0,0 +1,186 @@
+import os
+from datetime import datetime
+from itertools import chain
+
+import pandas as pd
+from openpyxl import Workbook
+
+from src.export.excel_exporter import (
+    ExcelExporter, MONEY_FORMAT, PERCENT_FORMAT, DATE_FORMAT, MAX_SHEET_ROWS, sheet_title
+)
+from src.logic.prescreen import VERDICT_LABELS
+
+LAYOUT_LONG = 'mot_sheet'
+LAYOUT_PER_LOAN = 'moi_khoan_vay'
+# Quá số khoản vay này thì gộp lịch trả nợ vào một sheet dài (Excel rất chậm với hàng nghìn sheet)
+MAX_LOAN_SHEETS = 1000
+
+SUMMARY_COLUMNS = [
+    ('case_id', "Mã hồ sơ", 14, None),
+    ('ho_ten', "Khách hàng", 28, None),
+    ('cccd', "CCCD", 16, None),
+    ('ngay_tao', "Ngày tạo", 12, DATE_FORMAT),
+    ('muc_dich_vay', "Mục đích vay", 24, None),
+    ('so_tien_vay', "Số tiền vay", 18, MONEY_FORMAT),
+    ('lai_suat', "Lãi suất (%)", 12, PERCENT_FORMAT),
+    ('thoi_gian_vay', "Thời hạn (tháng)", 14, None),
+    ('gia_tri_tai_san', "Giá trị TSBĐ", 18, MONEY_FORMAT),
+    ('monthly_payment', "Trả hàng tháng", 18, MONEY_FORMAT),
+    ('ltv', "LTV (%)", 10, PERCENT_FORMAT),
+    ('dsr_ratio', "DSR (%)", 10, PERCENT_FORMAT),
+    ('safety_margin', "Biên an toàn (%)", 14, PERCENT_FORMAT),
+    ('sang_loc', "Sàng lọc", 22, None)
+]
+
+STATS_COLUMNS = [
+    ('nhom', "Nhóm", 28, None),
+    ('so_ho_so', "Số hồ sơ", 10, None),
+    ('tong_vay', "Tổng dư nợ vay", 20, MONEY_FORMAT),
+    ('vay_tb', "Vay bình quân", 18, MONEY_FORMAT),
+    ('ltv_tb', "LTV bình quân (%)", 16, PERCENT_FORMAT),
+    ('dsr_tb', "DSR bình quân (%)", 16, PERCENT_FORMAT),
+    ('dsr_max', "DSR cao nhất (%)", 16, PERCENT_FORMAT)
+]
+
+LOAN_COLUMNS = [('case_id', "Mã hồ sơ", 14, None), ('ho_ten', "Khách hàng", 28, None)]
+
+DSR_BINS = [0, 30, 50, 70, float('inf')]
+DSR_LABELS = ["DSR dưới 30%", "DSR 30-50%", "DSR 50-70%", "DSR trên 70%"]
+
+
+class PortfolioExporter:
+    """Xuất workbook danh mục theo chi nhánh: sheet tổng hợp (pandas) rồi lịch trả nợ từng khoản vay
+
+    Lượt 1 đọc hồ sơ để tính chỉ số và tổng hợp; lượt 2 đọc lại hồ sơ từ kho và ghi lịch trả nợ
+    theo kiểu streaming, nên bộ nhớ không phụ thuộc vào tổng số kỳ trả nợ của danh mục.
+    """
+
+    def __init__(self, calculator, excel_exporter=None, prescreen=None):
+        self.calculator = calculator
+        self.excel = excel_exporter or ExcelExporter()
+        self.prescreen = prescreen
+
+    def _summary_row(self, case):
+        customer = case.get('customer', {})
+        financial = case.get('financial', {})
+        collateral = case.get('collateral', {})
+        metrics = self.calculator.calculate_financial_metrics(financial, customer, collateral)
+        row = {
+            'case_id': case['case_id'],
+            'ho_ten': customer.get('ho_ten', ''),
+            'cccd': customer.get('cccd', ''),
+            'ngay_tao': datetime.fromtimestamp(case['created_at']),
+            'muc_dich_vay': financial.get('muc_dich_vay') or "Chưa rõ",
+            'so_tien_vay': financial.get('so_tien_vay'),
+            'lai_suat': financial.get('lai_suat'),
+            'thoi_gian_vay': financial.get('thoi_gian_vay'),
+            'gia_tri_tai_san': financial.get('gia_tri_tai_san') or collateral.get('gia_tri_thi_truong'),
+            'monthly_payment': metrics.get('monthly_payment'),
+            'ltv': metrics.get('ltv', collateral.get('ltv')),
+            'dsr_ratio': metrics.get('dsr_ratio'),
+            'safety_margin': metrics.get('safety_margin')
+        }
+        if self.prescreen is not None:
+            screening = self.prescreen.evaluate(metrics, financial, collateral, customer)
+            row['sang_loc'] = VERDICT_LABELS[screening['ket_luan']]
+        return row
+
+    def build_summary(self, store, chi_nhanh=None):
+        """Lượt 1: bảng chỉ số từng hồ sơ (DataFrame) và bảng thống kê tổng hợp"""
+        summary = pd.DataFrame(
+            [self._summary_row(case) for case in store.iter_cases(chi_nhanh=chi_nhanh)],
+            columns=[key for key, _, _, _ in SUMMARY_COLUMNS]
+        )
+        if summary.empty:
+            return summary, pd.DataFrame(columns=[key for key, _, _, _ in STATS_COLUMNS])
+
+        numeric = ['so_tien_vay', 'ltv', 'dsr_ratio']
+        summary[numeric] = summary[numeric].apply(pd.to_numeric, errors='coerce')
+        aggregations = dict(
+            so_ho_so=('case_id', 'count'),
+            tong_vay=('so_tien_vay', 'sum'),
+            vay_tb=('so_tien_vay', 'mean'),
+            ltv_tb=('ltv', 'mean'),
+            dsr_tb=('dsr_ratio', 'mean'),
+            dsr_max=('dsr_ratio', 'max')
+        )
+        by_purpose = summary.groupby('muc_dich_vay').agg(**aggregations).reset_index()
+        by_purpose = by_purpose.rename(columns={'muc_dich_vay': 'nhom'})
+        by_dsr = summary.assign(
+            nhom=pd.cut(summary['dsr_ratio'], DSR_BINS, labels=DSR_LABELS, right=False)
+        ).groupby('nhom', observed=True).agg(**aggregations).reset_index()
+        by_dsr['nhom'] = by_dsr['nhom'].astype(str)
+        total = summary.assign(nhom="Toàn chi nhánh").groupby('nhom').agg(**aggregations).reset_index()
+        stats = pd.concat([total, by_purpose, by_dsr], ignore_index=True)
+        return summary, stats
+
+    @staticmethod
+    def _records(frame):
+        """Duyệt DataFrame thành dict, đổi NaN/NaT thành ô trống"""
+        for record in frame.astype(object).where(frame.notna(), None).to_dict('records'):
+            yield record
+
+    def _loan_rows(self, case):
+        customer = case.get('customer', {})
+        extra = {'case_id': case['case_id'], 'ho_ten': customer.get('ho_ten', '')}
+        for row in self.calculator.iter_payment_schedule(case.get('financial', {})):
+            row.update(extra)
+            yield row
+
+    def export_portfolio(self, store, output, chi_nhanh=None, layout=LAYOUT_LONG):
+        """Xuất workbook danh mục của một chi nhánh (None = toàn bộ) vào output (đường dẫn hoặc file)"""
+        summary, stats = self.build_summary(store, chi_nhanh)
+        if layout == LAYOUT_PER_LOAN and len(summary) > MAX_LOAN_SHEETS:
+            layout = LAYOUT_LONG
+
+        workbook = Workbook(write_only=True)
+        used_titles = set()
+        self.excel.write_rows(workbook.create_sheet(sheet_title("TongHop", used_titles)),
+                              self._records(summary), SUMMARY_COLUMNS)
+        self.excel.write_rows(workbook.create_sheet(sheet_title("ThongKe", used_titles)),
+                              self._records(stats), STATS_COLUMNS)
+        summary_count = len(summary)
+        del summary, stats
+
+        # Lượt 2: đọc lại hồ sơ từ kho, sinh lịch trả nợ từng khoản vay và ghi ngay
+        schedule_rows = 0
+        cases = store.iter_cases(chi_nhanh=chi_nhanh)
+        if layout == LAYOUT_PER_LOAN:
+            for case in cases:
+                name = f"{case['case_id']} {case.get('customer', {}).get('ho_ten', '')}".strip()
+                schedule_rows += self.excel.write_rows(
+                    workbook.create_sheet(sheet_title(name, used_titles)),
+                    self.calculator.iter_payment_schedule(case.get('financial', {}))
+                )
+        else:
+            rows = chain.from_iterable(self._loan_rows(case) for case in cases)
+            part = 1
+            while True:
+                # Sheet đầy (giới hạn dòng của Excel) thì ghi tiếp sang sheet mới
+                title = "LichTraNo" if part == 1 else f"LichTraNo_{part}"
+                written = self.excel.write_rows(
+                    workbook.create_sheet(sheet_title(title, used_titles)), rows,
+                    extra_columns=LOAN_COLUMNS, limit=MAX_SHEET_ROWS - 1
+                )
+                schedule_rows += written
+                if written < MAX_SHEET_ROWS - 1:
+                    break
+                part += 1
+
+        workbook.save(output)
+        return {'so_ho_so': summary_count, 'so_dong_lich_tra_no': schedule_rows, 'bo_cuc': layout}
+
+    def export_branches(self, store, output_dir, layout=LAYOUT_LONG):
+        """Mỗi chi nhánh một workbook trong output_dir, trả về {chi nhánh: (đường dẫn, thống kê)}
+
+        Hồ sơ chưa gán chi nhánh chỉ có trong workbook toàn bộ danh mục (chi_nhanh=None).
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        results = {}
+        used_names = set()
+        for chi_nhanh in store.list_branches():
+            if not chi_nhanh:
+                continue
+            path = os.path.join(output_dir, f"danh_muc_{sheet_title(chi_nhanh, used_names)}.xlsx")
+            results[chi_nhanh] = (path, self.export_portfolio(store, path, chi_nhanh, layout))
+        return results
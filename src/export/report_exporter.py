@@ -1,74 +1,151 @@
-from docx import Document
-from docx.shared import Inches
-from reportlab.lib.pagesizes import A4
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.lib import colors
-import matplotlib.pyplot as plt
+# reportlab, matplotlib và python-docx chỉ được nạp khi thực sự xuất PDF/biểu đồ/Word,
+# để việc import module (khi khởi động ứng dụng) không kéo theo các thư viện nặng
+from datetime import datetime
 from io import BytesIO
-import base64
+import os
+from src.export.chart_renderer import ChartRenderer, SCHEDULE_CHART_SIZE, PIE_CHART_SIZE
+from src.export.docx_template import DocxTemplate
+
+# Tăng khi đổi bố cục báo cáo PDF (làm mới cache file đã xuất); Word dùng phiên bản của mẫu
+PDF_LAYOUT_VERSION = '1'
+
+# Cột bảng kế hoạch trả nợ trong báo cáo Word: (tiêu đề, độ rộng inch, căn lề)
+SCHEDULE_TABLE_COLUMNS = [
+    ("Tháng", 0.7, 'center'),
+    ("Trả gốc", 1.4, 'right'),
+    ("Trả lãi", 1.4, 'right'),
+    ("Tổng trả", 1.4, 'right'),
+    ("Gốc còn lại", 1.6, 'right')
+]
+
+def format_money(value, unit=' VNĐ'):
+    """Số tiền có phân cách hàng nghìn bằng dấu chấm"""
+    try:
+        return f"{float(value or 0):,.0f}".replace(",", ".") + unit
+    except (ValueError, TypeError):
+        return "0" + unit
+
+def register_unicode_font():
+    """Đăng ký font Unicode (DejaVu Sans đi kèm matplotlib) để PDF hiển thị được tiếng Việt"""
+    import matplotlib
+    from reportlab.lib.fonts import addMapping
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+    
+    if 'DejaVuSans' in pdfmetrics.getRegisteredFontNames():
+        return 'DejaVuSans', 'DejaVuSans-Bold'
+    
+    font_dir = os.path.join(matplotlib.get_data_path(), 'fonts', 'ttf')
+    try:
+        pdfmetrics.registerFont(TTFont('DejaVuSans', os.path.join(font_dir, 'DejaVuSans.ttf')))
+        pdfmetrics.registerFont(TTFont('DejaVuSans-Bold', os.path.join(font_dir, 'DejaVuSans-Bold.ttf')))
+        addMapping('DejaVuSans', 0, 0, 'DejaVuSans')
+        addMapping('DejaVuSans', 1, 0, 'DejaVuSans-Bold')
+        return 'DejaVuSans', 'DejaVuSans-Bold'
+    except Exception as e:
+        print(f"Lỗi khi đăng ký font Unicode: {e}")
+        return 'Helvetica', 'Helvetica-Bold'
 
 class ReportExporter:
-    def __init__(self):
-        pass
+    def __init__(self, chart_renderer=None, word_template=None):
+        self.chart_renderer = chart_renderer or ChartRenderer()
+        self._word_template = word_template
+        self._pdf_styles = None
+    
+    @property
+    def word_template(self):
+        """Mẫu Word, nạp và biên dịch ở lần dùng đầu tiên (một lần cho mỗi exporter)"""
+        if self._word_template is None:
+            self._word_template = DocxTemplate.load()
+        return self._word_template
+    
+    def get_pdf_styles(self):
+        """Font và style PDF, dựng ở lần xuất PDF đầu tiên (một lần cho mỗi exporter)"""
+        if self._pdf_styles is None:
+            from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+            
+            font_name, bold_font_name = register_unicode_font()
+            styles = getSampleStyleSheet()
+            for name in ('Normal', 'Heading1', 'Heading2'):
+                styles[name].fontName = bold_font_name if name.startswith('Heading') else font_name
+            title_style = ParagraphStyle(
+                'CustomTitle',
+                parent=styles['Heading1'],
+                fontSize=16,
+                spaceAfter=30,
+                alignment=1
+            )
+            self._pdf_styles = styles, title_style
+        return self._pdf_styles
+    
+    def layout_version(self, fmt):
+        """Phiên bản bố cục báo cáo theo định dạng, dùng trong khóa cache"""
+        return self.word_template.version if fmt == 'docx' else PDF_LAYOUT_VERSION
     
     def export_word_report(self, data, include_charts=True):
-        """Xuất báo cáo thẩm định dạng Word"""
-        doc = Document()
-        
-        # Tiêu đề
-        title = doc.add_heading('BÁO CÁO THẨM ĐỊNH TÍN DỤNG', 0)
-        title.alignment = 1
-        
-        # Thông tin khách hàng
-        doc.add_heading('I. THÔNG TIN KHÁCH HÀNG', level=1)
+        """Xuất báo cáo thẩm định dạng Word (điền dữ liệu vào mẫu đã biên dịch sẵn)"""
+        return self.word_template.render(self._word_context(data, include_charts))
+    
+    def _word_context(self, data, include_charts):
+        """Dữ liệu cho các placeholder của mẫu Word"""
         customer = data.get('customer', {})
-        doc.add_paragraph(f"Họ và tên: {customer.get('ho_ten', '')}")
-        doc.add_paragraph(f"CCCD/CMND: {customer.get('cccd', '')}")
-        doc.add_paragraph(f"Địa chỉ: {customer.get('dia_chi', '')}")
-        doc.add_paragraph(f"Số điện thoại: {customer.get('dien_thoai', '')}")
-        
-        # Thông tin tài chính
-        doc.add_heading('II. THÔNG TIN TÀI CHÍNH', level=1)
         financial = data.get('financial', {})
-        doc.add_paragraph(f"Tổng nhu cầu vốn: {financial.get('tong_nhu_cau_von', 0):,.0f} VNĐ".replace(",", "."))
-        doc.add_paragraph(f"Vốn đối ứng: {financial.get('von_doi_ung', 0):,.0f} VNĐ".replace(",", "."))
-        doc.add_paragraph(f"Số tiền vay: {financial.get('so_tien_vay', 0):,.0f} VNĐ".replace(",", "."))
-        doc.add_paragraph(f"Lãi suất: {financial.get('lai_suat', 0)}%/năm")
-        doc.add_paragraph(f"Thời gian vay: {financial.get('thoi_gian_vay', 0)} tháng")
-        doc.add_paragraph(f"Mục đích vay: {financial.get('muc_dich_vay', '')}")
-        
-        # Chỉ số tài chính
-        doc.add_heading('III. CHỈ SỐ TÀI CHÍNH', level=1)
         metrics = data.get('metrics', {})
-        doc.add_paragraph(f"Nghĩa vụ trả nợ hàng tháng: {metrics.get('monthly_payment', 0):,.0f} VNĐ".replace(",", "."))
-        doc.add_paragraph(f"Tỷ lệ trả nợ (DSR): {metrics.get('dsr_ratio', 0):.1f}%")
-        doc.add_paragraph(f"LTV: {metrics.get('ltv', 0):.1f}%")
-        doc.add_paragraph(f"Biên an toàn trả nợ: {metrics.get('safety_margin', 0):.1f}%")
+        context = {
+            'ngay_lap': datetime.now().strftime('%d/%m/%Y'),
+            'ho_ten': customer.get('ho_ten', ''),
+            'cccd': customer.get('cccd', ''),
+            'dia_chi': customer.get('dia_chi', ''),
+            'dien_thoai': customer.get('dien_thoai', ''),
+            'tong_nhu_cau_von': format_money(financial.get('tong_nhu_cau_von', 0)),
+            'von_doi_ung': format_money(financial.get('von_doi_ung', 0)),
+            'so_tien_vay': format_money(financial.get('so_tien_vay', 0)),
+            'lai_suat': f"{financial.get('lai_suat', 0)}%/năm",
+            'thoi_gian_vay': f"{financial.get('thoi_gian_vay', 0)} tháng",
+            'muc_dich_vay': financial.get('muc_dich_vay', ''),
+            'monthly_payment': format_money(metrics.get('monthly_payment', 0)),
+            'dsr_ratio': f"{metrics.get('dsr_ratio', 0):.1f}%",
+            'ltv': f"{metrics.get('ltv', 0):.1f}%",
+            'safety_margin': f"{metrics.get('safety_margin', 0):.1f}%"
+        }
         
-        # Lưu file vào memory
-        output = BytesIO()
-        doc.save(output)
-        output.seek(0)
+        payment_schedule = data.get('payment_schedule') or []
+        if payment_schedule:
+            context['lich_tra_no'] = (SCHEDULE_TABLE_COLUMNS, (
+                (row['thang'], format_money(row['tra_goc'], ''), format_money(row['tra_lai'], ''),
+                 format_money(row['tong_tra'], ''), format_money(row['goc_con_lai'], ''))
+                for row in payment_schedule
+            ))
         
-        return output.getvalue()
+        # Biểu đồ (cùng ảnh với giao diện, lấy từ cache)
+        if include_charts:
+            context['tieu_de_bieu_do'] = 'V. BIỂU ĐỒ'
+            context['bieu_do_nguon_von'] = self._chart_image(
+                self.chart_renderer.financial_pie_chart(financial), PIE_CHART_SIZE
+            )
+            context['bieu_do_lich_tra_no'] = self._chart_image(
+                self.chart_renderer.payment_schedule_chart(payment_schedule), SCHEDULE_CHART_SIZE
+            )
+        return context
+    
+    @staticmethod
+    def _chart_image(image, size):
+        if image is None:
+            return None
+        return image, 6.0 if size[0] > size[1] else 3.5
     
     def export_pdf_report(self, data, include_charts=True):
         """Xuất báo cáo thẩm định dạng PDF"""
+        from reportlab.lib.pagesizes import A4
+        from reportlab.lib.units import inch
+        from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image
+        
         buffer = BytesIO()
         doc = SimpleDocTemplate(buffer, pagesize=A4)
-        styles = getSampleStyleSheet()
+        styles, title_style = self.get_pdf_styles()
         story = []
         
         # Tiêu đề
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=16,
-            spaceAfter=30,
-            alignment=1
-        )
         title = Paragraph('BÁO CÁO THẨM ĐỊNH TÍN DỤNG', title_style)
         story.append(title)
         
@@ -100,7 +177,26 @@ class ReportExporter:
         story.append(Paragraph(f"LTV: {metrics.get('ltv', 0):.1f}%", styles['Normal']))
         story.append(Paragraph(f"Biên an toàn trả nợ: {metrics.get('safety_margin', 0):.1f}%", styles['Normal']))
         
+        # Biểu đồ (cùng ảnh với giao diện, lấy từ cache)
+        if include_charts:
+            charts = self._chart_images(data)
+            if charts:
+                story.append(Spacer(1, 12))
+                story.append(Paragraph('IV. BIỂU ĐỒ', styles['Heading2']))
+                for image, size in charts:
+                    width = doc.width if size[0] > size[1] else 3.5 * inch
+                    story.append(Image(BytesIO(image), width=width, height=width * size[1] / size[0]))
+                    story.append(Spacer(1, 12))
+        
         doc.build(story)
         buffer.seek(0)
         
-        return buffer.getvalue()
\ No newline at end of file
+        return buffer.getvalue()
+    
+    def _chart_images(self, data):
+        """Ảnh PNG các biểu đồ kèm kích thước (inch) để giữ đúng tỷ lệ khi chèn"""
+        charts = [
+            (self.chart_renderer.financial_pie_chart(data.get('financial', {})), PIE_CHART_SIZE),
+            (self.chart_renderer.payment_schedule_chart(data.get('payment_schedule', [])), SCHEDULE_CHART_SIZE)
+        ]
+        return [(image, size) for image, size in charts if image is not None]
\ No newline at end of file
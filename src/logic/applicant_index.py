@@ -0,0 +1,237 @@
+import heapq
+import re
+import threading
+import unicodedata
+from array import array
+from collections import Counter
+from itertools import chain
+
+
+def normalize_text(text):
+    """Chuẩn hóa chuỗi tiếng Việt: bỏ dấu, chữ thường, gộp khoảng trắng"""
+    if not text:
+        return ''
+    text = str(text).replace('đ', 'd').replace('Đ', 'D')
+    text = unicodedata.normalize('NFD', text)
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    text = re.sub(r'[^0-9a-z]+', ' ', text.lower())
+    return text.strip()
+
+
+def normalize_cccd(value):
+    """Chỉ giữ lại chữ số của CCCD/CMND"""
+    return re.sub(r'\D', '', str(value or ''))
+
+
+def normalize_phone(value):
+    """Chuẩn hóa số điện thoại về dạng 0xxxxxxxxx"""
+    digits = re.sub(r'\D', '', str(value or ''))
+    if digits.startswith('84') and len(digits) > 9:
+        digits = '0' + digits[2:]
+    return digits
+
+
+def trigrams(text):
+    """Tập n-gram (n=3) của chuỗi đã chuẩn hóa"""
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def similarity(grams_a, grams_b):
+    """Hệ số Dice giữa hai tập n-gram"""
+    if not grams_a or not grams_b:
+        return 0.0
+    return 2 * len(grams_a & grams_b) / (len(grams_a) + len(grams_b))
+
+
+class ApplicantIndex:
+    """Chỉ mục tra cứu người vay và tài sản bảo đảm trên toàn bộ hồ sơ đã lưu"""
+
+    FUZZY_FIELDS = ('ho_ten', 'dia_chi', 'dia_chi_tai_san')
+
+    def __init__(self, max_probe_grams=4, max_candidates=100):
+        self.max_probe_grams = max_probe_grams
+        self.max_candidates = max_candidates
+        self._lock = threading.Lock()
+        # Tra cứu chính xác: giá trị chuẩn hóa -> tập mã hồ sơ
+        self._exact = {'cccd': {}, 'dien_thoai': {}}
+        # Tra cứu gần đúng: mỗi chuỗi chuẩn hóa khác nhau chỉ đánh chỉ mục một lần
+        # (tên người Việt lặp lại rất nhiều), kèm tập n-gram và tập mã hồ sơ chứa nó
+        self._key_ids = {field: {} for field in self.FUZZY_FIELDS}
+        self._keys = []
+        self._postings = {field: {} for field in self.FUZZY_FIELDS}
+        self._case_keys = {}
+
+    def __len__(self):
+        return len(self._case_keys)
+
+    def build_from_store(self, store, batch_size=1000):
+        """Nạp toàn bộ hồ sơ từ CaseStore vào chỉ mục"""
+        for case in store.iter_cases(batch_size=batch_size):
+            self.add_case(case['case_id'], case)
+        return self
+
+    @staticmethod
+    def extract_entries(case):
+        """Lấy các giá trị cần đánh chỉ mục từ một hồ sơ (hoặc dữ liệu trích xuất từ file)"""
+        original = case.get('original', case)
+        borrowers = list(original.get('khach_hang', []) or [])
+        customer = case.get('customer') or {
+            field: original.get(field, '') for field in ('ho_ten', 'cccd', 'dia_chi', 'dien_thoai')
+        }
+        if customer.get('ho_ten') or customer.get('cccd'):
+            borrowers.append(customer)
+
+        entries = []
+        for borrower in borrowers:
+            entries.append(('cccd', borrower.get('cccd', '')))
+            entries.append(('dien_thoai', borrower.get('dien_thoai', '')))
+            entries.append(('ho_ten', borrower.get('ho_ten', '')))
+            entries.append(('dia_chi', borrower.get('dia_chi', '')))
+
+        collateral = case.get('collateral') or original
+        entries.append(('dia_chi_tai_san', collateral.get('dia_chi_tai_san', '')))
+        return [(field, value) for field, value in entries if value]
+
+    def add_case(self, case_id, case):
+        """Thêm (hoặc đánh chỉ mục lại) một hồ sơ"""
+        with self._lock:
+            self._remove_locked(case_id)
+            keys = set()
+            for field, value in self.extract_entries(case):
+                if field == 'cccd':
+                    key = normalize_cccd(value)
+                elif field == 'dien_thoai':
+                    key = normalize_phone(value)
+                else:
+                    key = normalize_text(value)
+                if not key or (field, key) in keys:
+                    continue
+                keys.add((field, key))
+
+                if field in self._exact:
+                    self._exact[field].setdefault(key, set()).add(case_id)
+                    continue
+
+                key_id = self._key_ids[field].get(key)
+                if key_id is None:
+                    key_id = self._key_ids[field][key] = len(self._keys)
+                    grams = frozenset(trigrams(key))
+                    self._keys.append((value, key, grams, set()))
+                    postings = self._postings[field]
+                    for gram in grams:
+                        posting = postings.get(gram)
+                        if posting is None:
+                            posting = postings[gram] = array('I')
+                        posting.append(key_id)
+                self._keys[key_id][3].add(case_id)
+
+            self._case_keys[case_id] = keys
+
+    def remove_case(self, case_id):
+        """Xóa một hồ sơ khỏi chỉ mục"""
+        with self._lock:
+            self._remove_locked(case_id)
+
+    def _remove_locked(self, case_id):
+        keys = self._case_keys.pop(case_id, None)
+        if not keys:
+            return
+        for field, key in keys:
+            if field in self._exact:
+                case_ids = self._exact[field].get(key)
+                if case_ids:
+                    case_ids.discard(case_id)
+                    if not case_ids:
+                        del self._exact[field][key]
+            else:
+                # Chuỗi không còn hồ sơ nào vẫn nằm trong posting, bị bỏ qua khi tra cứu
+                self._keys[self._key_ids[field][key]][3].discard(case_id)
+
+    def lookup_cccd(self, cccd):
+        """Tra cứu chính xác theo CCCD/CMND"""
+        key = normalize_cccd(cccd)
+        with self._lock:
+            return set(self._exact['cccd'].get(key, ()))
+
+    def lookup_phone(self, phone):
+        """Tra cứu chính xác theo số điện thoại"""
+        key = normalize_phone(phone)
+        with self._lock:
+            return set(self._exact['dien_thoai'].get(key, ()))
+
+    def search(self, field, query, limit=10, threshold=0.6):
+        """Tra cứu gần đúng theo n-gram trên tên hoặc địa chỉ"""
+        key = normalize_text(query)
+        if not key:
+            return []
+        query_grams = trigrams(key)
+        # Giữ khóa trong suốt lượt tra cứu: add_case/remove_case sửa posting và tập mã hồ sơ tại chỗ
+        with self._lock:
+            return self._search_locked(field, key, query_grams, limit, threshold)
+
+    def _search_locked(self, field, key, query_grams, limit, threshold):
+        postings = self._postings[field]
+
+        # Chỉ dò các n-gram hiếm nhất để giới hạn số ứng viên khi chỉ mục lớn
+        probe = sorted(
+            (postings[gram] for gram in query_grams if gram in postings),
+            key=len
+        )[:self.max_probe_grams]
+        counts = Counter(chain.from_iterable(probe))
+        exact_id = self._key_ids[field].get(key)
+        if exact_id is not None:
+            counts[exact_id] = len(probe) + 1
+        candidates = heapq.nlargest(self.max_candidates, counts, key=counts.__getitem__)
+
+        scored = []
+        for key_id in candidates:
+            score = similarity(query_grams, self._keys[key_id][2])
+            if score >= threshold and self._keys[key_id][3]:
+                scored.append((score, key_id))
+        scored.sort(reverse=True)
+
+        # Chỉ mở rộng ra các hồ sơ cho đến khi đủ số kết quả
+        results = []
+        for score, key_id in scored:
+            value, _, _, case_ids = self._keys[key_id]
+            for case_id in case_ids:
+                results.append({'case_id': case_id, 'truong': field, 'gia_tri': value, 'do_tuong_dong': score})
+                if len(results) >= limit:
+                    return results
+        return results
+
+    def search_name(self, name, limit=10, threshold=0.6):
+        return self.search('ho_ten', name, limit, threshold)
+
+    def search_address(self, address, limit=10, threshold=0.6):
+        return self.search('dia_chi', address, limit, threshold)
+
+    def find_duplicates(self, case, exclude_case_id=None, name_threshold=0.9, address_threshold=0.85):
+        """Tìm người vay hoặc tài sản bảo đảm đã xuất hiện trong hồ sơ khác"""
+        findings = []
+
+        def add(loai, gia_tri, case_ids, score=1.0):
+            for case_id in case_ids:
+                if case_id != exclude_case_id:
+                    findings.append({'loai': loai, 'gia_tri': gia_tri, 'case_id': case_id, 'do_tuong_dong': score})
+
+        for field, value in self.extract_entries(case):
+            if field == 'cccd':
+                add('Trùng CCCD/CMND', value, self.lookup_cccd(value))
+            elif field == 'dien_thoai':
+                add('Trùng số điện thoại', value, self.lookup_phone(value))
+            elif field == 'ho_ten':
+                for match in self.search('ho_ten', value, threshold=name_threshold):
+                    add('Tên gần giống', match['gia_tri'], [match['case_id']], match['do_tuong_dong'])
+            elif field == 'dia_chi_tai_san':
+                for match in self.search('dia_chi_tai_san', value, threshold=address_threshold):
+                    add('Tài sản bảo đảm trùng địa chỉ', match['gia_tri'], [match['case_id']], match['do_tuong_dong'])
+
+        # Mỗi (loại, hồ sơ) chỉ báo một lần, giữ độ tương đồng cao nhất
+        unique = {}
+        for finding in findings:
+            key = (finding['loai'], finding['case_id'])
+            if key not in unique or finding['do_tuong_dong'] > unique[key]['do_tuong_dong']:
+                unique[key] = finding
+        return sorted(unique.values(), key=lambda item: item['do_tuong_dong'], reverse=True)
@@ -0,0 +1,173 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_DB_PATH = os.path.join(os.environ.get('CADAP_DATA_DIR', 'data'), 'cadap.db')
+
+SECTIONS = ('customer', 'financial', 'collateral', 'original')
+
+
+class CaseStore:
+    """Lưu trữ hồ sơ vay (các nhóm dữ liệu của DataManager) trong SQLite"""
+
+    def __init__(self, db_path=DEFAULT_DB_PATH):
+        self.db_path = db_path
+        if db_path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS cases (
+                case_id TEXT PRIMARY KEY,
+                chi_nhanh TEXT NOT NULL DEFAULT '',
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                customer TEXT NOT NULL,
+                financial TEXT NOT NULL,
+                collateral TEXT NOT NULL,
+                original TEXT NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_cases_branch ON cases (chi_nhanh, created_at)")
+        self._conn.commit()
+
+    def save_case(self, case_id, sections, chi_nhanh='', created_at=None):
+        """Lưu hoặc cập nhật một hồ sơ"""
+        now = time.time()
+        values = [json.dumps(sections.get(section, {}), ensure_ascii=False, default=dict) for section in SECTIONS]
+        with self._lock:
+            self._conn.execute("""
+                INSERT INTO cases (case_id, chi_nhanh, created_at, updated_at, customer, financial, collateral, original)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(case_id) DO UPDATE SET
+                    chi_nhanh = excluded.chi_nhanh,
+                    updated_at = excluded.updated_at,
+                    customer = excluded.customer,
+                    financial = excluded.financial,
+                    collateral = excluded.collateral,
+                    original = excluded.original
+            """, [case_id, chi_nhanh or '', created_at or now, now] + values)
+            self._conn.commit()
+
+    def get_case(self, case_id):
+        """Lấy một hồ sơ theo mã"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM cases WHERE case_id = ?", (case_id,)
+            ).fetchone()
+        return self._row_to_case(row) if row else None
+
+    def delete_case(self, case_id):
+        """Xóa một hồ sơ"""
+        with self._lock:
+            self._conn.execute("DELETE FROM cases WHERE case_id = ?", (case_id,))
+            self._conn.commit()
+
+    def count_cases(self, chi_nhanh=None):
+        """Đếm số hồ sơ"""
+        sql, params = "SELECT COUNT(*) FROM cases", []
+        if chi_nhanh:
+            sql, params = sql + " WHERE chi_nhanh = ?", [chi_nhanh]
+        with self._lock:
+            return self._conn.execute(sql, params).fetchone()[0]
+
+    def list_branches(self):
+        """Danh sách chi nhánh có hồ sơ"""
+        with self._lock:
+            rows = self._conn.execute("SELECT DISTINCT chi_nhanh FROM cases ORDER BY chi_nhanh").fetchall()
+        return [row[0] for row in rows]
+
+    def list_cases(self, offset=0, limit=50, chi_nhanh=None):
+        """Danh sách tóm tắt hồ sơ (phân trang)"""
+        sql = "SELECT case_id, chi_nhanh, created_at, updated_at, customer FROM cases"
+        params = []
+        if chi_nhanh:
+            sql += " WHERE chi_nhanh = ?"
+            params.append(chi_nhanh)
+        sql += " ORDER BY created_at DESC LIMIT ? OFFSET ?"
+        params += [limit, offset]
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [
+            {
+                'case_id': row[0],
+                'chi_nhanh': row[1],
+                'created_at': row[2],
+                'updated_at': row[3],
+                'ho_ten': json.loads(row[4]).get('ho_ten', '')
+            }
+            for row in rows
+        ]
+
+    def iter_cases(self, batch_size=500, chi_nhanh=None, case_ids=None):
+        """Duyệt lần lượt các hồ sơ theo lô, không nạp toàn bộ vào bộ nhớ"""
+        if case_ids is not None:
+            case_ids = list(case_ids)
+            for start in range(0, len(case_ids), batch_size):
+                chunk = case_ids[start:start + batch_size]
+                placeholders = ",".join("?" * len(chunk))
+                with self._lock:
+                    rows = self._conn.execute(
+                        f"SELECT * FROM cases WHERE case_id IN ({placeholders})", chunk
+                    ).fetchall()
+                by_id = {row[0]: row for row in rows}
+                for case_id in chunk:
+                    if case_id in by_id:
+                        yield self._row_to_case(by_id[case_id])
+            return
+
+        # Phân trang theo khóa (rowid) để không giữ cursor mở giữa các lô
+        last_rowid = 0
+        while True:
+            sql = "SELECT rowid, * FROM cases WHERE rowid > ?"
+            params = [last_rowid]
+            if chi_nhanh:
+                sql += " AND chi_nhanh = ?"
+                params.append(chi_nhanh)
+            sql += " ORDER BY rowid LIMIT ?"
+            params.append(batch_size)
+            with self._lock:
+                rows = self._conn.execute(sql, params).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield self._row_to_case(row[1:])
+            last_rowid = rows[-1][0]
+
+    def iter_case_ids(self, batch_size=5000, chi_nhanh=None):
+        """Duyệt mã hồ sơ theo lô (không đọc nội dung JSON)"""
+        last_rowid = 0
+        while True:
+            sql = "SELECT rowid, case_id FROM cases WHERE rowid > ?"
+            params = [last_rowid]
+            if chi_nhanh:
+                sql += " AND chi_nhanh = ?"
+                params.append(chi_nhanh)
+            sql += " ORDER BY rowid LIMIT ?"
+            params.append(batch_size)
+            with self._lock:
+                rows = self._conn.execute(sql, params).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield row[1]
+            last_rowid = rows[-1][0]
+
+    def close(self):
+        """Đóng kết nối SQLite (khi xóa tài nguyên dùng chung)"""
+        with self._lock:
+            self._conn.close()
+
+    def _row_to_case(self, row):
+        case = {
+            'case_id': row[0],
+            'chi_nhanh': row[1],
+            'created_at': row[2],
+            'updated_at': row[3]
+        }
+        for section, raw in zip(SECTIONS, row[4:]):
+            case[section] = json.loads(raw)
+        return case
@@ -1,66 +1,242 @@
+import hashlib
+import json
+from collections.abc import Mapping
+from types import MappingProxyType
+
+from src.logic.edit_journal import EditJournal, MISSING
+
+
+def _freeze(value):
+    """Đóng băng dữ liệu lồng nhau (dict -> mapping chỉ đọc, list -> tuple)"""
+    if isinstance(value, Snapshot):
+        return value
+    if isinstance(value, Mapping):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+def _thaw(value):
+    """Chuyển dữ liệu đã đóng băng về dict/list thông thường"""
+    if isinstance(value, Mapping):
+        return {key: _thaw(item) for key, item in value.items()}
+    if isinstance(value, tuple):
+        return [_thaw(item) for item in value]
+    return value
+
+
+class Snapshot(Mapping):
+    """Ảnh chụp chỉ đọc của một nhóm dữ liệu kèm số phiên bản"""
+
+    __slots__ = ('_data', 'version', '_fingerprint')
+
+    def __init__(self, data=None, version=0):
+        object.__setattr__(self, '_data', _freeze(data or {}))
+        object.__setattr__(self, 'version', version)
+        object.__setattr__(self, '_fingerprint', None)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Snapshot là dữ liệu chỉ đọc")
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        return f"Snapshot(v{self.version}, {dict(self._data)!r})"
+
+    def to_dict(self):
+        """Tạo bản sao dict có thể chỉnh sửa"""
+        return _thaw(self._data)
+
+    def fingerprint(self):
+        """Hash nội dung (tính một lần cho mỗi ảnh chụp vì ảnh chụp không đổi)"""
+        if self._fingerprint is None:
+            raw = json.dumps(self.to_dict(), ensure_ascii=False, sort_keys=True, default=str)
+            object.__setattr__(self, '_fingerprint', hashlib.sha256(raw.encode('utf-8')).hexdigest())
+        return self._fingerprint
+
+
 class DataManager:
+    SECTIONS = ('customer', 'financial', 'collateral', 'original')
+
     def __init__(self):
-        self.customer_data = {}
-        self.financial_data = {}
-        self.collateral_data = {}
-        self.original_data = {}
-    
+        self._sections = {section: Snapshot() for section in self.SECTIONS}
+        self.journal = EditJournal()
+
+    @property
+    def customer_data(self):
+        return self._sections['customer']
+
+    @property
+    def financial_data(self):
+        return self._sections['financial']
+
+    @property
+    def collateral_data(self):
+        return self._sections['collateral']
+
+    @property
+    def original_data(self):
+        return self._sections['original']
+
+    def _replace_section(self, section, data):
+        """Thay ảnh chụp của một nhóm dữ liệu, tăng phiên bản nếu nội dung thay đổi"""
+        current = self._sections[section]
+        if current.to_dict() == _thaw(data):
+            return current
+        snapshot = Snapshot(data, current.version + 1)
+        self._sections[section] = snapshot
+        return snapshot
+
+    def _merge_section(self, section, data):
+        """Gộp các trường mới vào nhóm dữ liệu (copy-on-write), ghi thay đổi vào nhật ký"""
+        current = self._sections[section]
+        deltas = [
+            (section, key, current.get(key, MISSING), _freeze(value))
+            for key, value in data.items()
+            if key not in current or _thaw(current[key]) != _thaw(value)
+        ]
+        self._apply_deltas(deltas)
+        self.journal.record('edit', deltas, self._sections)
+        return self._sections[section]
+
+    def _apply_deltas(self, deltas):
+        """Áp dụng danh sách thay đổi (section, field, old, new), mỗi nhóm dữ liệu tăng một phiên bản"""
+        changed = {}
+        for section, field, old, new in deltas:
+            merged = changed.setdefault(section, dict(self._sections[section]))
+            if new is MISSING:
+                merged.pop(field, None)
+            else:
+                merged[field] = new
+        for section, merged in changed.items():
+            self._sections[section] = Snapshot(merged, self._sections[section].version + 1)
+
     def update_from_document(self, extracted_data):
         """Cập nhật dữ liệu từ document được phân tích"""
-        self.original_data = extracted_data.copy()
-        
+        self._replace_section('original', extracted_data)
+
         # Cập nhật thông tin khách hàng
         if 'ho_ten' in extracted_data:
-            self.customer_data = {
+            self._replace_section('customer', {
                 'ho_ten': extracted_data.get('ho_ten', ''),
                 'cccd': extracted_data.get('cccd', ''),
                 'dia_chi': extracted_data.get('dia_chi', ''),
                 'dien_thoai': extracted_data.get('dien_thoai', '')
-            }
-        
+            })
+
         # Cập nhật thông tin tài chính
         financial_fields = [
-            'tong_nhu_cau_von', 'von_doi_ung', 'so_tien_vay', 
-            'ty_le_von_doi_ung', 'lai_suat', 'thoi_gian_vay', 'muc_dich_vay'
+            'tong_nhu_cau_von', 'von_doi_ung', 'so_tien_vay',
+            'ty_le_von_doi_ung', 'lai_suat', 'thoi_gian_vay', 'muc_dich_vay',
+            'tong_thu_nhap', 'chi_phi_sinh_hoat'
         ]
-        self.financial_data = {
+        self._replace_section('financial', {
             field: extracted_data.get(field, 0 if field != 'muc_dich_vay' else '')
             for field in financial_fields
-        }
-        
+        })
+
         # Cập nhật thông tin tài sản
         collateral_fields = [
             'loai_tai_san', 'gia_tri_thi_truong', 'dia_chi_tai_san', 'ltv', 'giay_to_phap_ly'
         ]
-        self.collateral_data = {
+        self._replace_section('collateral', {
             field: extracted_data.get(field, 0 if field not in ['loai_tai_san', 'dia_chi_tai_san', 'giay_to_phap_ly'] else '')
             for field in collateral_fields
-        }
-    
+        })
+
+        # Hồ sơ mới: bắt đầu nhật ký chỉnh sửa từ dữ liệu vừa trích xuất
+        self.journal.reset(self._sections)
+
+    def load_sections(self, sections):
+        """Nạp lại các nhóm dữ liệu của một hồ sơ đã lưu"""
+        for section in self.SECTIONS:
+            self._replace_section(section, sections.get(section, {}))
+        self.journal.reset(self._sections)
+
+    def export_sections(self):
+        """Xuất các nhóm dữ liệu thành dict thông thường để lưu trữ"""
+        return {section: self._sections[section].to_dict() for section in self.SECTIONS}
+
     def update_customer_data(self, data):
         """Cập nhật thông tin khách hàng"""
-        self.customer_data.update(data)
-    
+        self._merge_section('customer', data)
+
     def update_financial_data(self, data):
         """Cập nhật thông tin tài chính"""
-        self.financial_data.update(data)
-    
+        self._merge_section('financial', data)
+
     def update_collateral_data(self, data):
         """Cập nhật thông tin tài sản"""
-        self.collateral_data.update(data)
-    
+        self._merge_section('collateral', data)
+
     def get_customer_data(self):
-        """Lấy thông tin khách hàng"""
-        return self.customer_data.copy()
-    
+        """Lấy thông tin khách hàng (ảnh chụp chỉ đọc, không sao chép)"""
+        return self._sections['customer']
+
     def get_financial_data(self):
-        """Lấy thông tin tài chính"""
-        return self.financial_data.copy()
-    
+        """Lấy thông tin tài chính (ảnh chụp chỉ đọc, không sao chép)"""
+        return self._sections['financial']
+
     def get_collateral_data(self):
-        """Lấy thông tin tài sản"""
-        return self.collateral_data.copy()
-    
+        """Lấy thông tin tài sản (ảnh chụp chỉ đọc, không sao chép)"""
+        return self._sections['collateral']
+
     def get_original_data(self):
-        """Lấy dữ liệu gốc từ file"""
-        return self.original_data.copy()
\ No newline at end of file
+        """Lấy dữ liệu gốc từ file (ảnh chụp chỉ đọc, không sao chép)"""
+        return self._sections['original']
+
+    def get_version(self, section):
+        """Lấy số phiên bản hiện tại của một nhóm dữ liệu"""
+        return self._sections[section].version
+
+    def get_versions(self):
+        """Lấy số phiên bản của tất cả các nhóm dữ liệu, dùng làm khóa cache"""
+        return tuple(self._sections[section].version for section in self.SECTIONS)
+
+    def get_fingerprint(self, sections=('customer', 'financial', 'collateral')):
+        """Hash nội dung các nhóm dữ liệu; khác số phiên bản, giống nhau giữa các phiên nếu dữ liệu giống nhau"""
+        digest = hashlib.sha256()
+        for section in sections:
+            digest.update(self._sections[section].fingerprint().encode('ascii'))
+        return digest.hexdigest()
+
+    def undo(self):
+        """Hoàn tác lần chỉnh sửa gần nhất"""
+        group, deltas = self.journal.undo_deltas()
+        if group is None:
+            return False
+        self._apply_deltas(deltas)
+        self.journal.record('undo', deltas, self._sections, target=group)
+        return True
+
+    def redo(self):
+        """Làm lại lần chỉnh sửa vừa hoàn tác"""
+        group, deltas = self.journal.redo_deltas()
+        if group is None:
+            return False
+        self._apply_deltas(deltas)
+        self.journal.record('redo', deltas, self._sections, target=group)
+        return True
+
+    def can_undo(self):
+        return self.journal.can_undo()
+
+    def can_redo(self):
+        return self.journal.can_redo()
+
+    def get_state_at(self, seq=None, timestamp=None):
+        """Dựng lại dữ liệu các nhóm tại một thời điểm trong nhật ký chỉnh sửa"""
+        state = self.journal.reconstruct(seq=seq, timestamp=timestamp)
+        return {section: Snapshot(state.get(section, {})) for section in self.SECTIONS}
+
+    def get_edit_history(self):
+        """Lấy lịch sử chỉnh sửa"""
+        return self.journal.history()
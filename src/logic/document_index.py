@@ -0,0 +1,70 @@
+import heapq
+import math
+from collections import Counter, defaultdict
+
+from src.logic.applicant_index import normalize_text
+
+# Âm tiết xuất hiện dày đặc trong PASDV, không giúp phân biệt đoạn trích
+STOPWORDS = {
+    'va', 'cua', 'la', 'cac', 'cho', 'voi', 'the', 'nao', 'co', 'khong', 'duoc', 'trong', 'tai',
+    'theo', 'nay', 'do', 'mot', 'nhung', 'den', 'tu', 've', 'thi', 'gi', 'bao', 'nhieu', 'hay'
+}
+
+
+def tokenize(text):
+    """Tách âm tiết đã chuẩn hóa (bỏ dấu) và thêm cặp âm tiết liền kề (từ ghép tiếng Việt)"""
+    syllables = [token for token in normalize_text(text).split() if token not in STOPWORDS]
+    return syllables + [f"{a}_{b}" for a, b in zip(syllables, syllables[1:])]
+
+
+class DocumentIndex:
+    """Chỉ mục BM25 trên các đoạn trích của file upload, chạy cục bộ không cần dịch vụ ngoài"""
+
+    def __init__(self, chunks, k1=1.5, b=0.75):
+        self.chunks = list(chunks)
+        self.k1 = k1
+        self.b = b
+        self._postings = defaultdict(list)
+        self._lengths = []
+        for position, chunk in enumerate(self.chunks):
+            counts = Counter(tokenize(chunk['noi_dung']))
+            self._lengths.append(sum(counts.values()))
+            for term, freq in counts.items():
+                self._postings[term].append((position, freq))
+        total = len(self._lengths)
+        self._avg_length = sum(self._lengths) / total if total else 0.0
+        self._idf = {
+            term: math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self._postings.items()
+        }
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def search(self, query, k=4, min_score=0.5):
+        """Trả về tối đa k đoạn trích liên quan nhất dạng [{...đoạn trích, 'diem': điểm}]"""
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            idf = self._idf.get(term)
+            if idf is None:
+                continue
+            for position, freq in self._postings[term]:
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[position] / self._avg_length)
+                scores[position] += idf * freq * (self.k1 + 1) / (freq + norm)
+        best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [dict(self.chunks[position], diem=score) for position, score in best if score >= min_score]
+
+
+def format_sources(hits, max_chars=2400):
+    """Ghép các đoạn trích kèm nhãn [Nguồn n – vị trí] để câu trả lời trích dẫn được"""
+    blocks, used = [], 0
+    for hit in hits:
+        text = hit['noi_dung']
+        if used + len(text) > max_chars:
+            text = text[:max(0, max_chars - used)].rstrip()
+            if not text:
+                break
+            text += '…'
+        blocks.append(f"[Nguồn {hit['id']} – {hit['vi_tri']}]\n{text}")
+        used += len(text)
+    return "\n\n".join(blocks)
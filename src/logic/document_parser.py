@@ -1,4 +1,6 @@
 from docx import Document
+from docx.table import Table
+from docx.text.paragraph import Paragraph
 import re
 from datetime import datetime
 
@@ -17,6 +19,15 @@ class DocumentParser:
             'lai_suat': r'Lãi suất:\s*([\d.,]+)%',
             'gia_tri_tai_san': r'Giá trị.*?:\s*([\d.,]+)'
         }
+        # Biên dịch sẵn một lần để dùng lại cho mọi file
+        self.compiled = {
+            name: re.compile(pattern, re.DOTALL if name == 'von_doi_ung' else 0)
+            for name, pattern in self.patterns.items()
+        }
+        self.customer_split = re.compile(r'\d+\. Họ và tên:')
+        self.customer_name = re.compile(r'^([^-]+)')
+        self.asset_value = re.compile(r'Tài sản \d+.*?Giá trị.*?:\s*([\d.,]+)', re.DOTALL)
+        self.asset_address = re.compile(r'Địa chỉ.*?:\s*([^\n]+)')
     
     def parse_document(self, file):
         """Phân tích file docx và trích xuất thông tin"""
@@ -31,6 +42,76 @@ class DocumentParser:
             print(f"Lỗi khi phân tích document: {e}")
             return None
     
+    def extract_chunks(self, file, max_chars=700):
+        """Chia đoạn văn và bảng của file docx thành các đoạn trích (theo thứ tự trong file) để tra cứu"""
+        try:
+            if hasattr(file, 'seek'):
+                file.seek(0)
+            doc = Document(file)
+        except Exception as e:
+            print(f"Lỗi khi đọc document: {e}")
+            return []
+        
+        chunks = []
+        
+        def add_chunk(kind, location, lines):
+            text = "\n".join(lines).strip()
+            if text:
+                chunks.append({'id': len(chunks) + 1, 'loai': kind, 'vi_tri': location, 'noi_dung': text})
+        
+        lines, first_paragraph, paragraph_no, table_no = [], None, 0, 0
+        
+        def flush_paragraphs():
+            if lines:
+                location = f"Đoạn {first_paragraph}" + (
+                    f"-{first_paragraph + len(lines) - 1}" if len(lines) > 1 else ""
+                )
+                add_chunk('doan', location, lines)
+                lines.clear()
+        
+        for child in doc.element.body.iterchildren():
+            if child.tag.endswith('}p'):
+                text = Paragraph(child, doc).text.strip()
+                if not text:
+                    continue
+                paragraph_no += 1
+                if lines and sum(len(line) for line in lines) + len(text) > max_chars:
+                    flush_paragraphs()
+                if not lines:
+                    first_paragraph = paragraph_no
+                lines.append(text)
+            elif child.tag.endswith('}tbl'):
+                flush_paragraphs()
+                table_no += 1
+                rows = []
+                for row in Table(child, doc).rows:
+                    cells = []
+                    for cell in row.cells:
+                        text = ' '.join(cell.text.split())
+                        # Ô gộp được python-docx trả về lặp lại
+                        if text and (not cells or cells[-1] != text):
+                            cells.append(text)
+                    if cells:
+                        rows.append(" | ".join(cells))
+                if not rows:
+                    continue
+                # Mỗi đoạn trích của bảng đều kèm dòng tiêu đề để đọc độc lập được
+                header, body = rows[0], rows[1:]
+                start, group = 1, []
+                for index, row in enumerate(body, start=2):
+                    if group and len(header) + sum(len(item) for item in group) + len(row) > max_chars:
+                        add_chunk('bang', f"Bảng {table_no}, dòng {start}-{index - 1}", [header] + group)
+                        group = []
+                    if not group:
+                        start = index
+                    group.append(row)
+                if group:
+                    add_chunk('bang', f"Bảng {table_no}, dòng {start}-{start + len(group) - 1}", [header] + group)
+                elif not body:
+                    add_chunk('bang', f"Bảng {table_no}", [header])
+        flush_paragraphs()
+        return chunks
+    
     def _extract_data(self, text):
         """Trích xuất dữ liệu từ text sử dụng regex patterns"""
         data = {}
@@ -63,28 +144,28 @@ class DocumentParser:
         customers = []
         
         # Tìm tất cả các khối thông tin khách hàng
-        customer_blocks = re.split(r'\d+\. Họ và tên:', text)
+        customer_blocks = self.customer_split.split(text)
         
         for block in customer_blocks[1:]:  # Bỏ phần đầu không chứa thông tin
             customer = {}
             
             # Họ và tên
-            name_match = re.search(r'^([^-]+)', block)
+            name_match = self.customer_name.search(block)
             if name_match:
                 customer['ho_ten'] = name_match.group(1).strip()
             
             # CCCD
-            cccd_match = re.search(self.patterns['cccd'], block)
+            cccd_match = self.compiled['cccd'].search(block)
             if cccd_match:
                 customer['cccd'] = cccd_match.group(1).strip()
             
             # Địa chỉ
-            address_match = re.search(self.patterns['dia_chi'], block)
+            address_match = self.compiled['dia_chi'].search(block)
             if address_match:
                 customer['dia_chi'] = address_match.group(1).strip()
             
             # Số điện thoại
-            phone_match = re.search(self.patterns['dien_thoai'], block)
+            phone_match = self.compiled['dien_thoai'].search(block)
             if phone_match:
                 customer['dien_thoai'] = phone_match.group(1).strip()
             
@@ -98,32 +179,32 @@ class DocumentParser:
         financial_data = {}
         
         # Tổng nhu cầu vốn
-        total_match = re.search(self.patterns['tong_nhu_cau_von'], text)
+        total_match = self.compiled['tong_nhu_cau_von'].search(text)
         if total_match:
             financial_data['tong_nhu_cau_von'] = self._convert_currency_to_number(total_match.group(1))
         
         # Vốn đối ứng
-        owner_match = re.search(self.patterns['von_doi_ung'], text, re.DOTALL)
+        owner_match = self.compiled['von_doi_ung'].search(text)
         if owner_match:
             financial_data['von_doi_ung'] = self._convert_currency_to_number(owner_match.group(1))
         
         # Số tiền vay
-        loan_match = re.search(self.patterns['so_tien_vay'], text)
+        loan_match = self.compiled['so_tien_vay'].search(text)
         if loan_match:
             financial_data['so_tien_vay'] = self._convert_currency_to_number(loan_match.group(1))
         
         # Mục đích vay
-        purpose_match = re.search(self.patterns['muc_dich_vay'], text)
+        purpose_match = self.compiled['muc_dich_vay'].search(text)
         if purpose_match:
             financial_data['muc_dich_vay'] = purpose_match.group(1).strip()
         
         # Thời gian vay
-        term_match = re.search(self.patterns['thoi_gian_vay'], text)
+        term_match = self.compiled['thoi_gian_vay'].search(text)
         if term_match:
             financial_data['thoi_gian_vay'] = int(term_match.group(1))
         
         # Lãi suất
-        interest_match = re.search(self.patterns['lai_suat'], text)
+        interest_match = self.compiled['lai_suat'].search(text)
         if interest_match:
             financial_data['lai_suat'] = float(interest_match.group(1).replace(',', '.'))
         
@@ -140,19 +221,19 @@ class DocumentParser:
         collateral_data = {}
         
         # Tìm thông tin tài sản
-        asset_match = re.search(r'Tài sản \d+.*?Giá trị.*?:\s*([\d.,]+)', text, re.DOTALL)
+        asset_match = self.asset_value.search(text)
         if asset_match:
             collateral_data['gia_tri_thi_truong'] = self._convert_currency_to_number(asset_match.group(1))
             collateral_data['loai_tai_san'] = "Bất động sản"
         
         # Tìm địa chỉ tài sản
-        address_match = re.search(r'Địa chỉ.*?:\s*([^\n]+)', text)
+        address_match = self.asset_address.search(text)
         if address_match:
             collateral_data['dia_chi_tai_san'] = address_match.group(1).strip()
         
         # Tính LTV
-        if collateral_data.get('gia_tri_thi_truong') and 'so_tien_vay' in self._extract_financial_info(text):
-            financial_data = self._extract_financial_info(text)
+        financial_data = self._extract_financial_info(text) if collateral_data.get('gia_tri_thi_truong') else {}
+        if 'so_tien_vay' in financial_data:
             loan_amount = financial_data.get('so_tien_vay', 0)
             asset_value = collateral_data['gia_tri_thi_truong']
             if asset_value > 0:
@@ -0,0 +1,119 @@
+import time
+from collections import namedtuple
+
+# Giá trị đánh dấu trường chưa tồn tại (trước khi thêm / sau khi xóa)
+MISSING = type('Missing', (), {'__repr__': lambda self: 'MISSING'})()
+
+# Mỗi bản ghi chỉ lưu thay đổi của một trường, không lưu bản sao toàn bộ dữ liệu
+JournalEntry = namedtuple('JournalEntry', ['seq', 'group', 'section', 'field', 'old', 'new'])
+JournalGroup = namedtuple('JournalGroup', ['group', 'action', 'target', 'start', 'end', 'timestamp'])
+Checkpoint = namedtuple('Checkpoint', ['seq', 'timestamp', 'sections'])
+
+
+class EditJournal:
+    """Nhật ký chỉnh sửa chỉ ghi thêm, hỗ trợ hoàn tác/làm lại và dựng lại dữ liệu theo thời điểm"""
+
+    def __init__(self, checkpoint_interval=50):
+        self.checkpoint_interval = checkpoint_interval
+        self.reset({})
+
+    def reset(self, sections):
+        """Bắt đầu nhật ký mới từ trạng thái dữ liệu hiện tại"""
+        self._entries = []
+        self._groups = []
+        self._checkpoints = [Checkpoint(0, time.time(), dict(sections))]
+        self._undo_stack = []
+        self._redo_stack = []
+
+    def __len__(self):
+        return len(self._entries)
+
+    def can_undo(self):
+        return bool(self._undo_stack)
+
+    def can_redo(self):
+        return bool(self._redo_stack)
+
+    def record(self, action, deltas, sections, target=None):
+        """Ghi một nhóm thay đổi (section, field, old, new) vào nhật ký"""
+        if not deltas:
+            return None
+
+        group_id = len(self._groups)
+        start = len(self._entries)
+        for section, field, old, new in deltas:
+            self._entries.append(JournalEntry(len(self._entries) + 1, group_id, section, field, old, new))
+        self._groups.append(JournalGroup(group_id, action, target, start, len(self._entries), time.time()))
+
+        if action == 'edit':
+            self._undo_stack.append(group_id)
+            self._redo_stack.clear()
+        elif action == 'undo':
+            self._redo_stack.append(self._undo_stack.pop())
+        elif action == 'redo':
+            self._undo_stack.append(self._redo_stack.pop())
+
+        # Checkpoint chỉ giữ tham chiếu tới các ảnh chụp bất biến nên không tốn bản sao
+        if len(self._entries) - self._checkpoints[-1].seq >= self.checkpoint_interval:
+            self._checkpoints.append(Checkpoint(len(self._entries), time.time(), dict(sections)))
+
+        return group_id
+
+    def undo_deltas(self):
+        """Lấy các thay đổi ngược để hoàn tác nhóm chỉnh sửa gần nhất"""
+        if not self._undo_stack:
+            return None, []
+        group = self._groups[self._undo_stack[-1]]
+        entries = self._entries[group.start:group.end]
+        return group.group, [(e.section, e.field, e.new, e.old) for e in reversed(entries)]
+
+    def redo_deltas(self):
+        """Lấy các thay đổi để làm lại nhóm vừa hoàn tác"""
+        if not self._redo_stack:
+            return None, []
+        group = self._groups[self._redo_stack[-1]]
+        entries = self._entries[group.start:group.end]
+        return group.group, [(e.section, e.field, e.old, e.new) for e in entries]
+
+    def reconstruct(self, seq=None, timestamp=None):
+        """Dựng lại dữ liệu tại một số thứ tự bản ghi hoặc một thời điểm"""
+        if seq is None:
+            seq = len(self._entries)
+            if timestamp is not None:
+                seq = 0
+                for group in self._groups:
+                    if group.timestamp > timestamp:
+                        break
+                    seq = group.end
+        seq = max(0, min(seq, len(self._entries)))
+
+        checkpoint = self._checkpoints[0]
+        for candidate in self._checkpoints:
+            if candidate.seq > seq:
+                break
+            checkpoint = candidate
+
+        state = {section: dict(data) for section, data in checkpoint.sections.items()}
+        for entry in self._entries[checkpoint.seq:seq]:
+            section = state.setdefault(entry.section, {})
+            if entry.new is MISSING:
+                section.pop(entry.field, None)
+            else:
+                section[entry.field] = entry.new
+        return state
+
+    def history(self):
+        """Tóm tắt các nhóm thay đổi để hiển thị"""
+        return [
+            {
+                'nhom': group.group,
+                'thao_tac': group.action,
+                'thoi_gian': group.timestamp,
+                'seq': group.end,
+                'thay_doi': [
+                    (e.section, e.field, e.old, e.new)
+                    for e in self._entries[group.start:group.end]
+                ]
+            }
+            for group in self._groups
+        ]
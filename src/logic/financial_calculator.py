@@ -4,17 +4,20 @@ class FinancialCalculator:
     
     def calculate_payment_schedule(self, financial_data):
         """Tính toán lịch trả nợ"""
+        return list(self.iter_payment_schedule(financial_data))
+    
+    def iter_payment_schedule(self, financial_data):
+        """Sinh lần lượt từng kỳ của lịch trả nợ (không giữ cả lịch trong bộ nhớ)"""
         loan_amount = financial_data.get('so_tien_vay', 0)
         interest_rate = financial_data.get('lai_suat', 0) / 100 / 12  # Lãi suất hàng tháng
-        loan_term = financial_data.get('thoi_gian_vay', 0)
+        loan_term = int(financial_data.get('thoi_gian_vay', 0) or 0)
         
         if not all([loan_amount, interest_rate, loan_term]):
-            return []
+            return
         
         # Tính toán theo phương thức trả gốc đều
         monthly_payment = self._calculate_monthly_payment(loan_amount, interest_rate, loan_term)
         
-        schedule = []
         remaining_balance = loan_amount
         
         for month in range(1, loan_term + 1):
@@ -27,15 +30,28 @@ class FinancialCalculator:
                 principal_payment += remaining_balance
                 remaining_balance = 0
             
-            schedule.append({
+            yield {
                 'thang': month,
                 'tra_goc': round(principal_payment),
                 'tra_lai': round(interest_payment),
                 'tong_tra': round(principal_payment + interest_payment),
                 'goc_con_lai': max(0, round(remaining_balance))
-            })
-        
-        return schedule
+            }
+    
+    def summarize_schedule_by_year(self, payment_schedule):
+        """Tổng hợp lịch trả nợ theo năm: tổng gốc/lãi trong năm và dư nợ gốc cuối năm"""
+        years = []
+        for row in payment_schedule:
+            year = (row['thang'] - 1) // 12 + 1
+            if not years or years[-1]['nam'] != year:
+                years.append({'nam': year, 'so_ky': 0, 'tra_goc': 0, 'tra_lai': 0, 'tong_tra': 0, 'goc_con_lai': 0})
+            summary = years[-1]
+            summary['so_ky'] += 1
+            summary['tra_goc'] += row['tra_goc']
+            summary['tra_lai'] += row['tra_lai']
+            summary['tong_tra'] += row['tong_tra']
+            summary['goc_con_lai'] = row['goc_con_lai']
+        return years
     
     def _calculate_monthly_payment(self, loan_amount, monthly_rate, loan_term):
         """Tính toán khoản trả hàng tháng"""
@@ -44,14 +60,19 @@ class FinancialCalculator:
         
         return loan_amount * monthly_rate * (1 + monthly_rate) ** loan_term / ((1 + monthly_rate) ** loan_term - 1)
     
-    def calculate_financial_metrics(self, financial_data, customer_data):
-        """Tính toán các chỉ số tài chính"""
+    def calculate_financial_metrics(self, financial_data, customer_data, collateral_data=None):
+        """Tính toán các chỉ số tài chính
+
+        Chỉ số tính từ số liệu giả định (không có trong hồ sơ) được liệt kê ở 'chi_so_gia_dinh'.
+        """
         loan_amount = financial_data.get('so_tien_vay', 0)
         interest_rate = financial_data.get('lai_suat', 0)
         loan_term = financial_data.get('thoi_gian_vay', 0)
-        asset_value = financial_data.get('gia_tri_tai_san', 0)
+        asset_value = (collateral_data or {}).get('gia_tri_thi_truong') or financial_data.get('gia_tri_tai_san') or 0
         
         metrics = {}
+        monthly_payment = 0
+        assumed = []
         
         # Tính nghĩa vụ trả nợ hàng tháng
         if all([loan_amount, interest_rate, loan_term]):
@@ -59,20 +80,33 @@ class FinancialCalculator:
             monthly_payment = self._calculate_monthly_payment(loan_amount, monthly_rate, loan_term)
             metrics['monthly_payment'] = monthly_payment
         
-        # Tính LTV (Loan-to-Value)
-        if asset_value > 0:
+        # Tính LTV (Loan-to-Value) theo giá trị thị trường của tài sản bảo đảm
+        if loan_amount and asset_value > 0:
             metrics['ltv'] = (loan_amount / asset_value) * 100
         
-        # Tính DSR (Debt Service Ratio) - Giả định thu nhập từ dữ liệu mẫu
-        monthly_income = 100000000  # Giả định từ dữ liệu mẫu
+        # Thu nhập/chi phí hàng tháng lấy từ hồ sơ; thiếu thì dùng số liệu mẫu và đánh dấu giả định
+        monthly_income = financial_data.get('tong_thu_nhap') or 0
+        monthly_expenses = financial_data.get('chi_phi_sinh_hoat') or 0
+        income_assumed = not monthly_income
+        expenses_assumed = not monthly_expenses
+        if income_assumed:
+            monthly_income = 100000000  # Giả định từ dữ liệu mẫu
+        if expenses_assumed:
+            monthly_expenses = 45000000  # Giả định từ dữ liệu mẫu
+        
+        # Tính DSR (Debt Service Ratio)
         if monthly_payment and monthly_income > 0:
             metrics['dsr_ratio'] = (monthly_payment / monthly_income) * 100
+            if income_assumed:
+                assumed.append('dsr_ratio')
         
         # Tính biên an toàn trả nợ
-        monthly_expenses = 45000000  # Giả định từ dữ liệu mẫu
-        if monthly_income and monthly_expenses:
-            disposable_income = monthly_income - monthly_expenses
-            if monthly_payment and disposable_income > 0:
-                metrics['safety_margin'] = ((disposable_income - monthly_payment) / disposable_income) * 100
+        disposable_income = monthly_income - monthly_expenses
+        if monthly_payment and disposable_income > 0:
+            metrics['safety_margin'] = ((disposable_income - monthly_payment) / disposable_income) * 100
+            if income_assumed or expenses_assumed:
+                assumed.append('safety_margin')
         
-        return metrics
\ No newline at end of file
+        if assumed:
+            metrics['chi_so_gia_dinh'] = assumed
+        return metrics
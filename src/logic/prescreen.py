@@ -0,0 +1,198 @@
+import json
+import operator
+import os
+import time
+
+# Kết luận sàng lọc
+TU_CHOI = 'tu_choi'
+CAN_XEM_XET = 'can_xem_xet'
+DAT = 'dat'
+
+VERDICT_LABELS = {
+    TU_CHOI: "Không đạt chính sách",
+    CAN_XEM_XET: "Cần xem xét thêm",
+    DAT: "Đạt chính sách"
+}
+
+DEFAULT_RULES_PATH = os.environ.get('CADAP_PRESCREEN_RULES', os.path.join('config', 'prescreen_rules.json'))
+
+OPERATORS = {
+    '>': operator.gt,
+    '>=': operator.ge,
+    '<': operator.lt,
+    '<=': operator.le
+}
+
+# muc: mức độ khi điều kiện đúng; khi_thieu: mức độ khi không có dữ liệu (None = bỏ qua)
+# Giá trị 0/rỗng là giá trị mặc định khi hồ sơ không có dòng tương ứng, nên được coi là thiếu dữ liệu
+DEFAULT_RULES = [
+    {'ma': 'DSR_TOI_DA', 'ten': "DSR vượt mức tối đa", 'truong': 'dsr_ratio', 'toan_tu': '>', 'nguong': 70,
+     'muc': TU_CHOI, 'khi_thieu': CAN_XEM_XET},
+    {'ma': 'DSR_CANH_BAO', 'ten': "DSR ở vùng cảnh báo", 'truong': 'dsr_ratio', 'toan_tu': '>', 'nguong': 50,
+     'muc': CAN_XEM_XET},
+    {'ma': 'LTV_TOI_DA', 'ten': "LTV vượt mức tối đa", 'truong': 'ltv', 'toan_tu': '>', 'nguong': 85,
+     'muc': TU_CHOI, 'khi_thieu': CAN_XEM_XET},
+    {'ma': 'LTV_CANH_BAO', 'ten': "LTV ở vùng cảnh báo", 'truong': 'ltv', 'toan_tu': '>', 'nguong': 70,
+     'muc': CAN_XEM_XET},
+    {'ma': 'BIEN_AN_TOAN_AM', 'ten': "Thu nhập còn lại không đủ trả nợ", 'truong': 'safety_margin',
+     'toan_tu': '<', 'nguong': 0, 'muc': TU_CHOI},
+    {'ma': 'BIEN_AN_TOAN_THAP', 'ten': "Biên an toàn trả nợ thấp", 'truong': 'safety_margin',
+     'toan_tu': '<', 'nguong': 20, 'muc': CAN_XEM_XET},
+    {'ma': 'VON_DOI_UNG_TOI_THIEU', 'ten': "Vốn đối ứng dưới mức tối thiểu", 'truong': 'ty_le_von_doi_ung',
+     'toan_tu': '<', 'nguong': 10, 'muc': TU_CHOI, 'khi_thieu': CAN_XEM_XET},
+    {'ma': 'VON_DOI_UNG_THAP', 'ten': "Vốn đối ứng thấp", 'truong': 'ty_le_von_doi_ung',
+     'toan_tu': '<', 'nguong': 20, 'muc': CAN_XEM_XET},
+    {'ma': 'THOI_HAN_DAI', 'ten': "Thời hạn vay dài", 'truong': 'thoi_gian_vay', 'toan_tu': '>', 'nguong': 300,
+     'muc': CAN_XEM_XET},
+    {'ma': 'THIEU_SO_TIEN_VAY', 'ten': "Chưa có số tiền vay", 'truong': 'so_tien_vay', 'toan_tu': '<=',
+     'nguong': 0, 'muc': CAN_XEM_XET, 'khi_thieu': CAN_XEM_XET}
+]
+
+_SEVERITY = {DAT: 0, CAN_XEM_XET: 1, TU_CHOI: 2}
+
+# Khóa liệt kê các chỉ số tính từ số liệu giả định (xem FinancialCalculator.calculate_financial_metrics)
+ASSUMED_KEY = 'chi_so_gia_dinh'
+
+
+def load_rules(path=DEFAULT_RULES_PATH):
+    """Bộ quy tắc mặc định, ghi đè bằng file JSON nếu có
+
+    File JSON có thể là danh sách quy tắc (thay toàn bộ) hoặc {mã quy tắc: {trường ghi đè}};
+    quy tắc có mã mới được thêm vào, {"bat": false} để tắt một quy tắc.
+    """
+    rules = [dict(rule) for rule in DEFAULT_RULES]
+    if not path or not os.path.exists(path):
+        return rules
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            overrides = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Lỗi khi đọc quy tắc sàng lọc: {e}")
+        return rules
+    if isinstance(overrides, list):
+        valid = [dict(rule) for rule in overrides if _check_rule(rule)]
+        if not valid:
+            print("Lỗi quy tắc sàng lọc: không có quy tắc hợp lệ, dùng bộ quy tắc mặc định")
+            return rules
+        return valid
+    if not isinstance(overrides, dict):
+        print("Lỗi quy tắc sàng lọc: file phải là danh sách quy tắc hoặc {mã quy tắc: {trường ghi đè}}")
+        return rules
+    by_code = {rule['ma']: index for index, rule in enumerate(rules)}
+    for code, override in overrides.items():
+        if not isinstance(override, dict):
+            print(f"Lỗi quy tắc sàng lọc {code}: giá trị ghi đè phải là object, bỏ qua")
+            continue
+        if code in by_code:
+            # Ghi đè sai thì giữ nguyên quy tắc mặc định
+            merged = dict(rules[by_code[code]], **override)
+            if _check_rule(merged):
+                rules[by_code[code]] = merged
+        else:
+            rule = dict(override, ma=code)
+            if _check_rule(rule):
+                rules.append(rule)
+    return rules
+
+
+def _check_rule(rule):
+    """Kiểm tra một quy tắc đọc từ file, in lỗi và trả về False nếu không dùng được"""
+    if not isinstance(rule, dict):
+        print(f"Lỗi quy tắc sàng lọc: quy tắc phải là object, bỏ qua {rule!r}")
+        return False
+    code = rule.get('ma') or '?'
+    missing = [key for key in ('ma', 'truong', 'toan_tu', 'nguong', 'muc') if rule.get(key) in (None, '')]
+    if missing:
+        error = f"thiếu {', '.join(missing)}"
+    elif rule['toan_tu'] not in OPERATORS:
+        error = f"toán tử không hỗ trợ {rule['toan_tu']!r}"
+    elif isinstance(rule['nguong'], bool) or not isinstance(rule['nguong'], (int, float)):
+        error = f"ngưỡng phải là số, nhận {rule['nguong']!r}"
+    elif rule['muc'] not in _SEVERITY or rule.get('khi_thieu') not in (None, *_SEVERITY):
+        error = "mức độ phải là một trong " + ', '.join(_SEVERITY)
+    else:
+        return True
+    print(f"Lỗi quy tắc sàng lọc {code}: {error}, bỏ qua")
+    return False
+
+
+class PrescreenEngine:
+    """Sàng lọc hồ sơ theo quy tắc chính sách trước khi gửi Gemini (xác định, chạy cục bộ)"""
+
+    def __init__(self, rules=None):
+        self.rules = load_rules() if rules is None else rules
+        # Biên dịch sẵn thành tuple để mỗi lần đánh giá chỉ còn tra cứu và so sánh
+        self._compiled = [
+            (rule['ma'], rule.get('ten', rule['ma']), rule['truong'], rule['toan_tu'],
+             OPERATORS[rule['toan_tu']], rule['nguong'], rule['muc'], rule.get('khi_thieu'))
+            for rule in self.rules if rule.get('bat', True)
+        ]
+
+    def evaluate(self, *sections):
+        """Đánh giá các nhóm dữ liệu (ưu tiên nhóm đứng trước, ví dụ chỉ số tính toán trước dữ liệu nhập)
+
+        Giá trị 0/rỗng và chỉ số tính từ số liệu giả định được coi là thiếu dữ liệu, nên chỉ dữ liệu
+        thực của hồ sơ mới dẫn tới kết luận cuối cùng (đạt hoặc từ chối).
+        Trả về {'ket_luan', 'phat_hien': [...], 'thoi_gian_us'}.
+        """
+        start = time.perf_counter()
+        findings = []
+        verdict = DAT
+        flagged = set()
+        assumed = [set(section.get(ASSUMED_KEY) or ()) if section else set() for section in sections]
+        for code, name, field, symbol, compare, threshold, level, when_missing in self._compiled:
+            # Mỗi trường chỉ báo một lần (quy tắc nghiêm ngặt hơn đứng trước)
+            if field in flagged:
+                continue
+            value = None
+            for section, section_assumed in zip(sections, assumed):
+                if not section or field in section_assumed:
+                    continue
+                candidate = section.get(field)
+                if candidate not in (None, '') and candidate != 0:
+                    value = candidate
+                    break
+            if value is None:
+                if when_missing is None:
+                    continue
+                findings.append({'ma': code, 'ten': f"Thiếu dữ liệu {field} để kiểm tra: {name}", 'muc': when_missing,
+                                 'truong': field, 'gia_tri': None, 'nguong': threshold})
+                level_hit = when_missing
+            else:
+                try:
+                    triggered = compare(float(value), threshold)
+                except (TypeError, ValueError):
+                    continue
+                if not triggered:
+                    continue
+                findings.append({'ma': code, 'ten': name, 'muc': level, 'truong': field,
+                                 'gia_tri': float(value), 'nguong': threshold, 'toan_tu': symbol})
+                level_hit = level
+            flagged.add(field)
+            if _SEVERITY[level_hit] > _SEVERITY[verdict]:
+                verdict = level_hit
+        return {
+            'ket_luan': verdict,
+            'phat_hien': findings,
+            'thoi_gian_us': (time.perf_counter() - start) * 1e6
+        }
+
+    def needs_ai(self, result):
+        """Chỉ hồ sơ ở vùng biên mới cần Gemini phân tích"""
+        return result['ket_luan'] == CAN_XEM_XET
+
+
+def format_findings(result):
+    """Diễn giải kết quả sàng lọc thành văn bản (dùng cho prompt và kết luận nhanh)"""
+    lines = [f"KẾT QUẢ SÀNG LỌC THEO QUY TẮC: {VERDICT_LABELS[result['ket_luan']]}"]
+    for finding in result['phat_hien']:
+        if finding['gia_tri'] is None:
+            lines.append(f"- [{finding['ma']}] {finding['ten']}")
+        else:
+            lines.append(
+                f"- [{finding['ma']}] {finding['ten']}: {finding['truong']} = {finding['gia_tri']:,.1f} "
+                f"({finding['toan_tu']} {finding['nguong']})"
+            )
+    if not result['phat_hien']:
+        lines.append("- Không vi phạm quy tắc nào")
+    return "\n".join(lines)
@@ -0,0 +1,169 @@
+"""Benchmark thời gian import và bộ nhớ khi khởi động theo từng module
+
+Mỗi module được import trong một tiến trình Python mới (khởi động lạnh, không dùng lại module
+đã nạp), đo thời gian import, bộ nhớ tăng thêm so với trình thông dịch rỗng và các thư viện nặng
+bị kéo theo. Với --budget, trả mã lỗi 1 nếu module nào vượt ngân sách thời gian.
+
+Ví dụ:
+    python -m src.startup_benchmark --repeat 3
+    python -m src.startup_benchmark src.ui.tabs --budget 1500 --detail 10
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+DEFAULT_MODULES = [
+    'src.ui.tabs',
+    'src.ui.resources',
+    'src.ui.components',
+    'src.export.report_exporter',
+    'src.export.chart_renderer',
+    'src.export.docx_template',
+    'src.export.export_queue',
+    'src.export.excel_exporter',
+    'src.export.portfolio_exporter',
+    'src.export.arrow_exporter',
+    'src.ai.gemini_client',
+    'src.ai.batch_queue',
+    'src.logic.document_parser',
+    'src.logic.data_manager'
+]
+
+# Thư viện nặng cần theo dõi: module của ứng dụng không nên kéo theo khi chưa dùng tới
+HEAVY_PACKAGES = [
+    'streamlit', 'pandas', 'numpy', 'matplotlib', 'reportlab', 'docx', 'openpyxl', 'pyarrow',
+    'google.ai.generativelanguage_v1beta'
+]
+
+# Chạy trong tiến trình con: import module rồi in kết quả dạng JSON ra stdout
+_PROBE = """
+import importlib, json, sys, time
+name = sys.argv[1]
+start = time.perf_counter()
+error = None
+if name:
+    try:
+        importlib.import_module(name)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+elapsed = time.perf_counter() - start
+try:
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        rss //= 1024
+except ImportError:
+    rss = 0
+print(json.dumps({
+    'thoi_gian_ms': elapsed * 1000,
+    'rss_kb': rss,
+    'loi': error,
+    'thu_vien_nang': [pkg for pkg in json.loads(sys.argv[2]) if pkg in sys.modules]
+}))
+"""
+
+
+def parse_importtime(stderr, limit=None, exclude=()):
+    """Các import tốn thời gian nhất (cộng dồn) từ đầu ra của python -X importtime
+
+    exclude: các module trình thông dịch rỗng (và đoạn mã đo) đã tự import, không tính cho module được đo.
+    """
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        try:
+            entries.append((int(cumulative), name.rstrip()))
+        except ValueError:
+            continue
+    # Chỉ lấy import cấp cao nhất của từng nhánh (tên không thụt lề sau dấu cách đầu tiên)
+    top_level = [
+        (us, name.strip()) for us, name in entries
+        if not name[1:].startswith(' ') and name.strip() not in exclude
+    ]
+    top_level.sort(reverse=True)
+    return [{'module': name, 'ms': us / 1000} for us, name in top_level[:limit]]
+
+
+def measure(module, cwd, detail=0, exclude=()):
+    """Import module trong tiến trình Python mới, trả về kết quả đo"""
+    command = [sys.executable]
+    if detail:
+        command += ['-X', 'importtime']
+    command += ['-c', _PROBE, module, json.dumps(HEAVY_PACKAGES)]
+    completed = subprocess.run(command, cwd=cwd, capture_output=True, text=True)
+    try:
+        result = json.loads(completed.stdout.strip().splitlines()[-1])
+    except (IndexError, ValueError):
+        result = {'thoi_gian_ms': 0.0, 'rss_kb': 0, 'thu_vien_nang': [],
+                  'loi': (completed.stderr.strip().splitlines() or ["không rõ"])[-1]}
+    if detail:
+        result['chi_tiet'] = parse_importtime(completed.stderr, detail, exclude)
+    return result
+
+
+def run_benchmark(modules=None, repeat=3, detail=0, cwd=None):
+    """Đo từng module repeat lần (lấy trung vị), kèm mức nền của trình thông dịch rỗng"""
+    cwd = cwd or os.getcwd()
+    baseline = [measure('', cwd) for _ in range(repeat)]
+    baseline_rss = statistics.median(run['rss_kb'] for run in baseline)
+    baseline_modules = set()
+    if detail:
+        baseline_modules = {entry['module'] for entry in measure('', cwd, detail=10 ** 6)['chi_tiet']}
+
+    results = []
+    for module in modules or DEFAULT_MODULES:
+        runs = [measure(module, cwd) for _ in range(repeat)]
+        result = {
+            'module': module,
+            'thoi_gian_ms': statistics.median(run['thoi_gian_ms'] for run in runs),
+            'thoi_gian_max_ms': max(run['thoi_gian_ms'] for run in runs),
+            'bo_nho_them_mb': (statistics.median(run['rss_kb'] for run in runs) - baseline_rss) / 1024,
+            'thu_vien_nang': runs[-1]['thu_vien_nang'],
+            'loi': runs[-1]['loi']
+        }
+        if detail:
+            result['chi_tiet'] = measure(module, cwd, detail, baseline_modules)['chi_tiet']
+        results.append(result)
+    return {'python': sys.version.split()[0], 'lap': repeat, 'rss_nen_mb': baseline_rss / 1024, 'modules': results}
+
+
+def format_report(result, budget=None):
+    lines = [
+        f"Python {result['python']}, trung vị {result['lap']} lần, trình thông dịch rỗng {result['rss_nen_mb']:.1f} MB",
+        f"{'Module':<32} {'Import (ms)':>12} {'Bộ nhớ (MB)':>12}  Thư viện nặng bị nạp"
+    ]
+    for item in result['modules']:
+        flag = " (vượt ngân sách)" if budget is not None and item['thoi_gian_ms'] > budget else ""
+        heavy = ", ".join(item['thu_vien_nang']) or "-"
+        lines.append(
+            f"{item['module']:<32} {item['thoi_gian_ms']:>12.1f} {item['bo_nho_them_mb']:>12.1f}  {heavy}{flag}"
+        )
+        if item['loi']:
+            lines.append(f"    Lỗi: {item['loi']}")
+        for entry in item.get('chi_tiet', []):
+            lines.append(f"    {entry['module']:<40} {entry['ms']:>9.1f} ms")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark thời gian import khi khởi động theo từng module")
+    parser.add_argument('modules', nargs='*', help="Module cần đo (mặc định các module chính của ứng dụng)")
+    parser.add_argument('--repeat', type=int, default=3, help="Số lần đo mỗi module (lấy trung vị)")
+    parser.add_argument('--detail', type=int, default=0, help="Liệt kê N import tốn thời gian nhất của mỗi module")
+    parser.add_argument('--budget', type=float, default=None, help="Ngân sách thời gian import mỗi module (ms)")
+    parser.add_argument('--json', action='store_true', help="In kết quả dạng JSON")
+    args = parser.parse_args(argv)
+
+    result = run_benchmark(args.modules, repeat=args.repeat, detail=args.detail)
+    print(json.dumps(result, ensure_ascii=False, indent=2) if args.json else format_report(result, args.budget))
+    if args.budget is not None and any(item['thoi_gian_ms'] > args.budget for item in result['modules']):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,4 @@
 import streamlit as st
-import pandas as pd
-import matplotlib.pyplot as plt
-import matplotlib
-matplotlib.use('Agg')
 
 def format_currency(value):
     """Định dạng số tiền với dấu phân cách hàng nghìn"""
@@ -39,6 +35,15 @@ def create_number_input(label, key, value=0, min_value=0, max_value=100000000000
     
     return new_value
 
+def render_stream(chunks, placeholder, cursor="▌"):
+    """Hiển thị dần các đoạn văn bản streaming vào placeholder, trả về toàn bộ nội dung"""
+    text = ""
+    for chunk in chunks:
+        text += chunk
+        placeholder.markdown(text + cursor)
+    placeholder.markdown(text)
+    return text
+
 def display_financial_metrics(metrics):
     """Hiển thị các chỉ số tài chính"""
     if not metrics:
@@ -71,72 +76,63 @@ def display_financial_metrics(metrics):
             f"{metrics.get('safety_margin', 0):.1f}%"
         )
 
-def create_payment_schedule_chart(payment_schedule):
-    """Tạo biểu đồ lịch trả nợ"""
-    if not payment_schedule:
-        st.warning("Không có dữ liệu lịch trả nợ")
-        return
-    
-    df = pd.DataFrame(payment_schedule)
-    
-    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(15, 5))
-    
-    # Biểu đồ dòng tiền
-    ax1.plot(df['thang'], df['goc_con_lai'], marker='o', linewidth=2)
-    ax1.set_title('Dư nợ gốc theo thời gian')
-    ax1.set_xlabel('Tháng')
-    ax1.set_ylabel('Dư nợ gốc (VNĐ)')
-    ax1.grid(True, alpha=0.3)
-    ax1.tick_params(axis='x', rotation=45)
-    
-    # Biểu đồ phân bổ trả nợ
-    months = df['thang'][::max(1, len(df)//10)]  # Hiển thị 10 mốc
-    principal = df['tra_goc'][::max(1, len(df)//10)]
-    interest = df['tra_lai'][::max(1, len(df)//10)]
-    
-    x = range(len(months))
-    width = 0.35
+SCHEDULE_LABELS = {
+    'thang': "Tháng",
+    'nam': "Năm",
+    'so_ky': "Số kỳ",
+    'tra_goc': "Trả gốc",
+    'tra_lai': "Trả lãi",
+    'tong_tra': "Tổng trả",
+    'goc_con_lai': "Gốc còn lại"
+}
+MONEY_COLUMNS = ('tra_goc', 'tra_lai', 'tong_tra', 'goc_con_lai')
+
+def create_schedule_viewer(payment_schedule, calculator, key, page_sizes=(12, 24, 60)):
+    """Bảng lịch trả nợ phân trang phía máy chủ: chỉ trang đang xem (hoặc bảng theo năm) được gửi lên trình duyệt"""
+    import pandas as pd
     
-    ax2.bar(x, principal, width, label='Trả gốc', alpha=0.7)
-    ax2.bar([i + width for i in x], interest, width, label='Trả lãi', alpha=0.7)
-    ax2.set_title('Phân bổ trả nợ theo tháng')
-    ax2.set_xlabel('Tháng')
-    ax2.set_ylabel('Số tiền (VNĐ)')
-    ax2.legend()
-    ax2.grid(True, alpha=0.3)
-    ax2.set_xticks([i + width/2 for i in x])
-    ax2.set_xticklabels(months, rotation=45)
+    col1, col2, col3 = st.columns([2, 1, 1])
+    with col1:
+        mode = st.radio("Hiển thị", ["Theo tháng", "Tổng hợp theo năm"], horizontal=True, key=f"{key}_mode")
+    rows = payment_schedule if mode == "Theo tháng" else calculator.summarize_schedule_by_year(payment_schedule)
+    with col2:
+        page_size = st.selectbox("Số dòng mỗi trang", page_sizes, index=1, key=f"{key}_page_size")
+    pages = max(1, (len(rows) + page_size - 1) // page_size)
+    with col3:
+        # Khóa theo chế độ và cỡ trang để số trang cũ không vượt quá số trang mới
+        page = st.number_input(
+            f"Trang (/{pages})", min_value=1, max_value=pages, value=1, key=f"{key}_page_{mode}_{page_size}"
+        )
     
-    plt.tight_layout()
-    st.pyplot(fig)
+    start = (page - 1) * page_size
+    visible = rows[start:start + page_size]
+    # Chỉ định dạng các dòng của trang đang xem (số tiền phân cách hàng nghìn bằng dấu chấm)
+    frame = pd.DataFrame([
+        {
+            SCHEDULE_LABELS[column]: format_currency(value) if column in MONEY_COLUMNS else value
+            for column, value in row.items()
+        }
+        for row in visible
+    ])
+    st.dataframe(frame, use_container_width=True, hide_index=True)
+    st.caption(f"Dòng {start + 1}–{start + len(visible)} / {len(rows)}")
+
+def create_payment_schedule_chart(payment_schedule, renderer):
+    """Tạo biểu đồ lịch trả nợ (ảnh dựng sẵn, dùng lại khi dữ liệu không đổi)"""
+    image = renderer.payment_schedule_chart(payment_schedule)
+    if image is None:
+        st.warning("Không có dữ liệu lịch trả nợ")
+        return
+    st.image(image, use_column_width=True)
 
-def create_financial_pie_chart(financial_data):
+def create_financial_pie_chart(financial_data, renderer):
     """Tạo biểu đồ tròn phân bổ tài chính"""
     if not financial_data:
         st.warning("Không có dữ liệu để tạo biểu đồ")
         return
     
-    labels = ['Vốn vay', 'Vốn đối ứng']
-    sizes = [
-        financial_data.get('so_tien_vay', 0),
-        financial_data.get('von_doi_ung', 0)
-    ]
-    
-    if sum(sizes) == 0:
+    image = renderer.financial_pie_chart(financial_data)
+    if image is None:
         st.warning("Không có dữ liệu vốn")
         return
-    
-    colors = ['#ff9999', '#66b3ff']
-    
-    fig, ax = plt.subplots(figsize=(8, 8))
-    wedges, texts, autotexts = ax.pie(
-        sizes, labels=labels, colors=colors, autopct='%1.1f%%',
-        startangle=90
-    )
-    
-    for autotext in autotexts:
-        autotext.set_color('white')
-        autotext.set_fontweight('bold')
-    
-    ax.set_title('Phân bổ nguồn vốn')
-    st.pyplot(fig)
\ No newline at end of file
+    st.image(image, use_column_width=True)
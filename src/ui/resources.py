@@ -0,0 +1,232 @@
+import functools
+import os
+import threading
+import time
+
+import streamlit as st
+
+# Tài nguyên dùng chung cho toàn bộ tiến trình Streamlit (mọi phiên làm việc),
+# kèm thống kê số lần gọi / số lần khởi tạo để theo dõi và xóa khi cần.
+# Mỗi hàm khởi tạo tự import lớp của mình: thư viện nặng (pandas, openpyxl, pyarrow, reportlab,
+# matplotlib, python-docx, google-ai-generativelanguage) chỉ được nạp khi tài nguyên được dùng lần đầu.
+_REGISTRY = {}
+_STATS = {}
+_STATS_LOCK = threading.Lock()
+# Đối tượng đã khởi tạo của từng tài nguyên (để giải phóng khi xóa) và tài nguyên phụ thuộc vào nó
+_INSTANCES = {}
+_DEPENDENTS = {}
+
+# CADAP_GEMINI_BACKEND=fake: dùng backend giả cục bộ (chạy thử/CI không cần API key)
+GEMINI_BACKEND = os.environ.get('CADAP_GEMINI_BACKEND', 'google')
+
+
+def shared_resource(name, description, depends_on=()):
+    """Decorator: biến hàm khởi tạo thành tài nguyên dùng chung có thống kê
+
+    depends_on: tài nguyên mà đối tượng này giữ tham chiếu; xóa chúng thì tài nguyên này cũng bị xóa.
+    """
+    def decorator(factory):
+        @st.cache_resource(show_spinner=False)
+        def cached(*args):
+            start = time.perf_counter()
+            value = factory(*args)
+            elapsed = time.perf_counter() - start
+            with _STATS_LOCK:
+                stats = _STATS[name]
+                stats['khoi_tao'] += 1
+                stats['thoi_gian_khoi_tao'] += elapsed
+                stats['lan_cuoi'] = time.time()
+                _INSTANCES.setdefault(name, []).append(value)
+            return value
+
+        @functools.wraps(factory)
+        def getter(*args):
+            with _STATS_LOCK:
+                _STATS[name]['goi'] += 1
+            return cached(*args)
+
+        getter.clear = cached.clear
+        _REGISTRY[name] = getter
+        for dependency in depends_on:
+            _DEPENDENTS.setdefault(dependency, []).append(name)
+        _STATS[name] = {
+            'mo_ta': description,
+            'goi': 0,
+            'khoi_tao': 0,
+            'thoi_gian_khoi_tao': 0.0,
+            'lan_cuoi': None
+        }
+        return getter
+    return decorator
+
+
+@shared_resource('document_parser', "Bộ phân tích PASDV (regex biên dịch sẵn)")
+def get_document_parser():
+    from src.logic.document_parser import DocumentParser
+    return DocumentParser()
+
+
+@shared_resource('financial_calculator', "Bộ tính toán tài chính")
+def get_financial_calculator():
+    from src.logic.financial_calculator import FinancialCalculator
+    return FinancialCalculator()
+
+
+@shared_resource('prescreen_engine', "Bộ quy tắc sàng lọc hồ sơ")
+def get_prescreen_engine():
+    from src.logic.prescreen import PrescreenEngine
+    return PrescreenEngine()
+
+
+@shared_resource('excel_exporter', "Xuất Excel")
+def get_excel_exporter():
+    from src.export.excel_exporter import ExcelExporter
+    return ExcelExporter()
+
+
+@shared_resource('chart_renderer', "Ảnh biểu đồ dựng sẵn (LRU theo hash dữ liệu)")
+def get_chart_renderer():
+    from src.export.chart_renderer import ChartRenderer
+    return ChartRenderer()
+
+
+@shared_resource('report_exporter', "Xuất báo cáo Word/PDF (font, style)")
+def get_report_exporter():
+    from src.export.report_exporter import ReportExporter
+    return ReportExporter(get_chart_renderer())
+
+
+@shared_resource('artifact_cache', "Cache file xuất (Excel/Word/PDF) theo hash dữ liệu")
+def get_artifact_cache():
+    from src.export.artifact_cache import ExportArtifactCache
+    return ExportArtifactCache()
+
+
+@shared_resource('export_queue', "Hàng đợi xuất báo cáo (nhóm tiến trình)", depends_on=('artifact_cache',))
+def get_export_queue():
+    from src.export.export_queue import ExportJobQueue
+    return ExportJobQueue(cache=get_artifact_cache())
+
+
+@shared_resource('arrow_exporter', "Xuất/nhập Parquet")
+def get_arrow_exporter():
+    from src.export.arrow_exporter import ArrowExporter
+    return ArrowExporter()
+
+
+@shared_resource('portfolio_exporter', "Xuất workbook danh mục theo chi nhánh")
+def get_portfolio_exporter():
+    from src.export.portfolio_exporter import PortfolioExporter
+    return PortfolioExporter(get_financial_calculator(), get_excel_exporter(), get_prescreen_engine())
+
+
+@shared_resource('case_store', "Kho hồ sơ SQLite")
+def get_case_store():
+    from src.logic.case_store import CaseStore
+    return CaseStore()
+
+
+@shared_resource('applicant_index', "Chỉ mục tra cứu người vay", depends_on=('case_store',))
+def get_applicant_index():
+    from src.logic.applicant_index import ApplicantIndex
+    return ApplicantIndex().build_from_store(get_case_store())
+
+
+@shared_resource('gemini_model', "Model Gemini đã cấu hình (theo API key)")
+def get_gemini_model(api_key):
+    if GEMINI_BACKEND == 'fake':
+        from src.ai.fake_backend import FakeGeminiBackend
+        return FakeGeminiBackend()
+    from src.ai.gemini_client import create_model
+    return create_model(api_key)
+
+
+def use_fake_backend():
+    """Ứng dụng đang chạy với backend Gemini giả"""
+    return GEMINI_BACKEND == 'fake'
+
+
+@shared_resource('response_cache', "Cache phản hồi Gemini (bộ nhớ + đĩa)")
+def get_response_cache():
+    from src.ai.response_cache import ResponseCache
+    return ResponseCache()
+
+
+@shared_resource('semantic_cache', "Cache câu trả lời chatbox theo độ tương đồng câu hỏi")
+def get_semantic_cache():
+    from src.ai.semantic_cache import SemanticAnswerCache
+    return SemanticAnswerCache()
+
+
+@shared_resource('gemini_transport', "Kết nối Gemini (giới hạn tốc độ, ngắt mạch)")
+def get_gemini_transport():
+    from src.ai.transport import GeminiTransport
+    return GeminiTransport()
+
+
+@shared_resource(
+    'batch_queue', "Hàng đợi thẩm định AI hàng loạt",
+    depends_on=('case_store', 'response_cache', 'gemini_transport', 'financial_calculator', 'prescreen_engine')
+)
+def get_batch_queue():
+    from src.ai.batch_queue import BatchAppraisalQueue
+    return BatchAppraisalQueue(
+        get_case_store(), get_response_cache(), get_gemini_transport(), get_financial_calculator(),
+        get_prescreen_engine()
+    )
+
+
+def _busy(name):
+    """Tên các tài nguyên (name và các tài nguyên phụ thuộc) đang có công việc chạy nền"""
+    busy = []
+    with _STATS_LOCK:
+        instances = list(_INSTANCES.get(name, []))
+    if any(getattr(value, 'is_busy', lambda: False)() for value in instances):
+        busy.append(name)
+    for dependent in _DEPENDENTS.get(name, []):
+        busy.extend(_busy(dependent))
+    return busy
+
+
+def _drop(name):
+    for dependent in _DEPENDENTS.get(name, []):
+        _drop(dependent)
+    with _STATS_LOCK:
+        instances = _INSTANCES.pop(name, [])
+        _STATS[name]['lan_cuoi'] = None
+    _REGISTRY[name].clear()
+    for value in instances:
+        # Chỉ dừng nhóm tiến trình (đã rảnh); kết nối SQLite không đóng ở đây vì phiên khác có thể vẫn
+        # đang giữ đối tượng trong lượt chạy hiện tại, kết nối tự đóng khi không còn ai tham chiếu
+        shutdown = getattr(value, 'shutdown', None)
+        if callable(shutdown):
+            try:
+                shutdown()
+            except Exception as e:
+                print(f"Lỗi khi giải phóng tài nguyên {name}: {e}")
+
+
+def clear_resource(name):
+    """Xóa một tài nguyên (và các tài nguyên phụ thuộc) để khởi tạo lại ở lần dùng tiếp theo
+
+    Từ chối (trả về danh sách tài nguyên đang bận) nếu còn công việc nền đang chạy, để một người
+    bấm xóa không làm hỏng công việc của người khác; trả về [] khi đã xóa.
+    """
+    busy = _busy(name)
+    if not busy:
+        _drop(name)
+    return busy
+
+
+def clear_all_resources():
+    """Xóa toàn bộ tài nguyên dùng chung (bỏ qua tài nguyên đang bận), trả về danh sách tài nguyên đang bận"""
+    busy = []
+    for name in _REGISTRY:
+        busy.extend(clear_resource(name))
+    return sorted(set(busy))
+
+
+def get_resource_stats():
+    """Thống kê sử dụng tài nguyên dùng chung"""
+    with _STATS_LOCK:
+        return {name: dict(stats) for name, stats in _STATS.items()}
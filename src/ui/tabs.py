@@ -1,9 +1,40 @@
 import streamlit as st
 from src.ui.components import *
-from src.logic.document_parser import DocumentParser
-from src.logic.financial_calculator import FinancialCalculator
-from src.export.excel_exporter import ExcelExporter
-from src.export.report_exporter import ReportExporter
+from src.ui.resources import (
+    get_document_parser, get_financial_calculator, get_excel_exporter,
+    get_report_exporter, get_chart_renderer, get_export_queue, get_artifact_cache, get_arrow_exporter, get_portfolio_exporter, get_case_store, get_applicant_index, get_prescreen_engine,
+    get_gemini_model, use_fake_backend, get_response_cache, get_gemini_transport, get_semantic_cache, get_batch_queue, get_resource_stats, clear_resource, clear_all_resources
+)
+from src.ai.chat_session import ChatSession
+from src.ai.prompt_builder import compact_data, serialize
+from src.export.artifact_cache import ExportArtifactCache, content_hash
+from src.export.export_queue import DEFAULT_EXPORT_DIR, REPORT_FORMATS
+from src.export.paths import safe_file_stem, safe_subdir
+from src.logic.document_index import DocumentIndex
+from src.logic.prescreen import VERDICT_LABELS, format_findings
+from datetime import datetime
+import json
+import os
+import uuid
+
+# Dataset Parquet chỉ được xuất/nhập trong thư mục này (người dùng nhập đường dẫn tương đối)
+WAREHOUSE_DIR = os.path.join(os.environ.get('CADAP_DATA_DIR', 'data'), 'warehouse')
+
+# Số tin nhắn tối đa giữ lại để hiển thị trong chatbox
+MAX_CHAT_HISTORY = 50
+
+# Các widget hiển thị dữ liệu có thể chỉnh sửa, cần xóa trạng thái sau khi hoàn tác/làm lại
+EDITABLE_WIDGET_KEYS = [
+    'customer_name', 'customer_id', 'customer_address', 'customer_phone',
+    'loan_purpose', 'total_capital_needed', 'owner_capital', 'loan_amount',
+    'owner_capital_ratio', 'interest_rate', 'loan_term',
+    'asset_type', 'market_value', 'asset_address', 'ltv_ratio', 'legal_docs'
+]
+
+def reset_editable_widgets():
+    """Xóa giá trị widget để các tab hiển thị lại dữ liệu từ DataManager"""
+    for key in EDITABLE_WIDGET_KEYS:
+        st.session_state.pop(key, None)
 
 def create_sidebar():
     """Tạo sidebar cho API key và upload file"""
@@ -15,10 +46,23 @@ def create_sidebar():
             type="password",
             help="Nhập API key từ Google AI Studio để sử dụng Gemini AI"
         )
+        if use_fake_backend():
+            st.info("🧪 Đang dùng backend Gemini giả (CADAP_GEMINI_BACKEND=fake)")
+            api_key = api_key or 'local'
         
         if api_key:
-            st.session_state.gemini_client.set_api_key(api_key)
-            st.success("✅ API key đã được thiết lập")
+            # Model đã cấu hình được dùng chung giữa các phiên, chỉ thiết lập lại khi đổi key
+            gemini_client = st.session_state.gemini_client
+            gemini_client.response_cache = get_response_cache()
+            gemini_client.transport = get_gemini_transport()
+            gemini_client.semantic_cache = get_semantic_cache()
+            if gemini_client.api_key != api_key or not gemini_client.is_configured():
+                try:
+                    gemini_client.set_api_key(api_key, get_gemini_model(api_key))
+                except Exception as e:
+                    st.error(f"❌ Lỗi khi thiết lập Gemini: {str(e)}")
+            if gemini_client.is_configured():
+                st.success("✅ API key đã được thiết lập")
         
         st.markdown("---")
         st.header("📤 Upload File")
@@ -31,13 +75,34 @@ def create_sidebar():
         
         if uploaded_file is not None:
             try:
-                parser = DocumentParser()
-                extracted_data = parser.parse_document(uploaded_file)
+                # Chỉ phân tích lại khi có file mới, tránh tăng phiên bản dữ liệu ở mỗi lần rerun
+                file_key = getattr(uploaded_file, 'file_id', None) or (uploaded_file.name, uploaded_file.size)
+                if st.session_state.get('uploaded_file_key') != file_key:
+                    parser = get_document_parser()
+                    st.session_state.extracted_data = parser.parse_document(uploaded_file)
+                    if st.session_state.extracted_data:
+                        st.session_state.data_manager.update_from_document(st.session_state.extracted_data)
+                        st.session_state.case_id = uuid.uuid4().hex[:12]
+                        st.session_state.duplicate_findings = get_applicant_index().find_duplicates(
+                            st.session_state.extracted_data, exclude_case_id=st.session_state.case_id
+                        )
+                    # Chỉ mục tra cứu nội dung file cho chatbox
+                    st.session_state.document_index = DocumentIndex(parser.extract_chunks(uploaded_file))
+                    st.session_state.uploaded_file_key = file_key
+                extracted_data = st.session_state.extracted_data
                 
                 if extracted_data:
-                    st.session_state.data_manager.update_from_document(extracted_data)
                     st.success("✅ File đã được xử lý thành công!")
                     
+                    findings = st.session_state.get('duplicate_findings', [])
+                    if findings:
+                        st.warning(f"⚠️ Phát hiện {len(findings)} thông tin trùng với hồ sơ khác")
+                        for finding in findings:
+                            st.caption(
+                                f"{finding['loai']}: {finding['gia_tri']} "
+                                f"(hồ sơ {finding['case_id']}, {finding['do_tuong_dong']:.0%})"
+                            )
+                    
                     # Hiển thị thông tin cơ bản từ file
                     with st.expander("📋 Xem thông tin trích xuất từ file"):
                         if 'khach_hang' in extracted_data:
@@ -48,6 +113,12 @@ def create_sidebar():
             except Exception as e:
                 st.error(f"❌ Lỗi khi xử lý file: {str(e)}")
         
+        st.markdown("---")
+        create_case_panel()
+        
+        st.markdown("---")
+        create_edit_history_panel()
+        
         st.markdown("---")
         st.header("💡 Hướng dẫn")
         st.info("""
@@ -56,6 +127,129 @@ def create_sidebar():
         3. Kiểm tra và chỉnh sửa dữ liệu ở các tab
         4. Phân tích với AI và xuất báo cáo
         """)
+        
+        st.markdown("---")
+        create_resource_stats_panel()
+
+def create_resource_stats_panel():
+    """Thống kê và xóa tài nguyên dùng chung của máy chủ"""
+    import pandas as pd
+    
+    with st.expander("⚙️ Tài nguyên máy chủ"):
+        stats = get_resource_stats()
+        rows = [
+            {
+                'Tài nguyên': item['mo_ta'],
+                'Lượt dùng': item['goi'],
+                'Lần khởi tạo': item['khoi_tao'],
+                'Tỷ lệ dùng lại': f"{1 - item['khoi_tao'] / item['goi']:.0%}" if item['goi'] else "-",
+                'Thời gian khởi tạo (ms)': round(item['thoi_gian_khoi_tao'] * 1000, 1)
+            }
+            for item in stats.values()
+        ]
+        st.dataframe(pd.DataFrame(rows), use_container_width=True, hide_index=True)
+        
+        name = st.selectbox("Tài nguyên", list(stats), format_func=lambda key: stats[key]['mo_ta'], key="resource_to_clear")
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.button("🧹 Xóa", key="clear_resource"):
+                busy = clear_resource(name)
+                if not busy:
+                    st.rerun()
+                st.warning(f"Chưa thể xóa: đang có công việc chạy nền ({', '.join(stats[key]['mo_ta'] for key in busy)})")
+        with col2:
+            if st.button("🧹 Xóa tất cả", key="clear_all_resources"):
+                busy = clear_all_resources()
+                if not busy:
+                    st.rerun()
+                st.warning(f"Đã xóa các tài nguyên khác; giữ lại tài nguyên đang bận: {', '.join(stats[key]['mo_ta'] for key in busy)}")
+
+def create_case_panel():
+    """Lưu hồ sơ và tra cứu người vay trên các hồ sơ đã lưu"""
+    st.header("🗂️ Hồ sơ")
+    
+    store = get_case_store()
+    index = get_applicant_index()
+    data_manager = st.session_state.data_manager
+    
+    chi_nhanh = st.text_input("Chi nhánh", key="case_branch")
+    if st.button("💾 Lưu hồ sơ", key="save_case"):
+        if 'case_id' not in st.session_state:
+            st.session_state.case_id = uuid.uuid4().hex[:12]
+        sections = data_manager.export_sections()
+        store.save_case(st.session_state.case_id, sections, chi_nhanh)
+        index.add_case(st.session_state.case_id, sections)
+        st.success(f"✅ Đã lưu hồ sơ {st.session_state.case_id}")
+    
+    query = st.text_input("🔎 Tra cứu (CCCD, SĐT hoặc họ tên)", key="case_search")
+    if not query:
+        return
+    
+    digits = ''.join(ch for ch in query if ch.isdigit())
+    if digits and len(digits) >= 9:
+        case_ids = index.lookup_cccd(query) | index.lookup_phone(query)
+        matches = [{'case_id': case_id, 'do_tuong_dong': 1.0} for case_id in case_ids]
+    else:
+        matches = index.search_name(query)
+    
+    if not matches:
+        st.caption("Không tìm thấy hồ sơ phù hợp")
+        return
+    
+    for match in matches:
+        case = store.get_case(match['case_id'])
+        if not case:
+            continue
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            st.caption(
+                f"**{case['customer'].get('ho_ten', '')}** – {case['case_id']} "
+                f"({case['chi_nhanh'] or 'chưa rõ chi nhánh'}, {match['do_tuong_dong']:.0%})"
+            )
+        with col2:
+            if st.button("Mở", key=f"open_case_{case['case_id']}"):
+                data_manager.load_sections(case)
+                st.session_state.case_id = case['case_id']
+                # Hồ sơ mở từ kho không có file gốc để tra cứu
+                st.session_state.document_index = None
+                reset_editable_widgets()
+                st.rerun()
+
+def create_edit_history_panel():
+    """Hoàn tác/làm lại và xem lịch sử chỉnh sửa"""
+    st.header("🕘 Lịch sử chỉnh sửa")
+    
+    data_manager = st.session_state.data_manager
+    
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        if st.button("↩️ Hoàn tác", disabled=not data_manager.can_undo(), key="undo_edit"):
+            data_manager.undo()
+            reset_editable_widgets()
+            st.rerun()
+    
+    with col2:
+        if st.button("↪️ Làm lại", disabled=not data_manager.can_redo(), key="redo_edit"):
+            data_manager.redo()
+            reset_editable_widgets()
+            st.rerun()
+    
+    history = data_manager.get_edit_history()
+    if not history:
+        return
+    
+    labels = {'edit': 'Chỉnh sửa', 'undo': 'Hoàn tác', 'redo': 'Làm lại'}
+    with st.expander(f"📜 Nhật ký ({len(history)} lần thay đổi)"):
+        for item in reversed(history):
+            thoi_gian = datetime.fromtimestamp(item['thoi_gian']).strftime('%H:%M:%S')
+            st.markdown(f"**#{item['seq']} · {labels.get(item['thao_tac'], item['thao_tac'])}** – {thoi_gian}")
+            for section, field, old, new in item['thay_doi']:
+                st.caption(f"{section}.{field}: {old} → {new}")
+        
+        seq = st.slider("Xem dữ liệu tại bước", 0, history[-1]['seq'], history[-1]['seq'], key="history_seq")
+        state = data_manager.get_state_at(seq=seq)
+        st.json({section: state[section].to_dict() for section in ('customer', 'financial', 'collateral')})
 
 def create_tabs():
     """Tạo các tab chính của ứng dụng"""
@@ -203,7 +397,7 @@ def create_financial_info_tab():
             'tong_nhu_cau_von': tong_nhu_cau_von,
             'von_doi_ung': von_doi_ung,
             'so_tien_vay': so_tien_vay,
-            'ty_le_von_doi_ung': ty_le_von_ung,
+            'ty_le_von_doi_ung': ty_le_von_doi_ung,
             'lai_suat': lai_suat,
             'thoi_gian_vay': thoi_gian_vay
         }
@@ -272,14 +466,15 @@ def create_financial_calculation_tab():
     data_manager = st.session_state.data_manager
     financial_data = data_manager.get_financial_data()
     customer_data = data_manager.get_customer_data()
+    collateral_data = data_manager.get_collateral_data()
     
     if not financial_data.get('so_tien_vay') or not financial_data.get('lai_suat'):
         st.warning("Vui lòng nhập đầy đủ thông tin tài chính ở tab trước")
         return
     
     # Tính toán các chỉ số
-    calculator = FinancialCalculator()
-    metrics = calculator.calculate_financial_metrics(financial_data, customer_data)
+    calculator = get_financial_calculator()
+    metrics = calculator.calculate_financial_metrics(financial_data, customer_data, collateral_data)
     payment_schedule = calculator.calculate_payment_schedule(financial_data)
     
     # Hiển thị các chỉ số
@@ -288,9 +483,8 @@ def create_financial_calculation_tab():
     st.subheader("📋 Kế hoạch trả nợ")
     
     if payment_schedule:
-        # Hiển thị bảng kế hoạch trả nợ
-        df = pd.DataFrame(payment_schedule)
-        st.dataframe(df, use_container_width=True)
+        # Hiển thị bảng kế hoạch trả nợ (phân trang, chỉ gửi trang đang xem)
+        create_schedule_viewer(payment_schedule, calculator, key="schedule_viewer")
         
         # Lưu vào session state để sử dụng ở tab export
         st.session_state.payment_schedule = payment_schedule
@@ -311,12 +505,12 @@ def create_charts_tab():
     
     with col1:
         st.subheader("Phân bổ nguồn vốn")
-        create_financial_pie_chart(financial_data)
+        create_financial_pie_chart(financial_data, get_chart_renderer())
     
     with col2:
         st.subheader("Lịch trả nợ")
         payment_schedule = getattr(st.session_state, 'payment_schedule', [])
-        create_payment_schedule_chart(payment_schedule)
+        create_payment_schedule_chart(payment_schedule, get_chart_renderer())
 
 def create_ai_analysis_tab():
     """Tab phân tích AI"""
@@ -327,33 +521,283 @@ def create_ai_analysis_tab():
         return
     
     data_manager = st.session_state.data_manager
+    gemini_client = st.session_state.gemini_client
+    
+    use_cache = not st.checkbox(
+        "Bỏ qua bộ nhớ đệm (luôn gọi lại Gemini)", value=False, key="bypass_ai_cache"
+    )
+    force_ai = st.checkbox(
+        "Luôn gửi Gemini kể cả khi quy tắc sàng lọc đã có kết luận", value=False, key="force_ai_analysis"
+    )
+    if gemini_client.response_cache is not None:
+        cache_stats = gemini_client.response_cache.stats()
+        st.caption(
+            f"Bộ nhớ đệm: {cache_stats['memory_hits'] + cache_stats['disk_hits']} lần dùng lại, "
+            f"{cache_stats['misses']} lần gọi mới (tỷ lệ {cache_stats['hit_rate']:.0%})"
+        )
+    token_stats = gemini_client.get_token_stats().get('phan_tich')
+    if token_stats:
+        st.caption(
+            f"Token phân tích: trung bình {token_stats['prompt_tokens'] // token_stats['so_lan']} prompt / "
+            f"{token_stats['response_tokens'] // token_stats['so_lan']} phản hồi ({token_stats['so_lan']} lần gọi)"
+        )
+    
+    if gemini_client.transport is not None:
+        create_transport_status(gemini_client.transport)
     
     col1, col2 = st.columns(2)
     
     with col1:
         st.subheader("📄 Phân tích từ File Upload")
         if st.button("🔍 Phân tích dữ liệu gốc", key="analyze_original"):
-            with st.spinner("AI đang phân tích dữ liệu từ file..."):
-                original_data = data_manager.get_original_data()
-                analysis = st.session_state.gemini_client.analyze_financial_data(
-                    original_data, "dữ liệu gốc từ file upload"
-                )
-                st.text_area("Kết quả phân tích", analysis, height=300)
+            original_data = data_manager.get_original_data()
+            run_screened_analysis(
+                gemini_client, original_data, (original_data,), "dữ liệu gốc từ file upload",
+                use_cache, force_ai, "analysis_original_result"
+            )
     
     with col2:
         st.subheader("✏️ Phân tích dữ liệu đã chỉnh sửa")
         if st.button("🔍 Phân tích dữ liệu hiện tại", key="analyze_current"):
-            with st.spinner("AI đang phân tích dữ liệu hiện tại..."):
-                current_data = {
-                    'customer': data_manager.get_customer_data(),
-                    'financial': data_manager.get_financial_data(),
-                    'collateral': data_manager.get_collateral_data(),
-                    'metrics': getattr(st.session_state, 'financial_metrics', {})
-                }
-                analysis = st.session_state.gemini_client.analyze_financial_data(
-                    current_data, "dữ liệu sau khi hiệu chỉnh tại giao diện"
-                )
-                st.text_area("Kết quả phân tích", analysis, height=300)
+            current_data = get_current_analysis_data(data_manager)
+            run_screened_analysis(
+                gemini_client, current_data,
+                (current_data['metrics'], current_data['financial'], current_data['collateral'], current_data['customer']),
+                "dữ liệu sau khi hiệu chỉnh tại giao diện", use_cache, force_ai, "analysis_current_result"
+            )
+    
+    create_parallel_analysis_section(data_manager, gemini_client, use_cache)
+    create_batch_analysis_section(gemini_client, use_cache)
+
+def run_screened_analysis(gemini_client, data, sections, data_source, use_cache, force_ai, result_key):
+    """Sàng lọc theo quy tắc; chỉ gọi Gemini cho hồ sơ vùng biên (hoặc khi người dùng yêu cầu)"""
+    engine = get_prescreen_engine()
+    screening = engine.evaluate(*sections)
+    findings = format_findings(screening)
+    show_prescreen_result(screening)
+    
+    placeholder = st.empty()
+    if not engine.needs_ai(screening) and not force_ai:
+        placeholder.text_area("Kết quả phân tích", findings, height=300, key=result_key)
+        return
+    analysis = render_stream(
+        gemini_client.analyze_financial_data_stream(data, data_source, use_cache=use_cache, extra=findings),
+        placeholder
+    )
+    placeholder.text_area("Kết quả phân tích", analysis, height=300, key=result_key)
+    show_stream_info(gemini_client)
+
+def show_prescreen_result(screening):
+    """Kết luận sàng lọc theo quy tắc"""
+    message = (
+        f"Sàng lọc theo quy tắc: **{VERDICT_LABELS[screening['ket_luan']]}** "
+        f"({len(screening['phat_hien'])} phát hiện, {screening['thoi_gian_us']:.0f} µs)"
+    )
+    if screening['ket_luan'] == 'tu_choi':
+        st.error(f"⛔ {message}")
+    elif screening['ket_luan'] == 'dat':
+        st.success(f"✅ {message}")
+    else:
+        st.warning(f"🔎 {message} – chuyển Gemini phân tích")
+
+def create_transport_status(transport):
+    """Trạng thái kết nối Gemini dùng chung: ngắt mạch, độ trễ, thử lại, lỗi"""
+    stats = transport.get_stats()
+    states = {'dong': "🟢 Bình thường", 'nua_mo': "🟡 Đang thử lại", 'mo': "🔴 Tạm ngắt"}
+    with st.expander(f"📡 Kết nối Gemini: {states.get(stats['circuit_state'], stats['circuit_state'])}"):
+        cols = st.columns(4)
+        cols[0].metric("Lượt gọi", stats['calls'])
+        cols[1].metric("Thử lại", stats['retries'])
+        cols[2].metric("Lỗi", stats['errors'])
+        cols[3].metric("Bị từ chối (ngắt mạch)", stats['circuit_rejections'])
+        st.caption(
+            f"Độ trễ p50 {stats['latency_p50']:.2f}s · p95 {stats['latency_p95']:.2f}s · "
+            f"tổng thời gian chờ giới hạn tốc độ {stats['rate_limit_wait']:.1f}s"
+        )
+
+def get_current_analysis_data(data_manager):
+    """Dữ liệu hiện tại (sau hiệu chỉnh) dùng cho phân tích AI"""
+    return {
+        'customer': data_manager.get_customer_data(),
+        'financial': data_manager.get_financial_data(),
+        'collateral': data_manager.get_collateral_data(),
+        'metrics': getattr(st.session_state, 'financial_metrics', {})
+    }
+
+def create_parallel_analysis_section(data_manager, gemini_client, use_cache):
+    """Chạy đồng thời phân tích dữ liệu gốc, dữ liệu hiện tại và các phân tích chuyên đề"""
+    st.markdown("---")
+    st.subheader("⚡ Phân tích song song & so sánh")
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        include_collateral = st.checkbox("Chuyên đề tài sản bảo đảm", value=False, key="parallel_collateral")
+    with col2:
+        include_repayment = st.checkbox("Chuyên đề khả năng trả nợ", value=False, key="parallel_repayment")
+    with col3:
+        max_concurrency = st.number_input("Số yêu cầu đồng thời", min_value=1, max_value=8, value=4, key="parallel_limit")
+    
+    if st.button("⚡ Phân tích đồng thời", key="analyze_parallel"):
+        current_data = get_current_analysis_data(data_manager)
+        jobs = {
+            'goc': (data_manager.get_original_data(), "dữ liệu gốc từ file upload"),
+            'hien_tai': (current_data, "dữ liệu sau khi hiệu chỉnh tại giao diện")
+        }
+        if include_collateral:
+            jobs['tai_san'] = (
+                {
+                    'collateral': current_data['collateral'],
+                    'so_tien_vay': current_data['financial'].get('so_tien_vay', 0),
+                    'ltv': current_data['metrics'].get('ltv', current_data['collateral'].get('ltv', 0))
+                },
+                "chuyên đề tài sản bảo đảm: tính pháp lý, giá trị, LTV"
+            )
+        if include_repayment:
+            jobs['tra_no'] = (
+                {'financial': current_data['financial'], 'metrics': current_data['metrics']},
+                "chuyên đề khả năng trả nợ: DSR, biên an toàn, dòng tiền"
+            )
+        
+        with st.spinner(f"AI đang chạy {len(jobs)} phân tích đồng thời..."):
+            st.session_state.parallel_analysis = gemini_client.analyze_many(
+                jobs, max_concurrency=int(max_concurrency), use_cache=use_cache
+            )
+    
+    comparison = st.session_state.get('parallel_analysis')
+    if not comparison:
+        return
+    
+    results = comparison['ket_qua']
+    slowest = max(item['thoi_gian'] for item in results.values())
+    st.caption(
+        f"Tổng thời gian {comparison['tong_thoi_gian']:.1f}s – "
+        f"yêu cầu chậm nhất {slowest:.1f}s ({len(results)} phân tích)"
+    )
+    
+    titles = {
+        'goc': "📄 Dữ liệu gốc",
+        'hien_tai': "✏️ Dữ liệu hiện tại",
+        'tai_san': "🏠 Tài sản bảo đảm",
+        'tra_no': "💵 Khả năng trả nợ"
+    }
+    
+    def caption(item):
+        return "⚡ bộ nhớ đệm" if item['tu_cache'] else f"⏱️ {item['thoi_gian']:.1f}s"
+    
+    col1, col2 = st.columns(2)
+    for column, name in ((col1, 'goc'), (col2, 'hien_tai')):
+        with column:
+            st.markdown(f"**{titles[name]}** · {caption(results[name])}")
+            st.text_area(titles[name], results[name]['ket_qua'], height=300,
+                         key=f"parallel_result_{name}", label_visibility="collapsed")
+    
+    for name in ('tai_san', 'tra_no'):
+        if name in results:
+            with st.expander(f"{titles[name]} · {caption(results[name])}", expanded=True):
+                st.write(results[name]['ket_qua'])
+
+def create_batch_analysis_section(gemini_client, use_cache, page_size=20):
+    """Thẩm định AI hàng loạt các hồ sơ đã lưu (chạy nền, xem kết quả theo trang)"""
+    import pandas as pd
+    
+    st.markdown("---")
+    st.subheader("📦 Thẩm định hàng loạt")
+    
+    store = get_case_store()
+    queue = get_batch_queue()
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        branches = ["Tất cả"] + [branch for branch in store.list_branches() if branch]
+        chi_nhanh = st.selectbox("Chi nhánh", branches, key="batch_branch")
+        chi_nhanh = None if chi_nhanh == "Tất cả" else chi_nhanh
+    with col2:
+        ten = st.text_input("Tên đợt", value=f"Rà soát {datetime.now():%m/%Y}", key="batch_name")
+    
+    so_ho_so = store.count_cases(chi_nhanh)
+    if st.button(f"▶️ Tạo đợt và chạy ({so_ho_so} hồ sơ)", disabled=so_ho_so == 0, key="batch_submit"):
+        job_id = queue.submit(chi_nhanh=chi_nhanh, ten=ten)
+        queue.start(job_id, gemini_client.model, use_cache)
+        st.session_state.batch_job_id = job_id
+    
+    jobs = queue.list_jobs()
+    if not jobs:
+        st.caption("Chưa có đợt thẩm định nào")
+        return
+    
+    if st.button("🔄 Làm mới tiến độ", key="batch_refresh"):
+        st.rerun()
+    
+    labels = {'cho': 'Chờ', 'dang_chay': 'Đang chạy', 'tam_dung': 'Tạm dừng', 'hoan_thanh': 'Hoàn thành'}
+    for job in jobs:
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            st.progress(
+                job['tien_do'],
+                text=f"{job['ten'] or job['job_id']} – {labels.get(job['trang_thai'], job['trang_thai'])}: "
+                     f"{job['xong']}/{job['tong']} xong, {job['loi']} lỗi"
+            )
+        with col2:
+            if job['dang_chay']:
+                if st.button("⏸️ Tạm dừng", key=f"batch_pause_{job['job_id']}"):
+                    queue.pause(job['job_id'])
+            elif job['trang_thai'] != 'hoan_thanh':
+                if st.button("▶️ Chạy tiếp", key=f"batch_resume_{job['job_id']}"):
+                    queue.start(job['job_id'], gemini_client.model, use_cache)
+                    st.rerun()
+            elif job['loi']:
+                if st.button("🔁 Chạy lại lỗi", key=f"batch_retry_{job['job_id']}"):
+                    queue.retry_failed(job['job_id'])
+                    queue.start(job['job_id'], gemini_client.model, use_cache)
+                    st.rerun()
+    
+    job_ids = [job['job_id'] for job in jobs]
+    default = job_ids.index(st.session_state.get('batch_job_id')) if st.session_state.get('batch_job_id') in job_ids else 0
+    job_id = st.selectbox(
+        "Xem kết quả đợt", job_ids, index=default, key="batch_view",
+        format_func=lambda value: next(job['ten'] or value for job in jobs if job['job_id'] == value)
+    )
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        filters = {"Tất cả": None, "Đã xong": 'xong', "Lỗi": 'loi', "Chờ": 'cho'}
+        trang_thai = filters[st.selectbox("Trạng thái", list(filters), key="batch_filter")]
+    total = queue.count_results(job_id, trang_thai)
+    with col2:
+        pages = max(1, (total + page_size - 1) // page_size)
+        page = st.number_input(f"Trang (/{pages})", min_value=1, max_value=pages, value=1, key="batch_page")
+    
+    results = queue.get_results(job_id, offset=(page - 1) * page_size, limit=page_size, trang_thai=trang_thai)
+    if not results:
+        st.caption("Không có kết quả")
+        return
+    st.dataframe(pd.DataFrame([
+        {
+            'Mã hồ sơ': item['case_id'],
+            'Khách hàng': item['ho_ten'],
+            'Trạng thái': item['trang_thai'],
+            'Sàng lọc': VERDICT_LABELS.get(item['ket_luan'], ''),
+            'Thời gian (s)': round(item['thoi_gian'], 2) if item['thoi_gian'] is not None else None,
+            'Tóm tắt': (item['ket_qua'] or item['loi'] or '')[:200]
+        }
+        for item in results
+    ]), use_container_width=True, hide_index=True)
+    
+    chosen = st.selectbox("Chi tiết hồ sơ", [item['case_id'] for item in results], key="batch_detail")
+    detail = next(item for item in results if item['case_id'] == chosen)
+    st.text_area("Kết quả thẩm định", detail['ket_qua'] or detail['loi'] or '', height=250, key="batch_detail_text")
+
+def show_stream_info(gemini_client):
+    """Hiển thị nguồn kết quả và thời gian tới token đầu tiên"""
+    if gemini_client.last_from_cache:
+        st.caption("⚡ Kết quả lấy từ bộ nhớ đệm")
+        return
+    stats = gemini_client.get_latency_stats()
+    if stats['ttft']['so_lan']:
+        st.caption(
+            f"⏱️ Token đầu tiên sau {gemini_client.ttft_samples[-1]:.2f}s "
+            f"(trung vị {stats['ttft']['p50']:.2f}s, p95 {stats['ttft']['p95']:.2f}s)"
+        )
 
 def create_chatbox_tab():
     """Tab chatbox với Gemini"""
@@ -363,10 +807,30 @@ def create_chatbox_tab():
         st.warning("Vui lòng nhập API key ở sidebar để sử dụng chatbox")
         return
     
-    # Hiển thị lịch sử chat
+    data_manager = st.session_state.data_manager
+    if 'chat_session' not in st.session_state:
+        st.session_state.chat_session = ChatSession()
+    chat_session = st.session_state.chat_session
+    
+    # Ngữ cảnh hồ sơ chỉ dựng lại khi phiên bản dữ liệu thay đổi
+    current_data = get_current_analysis_data(data_manager)
+    chat_session.set_case_context(
+        serialize(compact_data(current_data)),
+        key=(data_manager.get_versions(), json.dumps(current_data['metrics'], default=dict, sort_keys=True))
+    )
+    document_index = st.session_state.get('document_index')
+    chat_session.set_document_index(document_index, key=id(document_index))
+    
+    # Hiển thị lịch sử chat (giới hạn số tin nhắn giữ trong phiên)
+    use_answer_cache = not st.checkbox(
+        "Luôn hỏi lại Gemini (bỏ qua câu trả lời đã lưu)", value=False, key="bypass_chat_cache"
+    )
+    
     for message in st.session_state.chat_history:
         with st.chat_message(message["role"]):
             st.write(message["content"])
+            show_cache_hit(message.get("cache_hit"))
+            show_chat_sources(message.get("sources"))
     
     # Input chat
     prompt = st.chat_input("Nhập câu hỏi của bạn...")
@@ -378,18 +842,93 @@ def create_chatbox_tab():
         with st.chat_message("user"):
             st.write(prompt)
         
-        # Nhận phản hồi từ AI
-        with st.spinner("AI đang suy nghĩ..."):
-            response = st.session_state.gemini_client.chat(prompt)
-            st.session_state.chat_history.append({"role": "assistant", "content": response})
-        
+        # Nhận phản hồi từ AI, hiển thị dần khi token về
         with st.chat_message("assistant"):
-            st.write(response)
+            gemini_client = st.session_state.gemini_client
+            response = render_stream(
+                gemini_client.chat_stream(prompt, session=chat_session, use_cache=use_answer_cache), st.empty()
+            )
+            show_cache_hit(gemini_client.last_chat_cache_hit)
+            show_chat_sources(chat_session.last_sources)
+        st.session_state.chat_history.append({
+            "role": "assistant", "content": response, "sources": chat_session.last_sources,
+            "cache_hit": gemini_client.last_chat_cache_hit
+        })
+        st.session_state.chat_history = st.session_state.chat_history[-MAX_CHAT_HISTORY:]
+    
+    st.caption(
+        f"Ngữ cảnh gửi kèm: ~{chat_session.token_count()}/{chat_session.token_budget} token, "
+        f"{len(chat_session.turns) // 2} lượt gần nhất"
+        + (" + tóm tắt hội thoại trước" if chat_session.summary else "")
+        + (f" + tối đa {chat_session.retrieval_k} đoạn trích từ file ({len(document_index)} đoạn)"
+           if document_index else "")
+    )
     
     # Nút xóa hội thoại
     if st.button("🗑️ Xóa hội thoại"):
         st.session_state.chat_history = []
+        chat_session.clear()
         st.rerun()
+    
+    create_answer_cache_admin()
+
+def show_cache_hit(hit):
+    """Đánh dấu câu trả lời lấy từ bộ nhớ đệm"""
+    if hit:
+        st.caption(
+            f"⚡ Trả lời từ bộ nhớ đệm (tương đồng {hit['do_tuong_dong']:.0%} với câu hỏi: "
+            f"“{hit['question']}”, đã dùng lại {hit['hits']} lần)"
+        )
+
+def create_answer_cache_admin():
+    """Quản lý bộ nhớ đệm câu trả lời: xem, xóa mục cũ hoặc sai"""
+    import pandas as pd
+    
+    cache = get_semantic_cache()
+    stats = cache.stats()
+    with st.expander(
+        f"🧹 Bộ nhớ đệm câu trả lời ({stats['entries']} mục, tỷ lệ dùng lại {stats['hit_rate']:.0%})"
+    ):
+        entries = cache.list_entries()
+        if not entries:
+            st.caption("Chưa có câu trả lời nào được lưu")
+            return
+        st.dataframe(pd.DataFrame([
+            {
+                'Mã': entry['id'],
+                'Câu hỏi': entry['question'],
+                'Phạm vi': 'Theo hồ sơ' if entry['theo_ho_so'] else 'Chung',
+                'Số lần dùng lại': entry['hits'],
+                'Tạo lúc': datetime.fromtimestamp(entry['created_at']).strftime('%d/%m %H:%M')
+            }
+            for entry in entries
+        ]), use_container_width=True, hide_index=True)
+        
+        selected = st.multiselect(
+            "Chọn câu trả lời cần xóa", [entry['id'] for entry in entries], key="answer_cache_selected",
+            format_func=lambda entry_id: next(entry['question'] for entry in entries if entry['id'] == entry_id)
+        )
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            if st.button("Xóa mục đã chọn", disabled=not selected, key="answer_cache_purge"):
+                st.success(f"Đã xóa {cache.purge(selected)} mục")
+        with col2:
+            days = st.number_input("Cũ hơn (ngày)", min_value=0, value=1, key="answer_cache_days")
+            if st.button("Xóa mục cũ", key="answer_cache_purge_old"):
+                st.success(f"Đã xóa {cache.purge_older_than(days * 86400)} mục")
+        with col3:
+            if st.button("Xóa toàn bộ", key="answer_cache_clear"):
+                cache.clear()
+                st.success("Đã xóa toàn bộ bộ nhớ đệm câu trả lời")
+
+def show_chat_sources(sources):
+    """Các đoạn trích tài liệu đã gửi kèm câu hỏi"""
+    if not sources:
+        return
+    with st.expander(f"📎 Nguồn trích dẫn ({len(sources)})"):
+        for source in sources:
+            st.markdown(f"**[Nguồn {source['id']}] {source['vi_tri']}**")
+            st.caption(source['noi_dung'])
 
 def create_export_tab():
     """Tab xuất file"""
@@ -401,7 +940,10 @@ def create_export_tab():
         "Chọn loại file xuất",
         [
             "Xuất bảng kê kế hoạch trả nợ (Excel)",
-            "Xuất báo cáo thẩm định (Word/PDF)"
+            "Xuất báo cáo thẩm định (Word/PDF)",
+            "Xuất báo cáo hàng loạt cho hội đồng (ZIP)",
+            "Xuất/nhập dữ liệu hàng loạt (Parquet)",
+            "Xuất danh mục theo chi nhánh (Excel)"
         ]
     )
     
@@ -409,8 +951,14 @@ def create_export_tab():
         if st.button("📊 Xuất file Excel"):
             payment_schedule = getattr(st.session_state, 'payment_schedule', [])
             if payment_schedule:
-                exporter = ExcelExporter()
-                excel_file = exporter.export_payment_schedule(payment_schedule)
+                from src.export.excel_exporter import LAYOUT_VERSION as EXCEL_LAYOUT_VERSION
+                
+                exporter = get_excel_exporter()
+                # Lịch trả nợ không đổi thì dùng lại file đã xuất
+                excel_file = get_artifact_cache().get_or_create(
+                    ExportArtifactCache.make_key('xlsx', content_hash(payment_schedule), EXCEL_LAYOUT_VERSION),
+                    lambda: exporter.export_payment_schedule(payment_schedule)
+                )
                 
                 st.download_button(
                     label="📥 Tải xuống file Excel",
@@ -421,6 +969,15 @@ def create_export_tab():
             else:
                 st.warning("Không có dữ liệu kế hoạch trả nợ để xuất")
     
+    elif export_option == "Xuất/nhập dữ liệu hàng loạt (Parquet)":
+        create_bulk_data_section()
+    
+    elif export_option == "Xuất danh mục theo chi nhánh (Excel)":
+        create_portfolio_export_section()
+    
+    elif export_option == "Xuất báo cáo hàng loạt cho hội đồng (ZIP)":
+        create_bulk_report_section()
+    
     else:  # Xuất báo cáo thẩm định
         col1, col2 = st.columns(2)
         
@@ -433,31 +990,227 @@ def create_export_tab():
         with col2:
             include_charts = st.checkbox("Bao gồm biểu đồ", value=True)
         
-        if st.button("📄 Tạo báo cáo thẩm định"):
-            with st.spinner("Đang tạo báo cáo..."):
-                exporter = ReportExporter()
-                
-                # Thu thập dữ liệu cho báo cáo
-                report_data = {
-                    'customer': data_manager.get_customer_data(),
-                    'financial': data_manager.get_financial_data(),
-                    'collateral': data_manager.get_collateral_data(),
-                    'metrics': getattr(st.session_state, 'financial_metrics', {}),
-                    'payment_schedule': getattr(st.session_state, 'payment_schedule', [])
-                }
-                
-                if report_type == "Word (.docx)":
-                    report_file = exporter.export_word_report(report_data, include_charts)
-                    mime_type = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-                    file_name = "bao_cao_tham_dinh.docx"
-                else:
-                    report_file = exporter.export_pdf_report(report_data, include_charts)
-                    mime_type = "application/pdf"
-                    file_name = "bao_cao_tham_dinh.pdf"
-                
+        fmt = 'docx' if report_type == "Word (.docx)" else 'pdf'
+        metrics = dict(getattr(st.session_state, 'financial_metrics', {}))
+        payment_schedule = list(getattr(st.session_state, 'payment_schedule', []))
+        # Báo cáo ghi ngày lập, nên khóa gồm cả ngày để sang ngày mới không trả lại file cũ
+        cache_key = ExportArtifactCache.make_key(
+            fmt, data_manager.get_fingerprint(), content_hash(metrics), content_hash(payment_schedule),
+            get_report_exporter().layout_version(fmt), include_charts, datetime.now().strftime('%Y%m%d')
+        )
+        cached = get_artifact_cache().get(cache_key)
+        
+        if cached is not None:
+            # Dữ liệu và mẫu không đổi từ lần tạo trước: tải về ngay
+            file_name, mime_type = REPORT_FORMATS[fmt]
+            st.download_button(
+                label=f"📥 Tải xuống {file_name} (dữ liệu không đổi từ lần tạo trước)",
+                data=cached,
+                file_name=file_name,
+                mime=mime_type
+            )
+        elif st.button("📄 Tạo báo cáo thẩm định"):
+            # Dữ liệu gửi sang tiến trình xuất phải là dict/list thông thường (ảnh chụp không pickle được)
+            sections = data_manager.export_sections()
+            report_data = {
+                'customer': sections['customer'],
+                'financial': sections['financial'],
+                'collateral': sections['collateral'],
+                'metrics': metrics,
+                'payment_schedule': payment_schedule
+            }
+            get_export_queue().submit(fmt, report_data, include_charts, owner=get_session_owner(), cache_key=cache_key)
+        
+        create_export_jobs_section()
+
+def get_session_owner():
+    """Mã phiên làm việc, dùng để mỗi cán bộ chỉ thấy công việc xuất của mình"""
+    if 'export_owner' not in st.session_state:
+        st.session_state.export_owner = uuid.uuid4().hex
+    return st.session_state.export_owner
+
+def create_export_jobs_section():
+    """Danh sách báo cáo đang tạo/đã tạo của phiên, tự làm mới khi còn công việc chưa xong"""
+    queue = get_export_queue()
+    owner = get_session_owner()
+    
+    def render_jobs(auto_refresh=False):
+        jobs = queue.list_jobs(owner)
+        if not jobs:
+            return
+        if auto_refresh and not any(job['trang_thai'] in ('cho', 'dang_chay') for job in jobs):
+            # Hết công việc đang chạy: chạy lại cả trang để dừng tự làm mới
+            st.rerun()
+        st.markdown("**Báo cáo của phiên làm việc**")
+        labels = {'cho': 'Đang chờ', 'dang_chay': 'Đang tạo', 'hoan_thanh': 'Hoàn thành', 'loi': 'Lỗi', 'da_huy': 'Đã hủy'}
+        for job in jobs:
+            col1, col2 = st.columns([3, 1])
+            with col1:
+                counts = f" {job['xong']}/{job['tong']} hồ sơ" if job['tong'] is not None else ""
+                st.progress(
+                    job['tien_do'],
+                    text=f"{job['file_name']} ({datetime.fromtimestamp(job['created_at']):%H:%M:%S}) – "
+                         f"{labels.get(job['trang_thai'], job['trang_thai'])}{counts}"
+                )
+                if job['loi']:
+                    st.caption(job['loi'])
+            with col2:
+                if job['trang_thai'] == 'hoan_thanh':
+                    # Chỉ đọc nội dung file của công việc được chọn tải, không nạp bytes mọi công việc mỗi lần làm mới
+                    if st.session_state.get('export_prepared') == job['job_id']:
+                        st.download_button(
+                            label="📥 Tải xuống",
+                            data=queue.get_result(job['job_id']) or b'',
+                            file_name=job['file_name'],
+                            mime=job['mime'],
+                            key=f"export_download_{job['job_id']}"
+                        )
+                    elif st.button("📦 Chuẩn bị tải", key=f"export_prepare_{job['job_id']}"):
+                        st.session_state.export_prepared = job['job_id']
+                        st.rerun()
+                elif job['trang_thai'] in ('cho', 'dang_chay'):
+                    if st.button("✖️ Hủy", key=f"export_cancel_{job['job_id']}"):
+                        queue.cancel(job['job_id'])
+                        st.rerun()
+                elif st.button("🗑️ Xóa", key=f"export_remove_{job['job_id']}"):
+                    queue.remove(job['job_id'])
+                    st.rerun()
+    
+    # Streamlit có fragment (>= 1.37): chỉ phần này tự làm mới mỗi giây khi còn công việc chưa xong;
+    # bản cũ làm mới bằng nút
+    fragment = getattr(st, 'fragment', None)
+    active = any(job['trang_thai'] in ('cho', 'dang_chay') for job in queue.list_jobs(owner))
+    if fragment is not None and active:
+        fragment(run_every=1.0)(render_jobs)(auto_refresh=True)
+    elif fragment is not None:
+        render_jobs()
+    else:
+        render_jobs()
+        if st.button("🔄 Làm mới", key="export_refresh"):
+            st.rerun()
+
+def create_bulk_report_section():
+    """Báo cáo thẩm định cho danh sách hồ sơ (ví dụ chương trình họp hội đồng tín dụng) trong một file ZIP"""
+    store = get_case_store()
+    
+    branches = ["Tất cả"] + [branch for branch in store.list_branches() if branch]
+    chi_nhanh = st.selectbox("Chi nhánh", branches, key="bulk_report_branch")
+    chi_nhanh = None if chi_nhanh == "Tất cả" else chi_nhanh
+    cases = store.list_cases(limit=500, chi_nhanh=chi_nhanh)
+    chosen = st.multiselect(
+        "Chọn hồ sơ", [case['case_id'] for case in cases], key="bulk_report_cases",
+        format_func=lambda case_id: next(
+            f"{case['case_id']} – {case['ho_ten']}" for case in cases if case['case_id'] == case_id
+        )
+    )
+    pasted = st.text_area("Hoặc dán mã hồ sơ (mỗi dòng một mã)", key="bulk_report_ids", height=100)
+    case_ids = list(dict.fromkeys(chosen + [line.strip() for line in pasted.splitlines() if line.strip()]))
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        fmt = st.radio("Định dạng", ["Word (.docx)", "PDF (.pdf)"], key="bulk_report_format", horizontal=True)
+    with col2:
+        include_charts = st.checkbox("Bao gồm biểu đồ", value=True, key="bulk_report_charts")
+    
+    if st.button(f"📦 Tạo {len(case_ids)} báo cáo (ZIP)", disabled=not case_ids, key="bulk_report_submit"):
+        get_export_queue().submit_bulk(
+            store, case_ids, 'docx' if fmt == "Word (.docx)" else 'pdf', include_charts, owner=get_session_owner()
+        )
+    
+    create_export_jobs_section()
+
+def create_portfolio_export_section():
+    """Workbook danh mục: tổng hợp chỉ số + lịch trả nợ của mọi hồ sơ trong chi nhánh"""
+    store = get_case_store()
+    exporter = get_portfolio_exporter()
+    
+    branches = ["Tất cả"] + [branch for branch in store.list_branches() if branch]
+    chi_nhanh = st.selectbox("Chi nhánh", branches, key="portfolio_branch")
+    chi_nhanh = None if chi_nhanh == "Tất cả" else chi_nhanh
+    layouts = {"Một sheet lịch trả nợ chung": 'mot_sheet', "Mỗi khoản vay một sheet": 'moi_khoan_vay'}
+    layout = layouts[st.radio("Bố cục lịch trả nợ", list(layouts), key="portfolio_layout", horizontal=True)]
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button(f"📊 Xuất workbook ({store.count_cases(chi_nhanh)} hồ sơ)", key="portfolio_export"):
+            os.makedirs(DEFAULT_EXPORT_DIR, exist_ok=True)
+            # Tên chi nhánh là dữ liệu người dùng nhập, làm sạch để file luôn nằm trong thư mục xuất
+            path = os.path.join(
+                DEFAULT_EXPORT_DIR,
+                f"danh_muc_{safe_file_stem(chi_nhanh, 'tat_ca')}_{datetime.now():%Y%m%d-%H%M%S}.xlsx"
+            )
+            with st.spinner("Đang xuất danh mục..."):
+                result = exporter.export_portfolio(store, path, chi_nhanh, layout)
+            if layout != result['bo_cuc']:
+                st.info("Danh mục quá lớn để tách mỗi khoản vay một sheet, đã gộp lịch trả nợ vào một sheet")
+            st.success(f"✅ {result['so_ho_so']} hồ sơ, {result['so_dong_lich_tra_no']:,} dòng lịch trả nợ")
+            with open(path, 'rb') as f:
                 st.download_button(
-                    label=f"📥 Tải xuống {file_name}",
-                    data=report_file,
-                    file_name=file_name,
-                    mime=mime_type
-                )
\ No newline at end of file
+                    label="📥 Tải xuống workbook",
+                    data=f,
+                    file_name=os.path.basename(path),
+                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                )
+    with col2:
+        output_dir = st.text_input(
+            f"Thư mục xuất từng chi nhánh (trong {DEFAULT_EXPORT_DIR})",
+            value=datetime.now().strftime("%Y%m%d"),
+            key="portfolio_branches_dir"
+        )
+        if st.button("🗂️ Xuất mỗi chi nhánh một workbook", key="portfolio_export_branches"):
+            try:
+                output_dir = safe_subdir(DEFAULT_EXPORT_DIR, output_dir)
+            except ValueError as e:
+                st.error(f"❌ {str(e)}")
+                return
+            with st.spinner("Đang xuất các chi nhánh..."):
+                results = exporter.export_branches(store, output_dir, layout)
+            st.success(f"✅ Đã xuất {len(results)} workbook vào {output_dir}")
+            st.json({branch: stats for branch, (_, stats) in results.items()})
+
+def create_bulk_data_section():
+    """Xuất/nhập hàng loạt hồ sơ dạng Parquet cho kho dữ liệu rủi ro"""
+    store = get_case_store()
+    exporter = get_arrow_exporter()
+    
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        st.subheader("📦 Xuất dữ liệu")
+        branches = ["Tất cả"] + [branch for branch in store.list_branches() if branch]
+        chi_nhanh = st.selectbox("Chi nhánh", branches, key="bulk_export_branch")
+        output_dir = st.text_input(
+            f"Thư mục xuất (trong {WAREHOUSE_DIR})",
+            value=datetime.now().strftime("%Y%m%d-%H%M%S"),
+            key="bulk_export_dir"
+        )
+        include_schedules = st.checkbox("Bao gồm lịch trả nợ", value=True, key="bulk_export_schedules")
+        
+        if st.button("📤 Xuất Parquet", key="bulk_export"):
+            try:
+                output_dir = safe_subdir(WAREHOUSE_DIR, output_dir)
+            except ValueError as e:
+                st.error(f"❌ {str(e)}")
+                return
+            with st.spinner("Đang xuất dữ liệu..."):
+                counts = exporter.export_cases(
+                    store, output_dir,
+                    chi_nhanh=None if chi_nhanh == "Tất cả" else chi_nhanh,
+                    include_schedules=include_schedules
+                )
+            st.success(f"✅ Đã xuất vào {output_dir}")
+            st.json(counts)
+    
+    with col2:
+        st.subheader("📥 Nhập dữ liệu")
+        input_dir = st.text_input(f"Thư mục dataset (trong {WAREHOUSE_DIR})", key="bulk_import_dir")
+        
+        if st.button("📥 Nhập Parquet", key="bulk_import") and input_dir:
+            with st.spinner("Đang nhập dữ liệu..."):
+                try:
+                    imported = exporter.import_cases(store, safe_subdir(WAREHOUSE_DIR, input_dir))
+                except ValueError as e:
+                    st.error(f"❌ {str(e)}")
+                else:
+                    clear_resource('applicant_index')
+                    st.success(f"✅ Đã nhập {imported} hồ sơ")
@@ -0,0 +1,102 @@
+import json
+
+from src.ai import benchmark
+from src.ai.chat_session import ChatSession
+from src.ai.fake_backend import FakeGeminiBackend
+from src.ai.gemini_client import GeminiClient
+from src.ai.response_cache import ResponseCache
+from src.ai.semantic_cache import SemanticAnswerCache
+from src.ai.transport import GeminiTransport
+
+DATA = {
+    'customer': {'ho_ten': "Nguyễn Văn A"},
+    'financial': {'so_tien_vay': 1_000_000_000, 'lai_suat': 9.0, 'thoi_gian_vay': 120},
+    'collateral': {'gia_tri_thi_truong': 2_000_000_000},
+    'metrics': {'ltv': 50.0}
+}
+
+
+def no_sleep(seconds):
+    pass
+
+
+def make_client(backend, **kwargs):
+    client = GeminiClient(**kwargs)
+    client.set_backend(backend)
+    return client
+
+
+def make_backend(**kwargs):
+    options = dict(latency=0, chunk_delay=0, seed=1, sleep=no_sleep)
+    options.update(kwargs)
+    return FakeGeminiBackend(**options)
+
+
+def test_unconfigured_client_reports_missing_key():
+    assert GeminiClient().analyze_financial_data(DATA, "thử") == "API key chưa được thiết lập"
+
+
+def test_canned_replies_by_keyword_and_rotation():
+    client = make_client(make_backend(responses={'PHÂN TÍCH': "phân tích mẫu", '*': "mặc định"}))
+    assert client.analyze_financial_data(DATA, "thử", use_cache=False) == "phân tích mẫu"
+    assert client.chat("Xin chào") == "mặc định"
+
+    client = make_client(make_backend(responses=["một", "hai"]))
+    assert [client.chat("câu hỏi") for _ in range(3)] == ["một", "hai", "một"]
+
+
+def test_response_cache_avoids_second_backend_call():
+    backend = make_backend(responses=["kết quả"])
+    client = make_client(backend, response_cache=ResponseCache(use_disk=False))
+    assert client.analyze_financial_data(DATA, "thử") == "kết quả"
+    assert client.analyze_financial_data(DATA, "thử") == "kết quả"
+    assert client.last_from_cache
+    assert backend.calls == 1
+
+
+def test_injected_errors_are_reported_after_retries():
+    backend = make_backend(error_rate=1.0, error_codes=(503,))
+    transport = GeminiTransport(max_retries=2, failure_threshold=10, sleep=no_sleep)
+    client = make_client(backend, transport=transport)
+    result = client.analyze_financial_data(DATA, "thử", use_cache=False)
+    assert result.startswith("Lỗi khi phân tích")
+    assert backend.calls == 3
+    assert transport.get_stats()['retries'] == 2
+
+
+def test_streaming_splits_reply_into_chunks():
+    text = "Khả năng trả nợ tốt, đề xuất cho vay."
+    client = make_client(make_backend(responses=[text], chunk_size=5))
+    chunks = list(client.chat_stream("Đánh giá?"))
+    assert ''.join(chunks) == text
+    assert len(chunks) == -(-len(text) // 5)
+    assert all(len(chunk) <= 5 for chunk in chunks)
+    assert client.get_latency_stats()['ttft']['so_lan'] == 1
+
+
+def test_chat_answer_is_not_shared_between_cases():
+    backend = make_backend(responses=["trả lời hồ sơ A", "trả lời hồ sơ B"])
+    client = make_client(backend, semantic_cache=SemanticAnswerCache())
+    first, second = ChatSession(), ChatSession()
+    first.set_case_context("Khách hàng A, CCCD 001")
+    second.set_case_context("Khách hàng B, CCCD 002")
+    assert client.chat("DSR hiện tại là bao nhiêu?", first) == "trả lời hồ sơ A"
+    assert client.chat("DSR hiện tại là bao nhiêu?", second) == "trả lời hồ sơ B"
+    assert backend.calls == 2
+
+
+def test_analyze_many_runs_jobs_concurrently():
+    client = make_client(make_backend(responses=["ok"]))
+    jobs = {name: (DATA, name) for name in ("goc", "hien_tai", "tra_no")}
+    for _ in range(2):
+        result = client.analyze_many(jobs, use_cache=False)
+        assert {name: item['ket_qua'] for name, item in result['ket_qua'].items()} == dict.fromkeys(jobs, "ok")
+
+
+def test_benchmark_main_smoke(capsys):
+    benchmark.main(['--sessions', '2', '--latency', 'fixed:0', '--chunk-delay', '0', '--chat-turns', '1',
+                    '--rate', '1000', '--burst', '1000', '--seed', '1', '--json'])
+    result = json.loads(capsys.readouterr().out)
+    assert result['so_phien'] == 2
+    assert result['goi_backend'] > 0
+    assert all(item['loi'] == 0 for item in result['thao_tac'].values())
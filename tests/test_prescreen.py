@@ -0,0 +1,41 @@
+import json
+
+from src.logic.prescreen import DEFAULT_RULES, TU_CHOI, PrescreenEngine, load_rules
+
+
+def write_rules(tmp_path, data):
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps(data), encoding='utf-8')
+    return str(path)
+
+
+def test_list_override_skips_invalid_rules(tmp_path):
+    path = write_rules(tmp_path, [
+        {'ma': 'DSR', 'truong': 'dsr_ratio', 'toan_tu': '>', 'nguong': 60, 'muc': TU_CHOI},
+        {'ma': 'SAI_TOAN_TU', 'truong': 'ltv', 'toan_tu': '=>', 'nguong': 80, 'muc': TU_CHOI},
+        {'ma': 'THIEU_NGUONG', 'truong': 'ltv', 'toan_tu': '>', 'muc': TU_CHOI},
+        {'ma': 'SAI_MUC', 'truong': 'ltv', 'toan_tu': '>', 'nguong': 80, 'muc': 'rat_nang'}
+    ])
+    rules = load_rules(path)
+    assert [rule['ma'] for rule in rules] == ['DSR']
+    PrescreenEngine(rules)
+
+
+def test_list_override_without_valid_rules_falls_back_to_defaults(tmp_path):
+    path = write_rules(tmp_path, [{'ma': 'X', 'toan_tu': '!='}, "khong_phai_quy_tac"])
+    assert load_rules(path) == DEFAULT_RULES
+
+
+def test_dict_override_keeps_default_when_invalid(tmp_path):
+    path = write_rules(tmp_path, {
+        'DSR_TOI_DA': {'nguong': 'bay muoi'},
+        'LTV_TOI_DA': {'nguong': 90},
+        'THIEU_SO_TIEN_VAY': {'bat': False},
+        'MOI_SAI': {'truong': 'ltv', 'toan_tu': '>'}
+    })
+    rules = {rule['ma']: rule for rule in load_rules(path)}
+    assert rules['DSR_TOI_DA']['nguong'] == 70
+    assert rules['LTV_TOI_DA']['nguong'] == 90
+    assert rules['THIEU_SO_TIEN_VAY']['bat'] is False
+    assert 'MOI_SAI' not in rules
+    PrescreenEngine(list(rules.values()))
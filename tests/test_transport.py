@@ -0,0 +1,204 @@
+import asyncio
+import random
+
+import pytest
+
+from src.ai.fake_backend import FakeBackendError, FakeGeminiBackend
+from src.ai.transport import CircuitBreaker, CircuitOpenError, GeminiTransport, TokenBucket
+
+
+class FakeClock:
+    """Đồng hồ giả: sleep chỉ cộng thời gian, ghi lại các lần chờ"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def make_transport(clock, **kwargs):
+    options = dict(max_retries=3, base_delay=0.5, max_delay=8.0, rate=100.0, burst=100,
+                   failure_threshold=3, recovery_timeout=30.0, sleep=clock.sleep, clock=clock)
+    options.update(kwargs)
+    return GeminiTransport(**options)
+
+
+def flaky(failures, code=503, result="ok"):
+    """Hàm gọi lỗi failures lần đầu rồi thành công"""
+    state = {'calls': 0}
+
+    def call():
+        state['calls'] += 1
+        if state['calls'] <= failures:
+            raise FakeBackendError(code)
+        return result
+    call.state = state
+    return call
+
+
+def test_backoff_stays_within_full_jitter_bounds():
+    transport = make_transport(FakeClock(), base_delay=0.5, max_delay=4.0)
+    random.seed(1)
+    for attempt in range(8):
+        cap = min(4.0, 0.5 * 2 ** attempt)
+        samples = [transport.backoff(attempt) for _ in range(200)]
+        assert all(0 <= sample <= cap for sample in samples)
+        assert max(samples) > cap / 2
+
+
+def test_retries_transient_errors_then_succeeds():
+    clock = FakeClock()
+    transport = make_transport(clock)
+    call = flaky(2)
+    assert transport.call(call) == "ok"
+    assert call.state['calls'] == 3
+    assert len(clock.sleeps) == 2
+    stats = transport.get_stats()
+    assert (stats['calls'], stats['successes'], stats['errors'], stats['retries']) == (1, 1, 2, 2)
+    assert stats['circuit_state'] == CircuitBreaker.CLOSED
+
+
+def test_gives_up_after_max_retries():
+    clock = FakeClock()
+    transport = make_transport(clock, max_retries=2, failure_threshold=10)
+    call = flaky(10)
+    with pytest.raises(FakeBackendError):
+        transport.call(call)
+    assert call.state['calls'] == 3
+    assert transport.get_stats()['retries'] == 2
+
+
+def test_non_retryable_error_is_not_retried_and_keeps_circuit_closed():
+    transport = make_transport(FakeClock(), failure_threshold=1)
+    call = flaky(1, code=400)
+    with pytest.raises(FakeBackendError):
+        transport.call(call)
+    assert call.state['calls'] == 1
+    assert transport.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_token_bucket_waits_for_refill():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2.0, capacity=2, clock=clock)
+    assert bucket.acquire(sleep=clock.sleep) == 0
+    assert bucket.acquire(sleep=clock.sleep) == 0
+    assert bucket.acquire(sleep=clock.sleep) == pytest.approx(0.5)
+
+
+def test_background_view_shares_bucket_and_leaves_reserve():
+    clock = FakeClock()
+    transport = make_transport(clock, rate=1.0, burst=4)
+    background = transport.background()
+    assert background.bucket is transport.bucket
+    assert background.breaker is transport.breaker
+    assert background.metrics is transport.metrics
+
+    for _ in range(4):
+        background.call(lambda: "nen")
+    # Tác vụ nền không lấy hết quota: người dùng tương tác vẫn có lượt ngay
+    waited_before = clock.now
+    transport.call(lambda: "chat")
+    transport.call(lambda: "chat")
+    assert clock.now == waited_before
+    assert transport.get_stats()['calls'] == 6
+
+
+def test_circuit_opens_half_opens_and_closes():
+    clock = FakeClock()
+    transport = make_transport(clock, max_retries=0, failure_threshold=2, recovery_timeout=30.0)
+    for _ in range(2):
+        with pytest.raises(FakeBackendError):
+            transport.call(flaky(1))
+    assert transport.breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        transport.call(lambda: "ok")
+    assert transport.get_stats()['circuit_rejections'] == 1
+
+    clock.now += 30
+    assert transport.breaker.allow()
+    assert transport.breaker.state == CircuitBreaker.HALF_OPEN
+    # Chỉ một yêu cầu thử tại một thời điểm
+    assert not transport.breaker.allow()
+    transport.breaker.record_success()
+    assert transport.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_failed_trial_reopens_circuit():
+    clock = FakeClock()
+    transport = make_transport(clock, max_retries=0, failure_threshold=1)
+    with pytest.raises(FakeBackendError):
+        transport.call(flaky(1))
+    clock.now += 30
+    with pytest.raises(FakeBackendError):
+        transport.call(flaky(1))
+    assert transport.breaker.state == CircuitBreaker.OPEN
+
+
+def test_abandoned_stream_releases_half_open_trial():
+    clock = FakeClock()
+    transport = make_transport(clock, max_retries=0, failure_threshold=1)
+    with pytest.raises(FakeBackendError):
+        transport.call(flaky(1))
+    clock.now += 30
+
+    stream = transport.stream(lambda: iter(["a", "b", "c"]))
+    assert next(stream) == "a"
+    stream.close()
+    assert transport.call(lambda: "ok") == "ok"
+    assert transport.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_cancelled_async_trial_releases_half_open_trial():
+    clock = FakeClock()
+    transport = make_transport(clock, max_retries=0, failure_threshold=1)
+    with pytest.raises(FakeBackendError):
+        transport.call(flaky(1))
+    clock.now += 30
+
+    async def scenario():
+        task = asyncio.ensure_future(transport.call_async(asyncio.sleep, 10))
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+        async def ok():
+            return "ok"
+        return await transport.call_async(ok)
+
+    assert asyncio.run(scenario()) == "ok"
+
+
+def test_async_backoff_uses_injected_sleep():
+    clock = FakeClock()
+    transport = make_transport(clock)
+    state = {'calls': 0}
+
+    async def call():
+        state['calls'] += 1
+        if state['calls'] <= 2:
+            raise FakeBackendError(429)
+        return "ok"
+
+    assert asyncio.run(transport.call_async(call)) == "ok"
+    assert len(clock.sleeps) == 2
+
+
+def test_fake_backend_errors_drive_retries():
+    clock = FakeClock()
+    backend = FakeGeminiBackend(responses=["trả lời"], latency=0, error_rate=1.0, error_codes=(503,),
+                                seed=1, sleep=lambda seconds: None)
+    transport = make_transport(clock, max_retries=2, failure_threshold=10)
+    with pytest.raises(FakeBackendError):
+        transport.call(backend.generate_content, "câu hỏi")
+    assert backend.calls == 3
+
+    backend.error_rate = 0.0
+    assert transport.call(backend.generate_content, "câu hỏi").text == "trả lời"